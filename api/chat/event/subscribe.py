@@ -1,5 +1,8 @@
 class __api_result__(APIMethod):
+	rate_limit = (2, 50)
+
 	def run(self, group, event, params, callback):
-		Events.add_event(self.socket, self.socket.group, group, event, callback, params)
+		if not Events.add_event(self.socket, self.socket.group, group, event, callback, params):
+			return self.socket.error_response(0, 'Bad filter')
 
 		return ({}, True)
\ No newline at end of file
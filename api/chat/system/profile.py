@@ -0,0 +1,16 @@
+class __api_result__(APIMethod):
+	def run(self, key, action, group, method, unique_id):
+		if key != 'testtest123':
+			print 'Someone want to profile system with wrong key:', key
+			return self.socket.error_response(0, 'Wrong key')
+
+		if action == 'start':
+			Profiler.start(self.socket.group, group, method, unique_id)
+			return (Profiler.stats(), True)
+
+		if action == 'stop':
+			stats = Profiler.stats()
+			stats['path'] = Profiler.stop()
+			return (stats, True)
+
+		return (Profiler.stats(), True)
\ No newline at end of file
@@ -0,0 +1,7 @@
+class __api_result__(APIMethod):
+	def run(self, key):
+		if key != 'testtest123':
+			print 'Someone want to see rate limits with wrong key:', key
+			return self.socket.error_response(0, 'Wrong key')
+
+		return (RateLimits.stats(), True)
\ No newline at end of file
@@ -0,0 +1,11 @@
+class __api_result__(APIMethod):
+	def run(self, key):
+		if key != 'testtest123':
+			print 'Someone want to see thread pools with wrong key:', key
+			return self.socket.error_response(0, 'Wrong key')
+
+		pools = {}
+		for name, pool in ThreadPools.items():
+			pools[name] = pool.stats()
+
+		return ({'pools': pools}, True)
\ No newline at end of file
@@ -1,17 +1,15 @@
 class __api_result__(APIMethod):
 	def run(self, username, password):
-		try:
-			client = Clients[username]
+		Sessions.expire_user(username)
 
+		if Clients.get(username) in Connections:
 			self.socket.send_error(0, 'Only one username connection is allowed', self.callback_id)
 
 			self.socket.disconnect()
 
 			return self.socket.error_response(0, 'Access denied')
-		except Exception, e:
-			pass
 
-		Clients[username] = self
+		Clients[username] = self.socket.get_unique_id()
 
 		self.socket.authorized = True
 		self.socket.username = username
@@ -19,4 +17,4 @@ class __api_result__(APIMethod):
 
 		self.socket.user_on(self.socket)
 
-		return ({}, True)
\ No newline at end of file
+		return ({'session': Sessions.open(self.socket)}, True)
\ No newline at end of file
@@ -1,4 +1,6 @@
 class __api_result__(APIMethod):
+	rate_limit = (5, 20)
+
 	def run(self, message):
 		self.socket.chat_message(self.socket, message)
 
@@ -0,0 +1,11 @@
+class __api_result__(APIMethod):
+	def run(self, token):
+		if self.socket.authorized:
+			return self.socket.error_response(0, 'Already authorized')
+
+		token = self.socket.resume_session(token)
+
+		if token is None:
+			return self.socket.error_response(0, 'Session expired')
+
+		return ({'session': token}, True)
\ No newline at end of file
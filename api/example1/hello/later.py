@@ -0,0 +1,12 @@
+import time
+import tornado.ioloop
+from tornado import gen
+
+class __api_result__(APIMethod):
+	asynchronous = True
+
+	@gen.engine
+	def run(self, text, delay):
+		yield gen.Task(tornado.ioloop.IOLoop.instance().add_timeout, time.time() + float(delay or 0))
+
+		self.finish(({'text': text}, True))
\ No newline at end of file
@@ -0,0 +1,9 @@
+import time
+
+class __api_result__(APIMethod):
+	blocking = True
+
+	def run(self, text, delay):
+		time.sleep(float(delay or 0))
+
+		return ({'text': text}, True)
\ No newline at end of file
@@ -1,14 +1,21 @@
-from chatter import BaseSocketHandler, run_application, Clients
+from chatter import BaseSocketHandler, run_application, Clients, Connections, ENVGlobals, Events, Overload, Sessions
+import overload
+from presence import PresenceCoalescer
 from tornado.options import define
 
 class ChatSocketHandler(BaseSocketHandler):
     group = 'chat'
 
+    # user/on and user/off go out per user for clients that still use them
+    # and are dropped under overload, user/presence carries the coalesced
+    # changes, see PresenceCoalescer
     def user_on(self, user):
-        self.run_broadcast_event('user', 'on', {'user': user.username})
+        self.run_broadcast_event('user', 'on', {'user': user.username}, overload.OPTIONAL)
+        Presence.joined(user.username)
 
     def user_off(self, user):
-        self.run_broadcast_event('user', 'off', {'user': user.username})
+        self.run_broadcast_event('user', 'off', {'user': user.username}, overload.OPTIONAL)
+        Presence.left(user.username)
 
     def chat_users(self, user):
         users = Clients.keys()
@@ -18,21 +25,31 @@ class ChatSocketHandler(BaseSocketHandler):
         self.run_broadcast_event('chat', 'message', {'user': sender.username, 'message': message})
 
     def chat_private_message(self, sender, username, message):
-        try:
-            receiver = Clients[username]
-            receiver.socket.run_event('chat', 'message', {'user': sender.username, 'message': message})
-        except Exception, e:
-            pass
+        connection_id = Clients.get(username)
+        if connection_id is None:
+            return
+        receiver = Connections.get(connection_id)
+        if receiver is None:
+            # closed, but its session may still be resumed
+            receiver = Sessions.get_detached(connection_id)
+        if receiver is not None:
+            receiver.run_event('chat', 'message', {'user': sender.username, 'message': message})
 
     def on_auth(self, package, sock, params):
         if not sock.authorized:
-            if package['group'] == 'user' and package['method'] == 'auth':
+            if package['group'] == 'user' and package['method'] in ('auth', 'resume'):
                 return True
             if package['group'] == 'system':
                 return True
             return self.error_response(0, 'Access denied')
         return True
 
+def send_presence(joined, left):
+    Overload.run(overload.DEFERRABLE, Events.call_event, None, True, ChatSocketHandler.group,
+                 'user', 'presence', {'joined': joined, 'left': left})
+
+Presence = ENVGlobals['presence'] = PresenceCoalescer(send_presence)
+
 def main():
     run_application([
         (r'/chat', ChatSocketHandler),
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+#
+# Matches events against many filtered subscriptions, one per user with a
+# filter on the user field, through the EventTopic index and through a scan
+# of every subscription.
+#
+# Usage: python benchmarks/event_filter.py --subscribers=100000 --events=1000
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from tornado.options import define, options, parse_command_line
+
+from topics import EventTopic, compile_filter, matches
+
+define('subscribers', default=100000, help='filtered subscriptions on the topic', type=int)
+define('unfiltered', default=10, help='subscriptions without a filter', type=int)
+define('events', default=1000, help='events matched', type=int)
+
+class Subscription(object):
+    __slots__ = ('conditions',)
+
+    def __init__(self, conditions):
+        self.conditions = conditions
+
+def main():
+    parse_command_line()
+    subscriptions = [Subscription(compile_filter({'user': u'user%d' % i, 'kind': u'message'}))
+                     for i in xrange(options.subscribers)]
+    subscriptions += [Subscription(()) for i in xrange(options.unfiltered)]
+    topic = EventTopic()
+    for subscription in subscriptions:
+        topic.add(subscription)
+    events = [{'user': u'user%d' % (i * 7919 % options.subscribers), 'kind': u'message', 'text': u'hello'}
+              for i in xrange(options.events)]
+
+    started = time.time()
+    for params in events:
+        scanned = [s for s in subscriptions if matches(s.conditions, params)]
+    scan = time.time() - started
+
+    started = time.time()
+    for params in events:
+        indexed = topic.match(params)
+    index = time.time() - started
+
+    assert len(scanned) == len(indexed) == options.unfiltered + 1
+    print '%d subscriptions, %d matches per event: scan %.3fms, index %.4fms per event' % (
+        len(subscriptions), len(indexed), scan * 1000 / options.events, index * 1000 / options.events)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+#
+# Broadcasts an event to many subscribers while a 1ms timer measures how
+# long the IOLoop is blocked, once delivering everything in one go and once
+# through the time-sliced FanOut.
+#
+# Usage: python benchmarks/fanout.py --sockets=100000 --broadcasts=5
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import tornado.escape
+import tornado.ioloop
+from tornado.options import define, options, parse_command_line
+
+from fanout import FanOut
+
+define('sockets', default=100000, help='subscribers per broadcast', type=int)
+define('broadcasts', default=5, help='broadcasts on one topic', type=int)
+
+PARAMS = {'user': u'alice', 'message': u'hello everybody'}
+
+def deliver(event):
+    tornado.escape.json_compact_encode({'success': True, 'response': {'params': PARAMS, 'data': event}, 'id': None})
+
+def measure(label, sync_size):
+    options.fanout_sync_size = sync_size
+    io_loop = tornado.ioloop.IOLoop()
+    fanout = FanOut(io_loop)
+    targets = [{'n': i} for i in xrange(options.sockets)]
+    state = {'last': None, 'max_gap': 0.0}
+
+    def tick():
+        now = time.time()
+        if state['last'] is not None:
+            state['max_gap'] = max(state['max_gap'], now - state['last'])
+        state['last'] = now
+        if fanout.completed == options.broadcasts:
+            io_loop.stop()
+
+    def start():
+        state['started'] = time.time()
+        for i in xrange(options.broadcasts):
+            fanout.schedule(('chat', 'chat', 'message'), targets, deliver)
+
+    timer = tornado.ioloop.PeriodicCallback(tick, 1, io_loop)
+    timer.start()
+    io_loop.add_timeout(time.time() + 0.01, start)
+    io_loop.start()
+    timer.stop()
+
+    elapsed = time.time() - state['started']
+    stats = fanout.stats()
+    print '%-8s %8.0f deliveries/s  all done in %7.1fms  max loop stall %7.1fms  slices %d' % (
+        label, fanout.deliveries / elapsed, elapsed * 1000, state['max_gap'] * 1000, stats['slices'])
+
+def main():
+    parse_command_line()
+    measure('one go', sys.maxint)
+    measure('sliced', 0)
+
+if __name__ == '__main__':
+    main()
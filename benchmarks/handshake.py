@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+#
+# Measures WebSocket upgrades per second through HTTPServer, header parsing,
+# routing and WebSocketProtocol13._accept_connection, plus the cost of
+# parsing the handshake headers on their own.
+#
+# Usage: python benchmarks/handshake.py --num=5000 --concurrency=50
+
+import os
+import socket
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import tornado.httpserver
+import tornado.ioloop
+import tornado.iostream
+import tornado.web
+import tornado.websocket
+from tornado.httputil import HTTPHeaders
+from tornado.options import define, options, parse_command_line
+from tornado.util import b
+
+define('num', default=5000, help='handshakes to perform', type=int)
+define('concurrency', default=50, help='handshakes in flight', type=int)
+define('port', default=8889, help='port for the benchmark server', type=int)
+
+REQUEST = (
+    "GET /chat HTTP/1.1\r\n"
+    "Host: 127.0.0.1:%d\r\n"
+    "Upgrade: websocket\r\n"
+    "Connection: Upgrade\r\n"
+    "Origin: http://127.0.0.1\r\n"
+    "Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n"
+    "Sec-WebSocket-Version: 13\r\n"
+    "Sec-WebSocket-Protocol: msgpack, json\r\n"
+    "User-Agent: Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36\r\n"
+    "Accept-Encoding: gzip, deflate\r\n"
+    "Accept-Language: en-US,en;q=0.8\r\n"
+    "Cookie: user=\"aGVsbG8=|1350000000|0123456789abcdef\"\r\n"
+    "\r\n")
+
+class EchoSocket(tornado.websocket.WebSocketHandler):
+    def select_subprotocol(self, subprotocols):
+        return 'json'
+
+    def on_message(self, message):
+        self.write_message(message)
+
+class Client(object):
+    def __init__(self, bench):
+        self.bench = bench
+        self.request = b(REQUEST % options.port)
+
+    def start(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.stream = tornado.iostream.IOStream(sock)
+        self.stream.connect(('127.0.0.1', options.port), self.on_connect)
+
+    def on_connect(self):
+        self.stream.write(self.request)
+        self.stream.read_until(b('\r\n\r\n'), self.on_response)
+
+    def on_response(self, data):
+        assert data.startswith(b('HTTP/1.1 101')), data
+        self.stream.close()
+        self.bench.done()
+
+class Benchmark(object):
+    def __init__(self, io_loop):
+        self.io_loop = io_loop
+        self.started = 0
+        self.finished = 0
+
+    def run(self):
+        self.begin = time.time()
+        for i in xrange(min(options.concurrency, options.num)):
+            self.next()
+        self.io_loop.start()
+        return time.time() - self.begin
+
+    def next(self):
+        self.started += 1
+        Client(self).start()
+
+    def done(self):
+        self.finished += 1
+        if self.started < options.num:
+            self.next()
+        elif self.finished == options.num:
+            self.io_loop.stop()
+
+def main():
+    parse_command_line()
+
+    headers = REQUEST % options.port
+    headers = headers[headers.find('\r\n'):]
+    elapsed = min(timeit.repeat(lambda: HTTPHeaders.parse(headers), number=10000, repeat=3))
+    print 'HTTPHeaders.parse %10.0f/s' % (10000 / elapsed)
+
+    io_loop = tornado.ioloop.IOLoop.instance()
+    app = tornado.web.Application([('/chat', EchoSocket)])
+    server = tornado.httpserver.HTTPServer(app)
+    server.listen(options.port, '127.0.0.1')
+
+    elapsed = Benchmark(io_loop).run()
+    print 'upgrades          %10.0f/s (%d in %.2fs, concurrency %d)' % (
+        options.num / elapsed, options.num, elapsed, options.concurrency)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+#
+# Measures the server memory taken by idle WebSocket connections: starts
+# app_chat.py, reads its RSS, opens --num connections that complete the
+# handshake and then stay silent, and reads the RSS again.
+#
+# Usage: python benchmarks/idle_connections.py --num=10000
+
+import errno
+import os
+import select
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from tornado.options import define, options, parse_command_line
+
+define('num', default=10000, help='idle connections to open', type=int)
+define('port', default=8892, help='port for the chat server', type=int)
+define('app', default='app_chat.py', help='application script to start')
+define('path', default='/chat', help='WebSocket path to connect to')
+
+HANDSHAKE = (
+    "GET %s HTTP/1.1\r\n"
+    "Host: 127.0.0.1\r\n"
+    "Upgrade: websocket\r\n"
+    "Connection: Upgrade\r\n"
+    "Origin: http://127.0.0.1\r\n"
+    "Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n"
+    "Sec-WebSocket-Version: 13\r\n"
+    "User-Agent: Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36\r\n"
+    "\r\n")
+
+def rss_kb(pid):
+    for line in open('/proc/%d/status' % pid):
+        if line.startswith('VmRSS:'):
+            return int(line.split()[1])
+
+def open_connections(num):
+    request = HANDSHAKE % options.path
+    socks = []
+    pending = {}
+    poll = select.epoll()
+    while len(socks) < num or pending:
+        # keep a few hundred handshakes in flight
+        while len(socks) < num and len(pending) < 200:
+            sock = socket.create_connection(('127.0.0.1', options.port))
+            sock.sendall(request)
+            sock.setblocking(False)
+            socks.append(sock)
+            pending[sock.fileno()] = [sock, '']
+            poll.register(sock.fileno(), select.EPOLLIN)
+        for fd, events in poll.poll(0.01):
+            sock, data = pending[fd]
+            try:
+                data += sock.recv(4096)
+            except socket.error, e:
+                if e.args[0] != errno.EAGAIN:
+                    raise
+            if '\r\n\r\n' in data:
+                assert data.startswith('HTTP/1.1 101'), data
+                poll.unregister(fd)
+                del pending[fd]
+            else:
+                pending[fd][1] = data
+    poll.close()
+    return socks
+
+def main():
+    parse_command_line()
+    # the burst of handshakes must not be mistaken for overload
+    server = subprocess.Popen([sys.executable, options.app, '--port=%d' % options.port,
+                               '--logging=none', '--overload_max_lag=1000'],
+                              cwd=ROOT, stdout=open(os.devnull, 'w'))
+    try:
+        time.sleep(1.0)
+        # one connection first, so one-off setup is not counted
+        first = open_connections(1)
+        time.sleep(0.5)
+        before = rss_kb(server.pid)
+
+        started = time.time()
+        socks = open_connections(options.num)
+        elapsed = time.time() - started
+        time.sleep(1.0)
+        after = rss_kb(server.pid)
+
+        print '%d connections in %.1fs, RSS %d -> %d KB: %.1f KB per connection, %.1f MB per 10k' % (
+            options.num, elapsed, before, after, (after - before) / float(options.num),
+            (after - before) * 10000.0 / options.num / 1024)
+    finally:
+        server.terminate()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+#
+# Compares IOStream read settings on a small-message workload (many short
+# read_until calls, like chat traffic) and a bulk workload (large
+# read_bytes, like big frames or uploads) over a loopback connection.
+#
+# Usage: python benchmarks/iostream_read.py --messages=50000 --bulk_mb=64
+
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from tornado import netutil
+from tornado.ioloop import IOLoop
+from tornado.iostream import IOStream
+from tornado.options import define, options, parse_command_line
+from tornado.util import b
+
+define('messages', default=50000, help='messages in the small-message run', type=int)
+define('message_size', default=100, help='bytes per small message', type=int)
+define('bulk_mb', default=64, help='megabytes in the bulk run', type=int)
+define('bulk_read', default=1024 * 1024, help='bytes per read_bytes in the bulk run', type=int)
+
+# (label, IOStream arguments, read_bytes arguments)
+CONFIGS = [
+    ('fixed 4k', dict(max_read_chunk_size=4096), dict()),
+    ('adaptive', dict(), dict()),
+    ('adaptive+recv_into', dict(use_recv_into=True), dict()),
+    ('recv_into, no copy', dict(use_recv_into=True), dict(copy=False)),
+]
+
+def make_pair(io_loop, **kwargs):
+    [listener] = netutil.bind_sockets(0, '127.0.0.1', family=socket.AF_INET)
+    port = listener.getsockname()[1]
+    client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    client.connect(('127.0.0.1', port))
+    connection, address = listener.accept()
+    listener.close()
+    return (IOStream(connection, io_loop=io_loop, **kwargs),
+            IOStream(client, io_loop=io_loop))
+
+def run_small(io_loop, server, client, **read_kwargs):
+    message = b('x') * (options.message_size - 2) + b('\r\n')
+    state = dict(left=options.messages)
+
+    def on_message(data):
+        state['left'] -= 1
+        if state['left']:
+            server.read_until(b('\r\n'), on_message)
+        else:
+            io_loop.stop()
+
+    def write_batch():
+        for i in xrange(1000):
+            client.write(message)
+        if not state['done']:
+            state['sent'] += 1000
+            state['done'] = state['sent'] >= options.messages
+            io_loop.add_callback(write_batch)
+
+    state['sent'] = 0
+    state['done'] = False
+    server.read_until(b('\r\n'), on_message)
+    write_batch()
+    started = time.time()
+    io_loop.start()
+    return options.messages / (time.time() - started), 'msg/s'
+
+def run_bulk(io_loop, server, client, **read_kwargs):
+    total = options.bulk_mb * 1024 * 1024
+    chunk = b('x') * options.bulk_read
+    state = dict(left=total // options.bulk_read)
+
+    def on_chunk(data):
+        state['left'] -= 1
+        if state['left']:
+            client.write(chunk)
+            server.read_bytes(options.bulk_read, on_chunk, **read_kwargs)
+        else:
+            io_loop.stop()
+
+    client.write(chunk)
+    server.read_bytes(options.bulk_read, on_chunk, **read_kwargs)
+    started = time.time()
+    io_loop.start()
+    return total / (time.time() - started) / 1024 / 1024, 'MB/s'
+
+def main():
+    parse_command_line()
+    io_loop = IOLoop.instance()
+    for label, kwargs, read_kwargs in CONFIGS:
+        results = []
+        for workload in (run_small, run_bulk):
+            server, client = make_pair(io_loop, **kwargs)
+            rate, unit = workload(io_loop, server, client, **read_kwargs)
+            results.append('%10.0f %s' % (rate, unit))
+            server.close()
+            client.close()
+        print '%-20s %s' % (label, '  '.join(results))
+
+if __name__ == '__main__':
+    main()
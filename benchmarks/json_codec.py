@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+#
+# Compares the JSON backends available to tornado.escape on a typical
+# chatter envelope.
+#
+# Usage: python benchmarks/json_codec.py --num=100000
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import tornado.escape
+from tornado.options import define, options, parse_command_line
+
+define('num', default=100000, help='iterations per measurement', type=int)
+
+PACKAGE = {
+    'success': True,
+    'response': {
+        'params': {'user': u'alice', 'message': u'\u043f\u0440\u0438\u0432\u0435\u0442, how are you?'},
+        'data': {}
+    },
+    'id': 17
+}
+
+def measure(name):
+    try:
+        tornado.escape.set_json_backend(name)
+    except ImportError:
+        print '%-12s not available' % name
+        return
+
+    encoded = tornado.escape.json_compact_encode(PACKAGE)
+    results = []
+    for label, func in (
+            ('json_encode', lambda: tornado.escape.json_encode(PACKAGE)),
+            ('compact', lambda: tornado.escape.json_compact_encode(PACKAGE)),
+            ('json_decode', lambda: tornado.escape.json_decode(encoded))):
+        elapsed = min(timeit.repeat(func, number=options.num, repeat=3))
+        results.append('%s %8.0f/s' % (label, options.num / elapsed))
+
+    print '%-12s %s' % (name, '  '.join(results))
+
+def main():
+    parse_command_line()
+    for name in tornado.escape._JSON_BACKENDS:
+        measure(name)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+#
+# Measures round trip latency of well-behaved WebSocket clients while a few
+# other clients flood the server with frames, with and without the
+# per-connection message budget.  The server runs in this process, the
+# clients in child processes with plain blocking sockets.
+#
+# Usage: python benchmarks/websocket_fairness.py --flooders=4 --duration=3
+
+import multiprocessing
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import tornado.httpserver
+import tornado.ioloop
+import tornado.web
+import tornado.websocket
+from tornado.options import define, options, parse_command_line
+from tornado.util import b
+
+define('flooders', default=4, help='clients sending frames as fast as they can', type=int)
+define('duration', default=3.0, help='seconds of round trips measured per run', type=float)
+define('port', default=8891, help='port for the benchmark server', type=int)
+
+HANDSHAKE = (
+    "GET /ws HTTP/1.1\r\n"
+    "Host: 127.0.0.1\r\n"
+    "Upgrade: websocket\r\n"
+    "Connection: Upgrade\r\n"
+    "Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n"
+    "Sec-WebSocket-Version: 13\r\n"
+    "\r\n")
+
+# an all zero mask leaves the payload as it is
+def masked_frame(payload):
+    return struct.pack('BB', 0x81, 0x80 | len(payload)) + b('\x00\x00\x00\x00') + payload
+
+class EchoSocket(tornado.websocket.WebSocketHandler):
+    def on_message(self, message):
+        self.write_message(message)
+
+def connect():
+    sock = socket.create_connection(('127.0.0.1', options.port))
+    sock.sendall(b(HANDSHAKE))
+    response = b('')
+    while b('\r\n\r\n') not in response:
+        response += sock.recv(4096)
+    return sock
+
+def recv_exactly(sock, size):
+    data = b('')
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise EOFError()
+        data += chunk
+    return data
+
+def flood():
+    sock = connect()
+
+    def discard():
+        try:
+            while sock.recv(65536):
+                pass
+        except socket.error:
+            pass
+    thread = threading.Thread(target=discard)
+    thread.daemon = True
+    thread.start()
+
+    batch = masked_frame(b('flood')) * 1000
+    try:
+        while True:
+            sock.sendall(batch)
+    except socket.error:
+        pass
+
+def ping(results):
+    sock = connect()
+    frame = masked_frame(b('ping'))
+    latencies = []
+    deadline = time.time() + options.duration
+    while time.time() < deadline:
+        started = time.time()
+        sock.sendall(frame)
+        recv_exactly(sock, 6)
+        latencies.append(time.time() - started)
+    sock.close()
+    latencies.sort()
+    results.put((len(latencies), latencies[len(latencies) // 2],
+                 latencies[len(latencies) * 99 // 100], latencies[-1]))
+
+def measure(budget):
+    io_loop = tornado.ioloop.IOLoop()
+    app = tornado.web.Application([('/ws', EchoSocket)], websocket_message_budget=budget)
+    server = tornado.httpserver.HTTPServer(app, io_loop=io_loop)
+    server.listen(options.port, '127.0.0.1')
+
+    flooders = [multiprocessing.Process(target=flood) for i in xrange(options.flooders)]
+    for p in flooders:
+        p.start()
+    results = multiprocessing.Queue()
+    pinger = multiprocessing.Process(target=ping, args=(results,))
+
+    def check():
+        if pinger.is_alive():
+            io_loop.add_timeout(time.time() + 0.05, check)
+        else:
+            io_loop.stop()
+
+    io_loop.add_timeout(time.time() + 0.5, pinger.start)
+    io_loop.add_timeout(time.time() + 0.6, check)
+    io_loop.start()
+
+    for p in flooders:
+        p.terminate()
+    server.stop()
+    count, median, p99, worst = results.get()
+    print 'budget %-4d %6d round trips  p50 %7.2fms  p99 %7.2fms  max %7.2fms' % (
+        budget, count, median * 1000, p99 * 1000, worst * 1000)
+
+def main():
+    parse_command_line()
+    measure(0)
+    measure(32)
+
+if __name__ == '__main__':
+    main()
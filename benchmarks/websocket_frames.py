@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+#
+# Measures how many client frames per second WebSocketProtocol13 can
+# parse and hand to on_message.  Frames are generated up front and
+# written in large batches, so the numbers are dominated by the server's
+# frame parsing rather than by the client.
+#
+# Usage: python benchmarks/websocket_frames.py --num=100000 --size=100
+
+import os
+import socket
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import tornado.httpserver
+import tornado.ioloop
+import tornado.iostream
+import tornado.web
+import tornado.websocket
+from tornado.options import define, options, parse_command_line
+from tornado.util import b
+
+define('num', default=100000, help='frames to send', type=int)
+define('size', default=100, help='payload bytes per frame', type=int)
+define('batch', default=1000, help='frames per write', type=int)
+define('port', default=8890, help='port for the benchmark server', type=int)
+
+HANDSHAKE = (
+    "GET /ws HTTP/1.1\r\n"
+    "Host: 127.0.0.1\r\n"
+    "Upgrade: websocket\r\n"
+    "Connection: Upgrade\r\n"
+    "Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n"
+    "Sec-WebSocket-Version: 13\r\n"
+    "\r\n")
+
+MASK = b('\x12\x34\x56\x78')
+
+def masked_frame(payload):
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('BB', 0x81, 0x80 | length)
+    elif length <= 0xffff:
+        header = struct.pack('!BBH', 0x81, 0x80 | 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x81, 0x80 | 127, length)
+    key = (MASK * (length // 4 + 1))[:length]
+    masked = b('').join(chr(ord(x) ^ ord(y)) for x, y in zip(payload, key))
+    return header + MASK + masked
+
+class CountingSocket(tornado.websocket.WebSocketHandler):
+    received = 0
+
+    def on_message(self, message):
+        CountingSocket.received += 1
+        if CountingSocket.received == options.num:
+            tornado.ioloop.IOLoop.instance().stop()
+
+def main():
+    parse_command_line()
+    io_loop = tornado.ioloop.IOLoop.instance()
+    app = tornado.web.Application([('/ws', CountingSocket)])
+    server = tornado.httpserver.HTTPServer(app)
+    server.listen(options.port, '127.0.0.1')
+
+    batch = masked_frame(b('x') * options.size) * options.batch
+    stream = tornado.iostream.IOStream(socket.socket())
+    state = dict(sent=0)
+
+    def send_batch():
+        state['sent'] += options.batch
+        if state['sent'] < options.num:
+            stream.write(batch, send_batch)
+        else:
+            stream.write(batch)
+
+    def on_response(data):
+        assert data.startswith(b('HTTP/1.1 101')), data
+        state['started'] = time.time()
+        send_batch()
+
+    def on_connect():
+        stream.write(b(HANDSHAKE))
+        stream.read_until(b('\r\n\r\n'), on_response)
+
+    stream.connect(('127.0.0.1', options.port), on_connect)
+    io_loop.start()
+    elapsed = time.time() - state['started']
+    print '%d frames of %d bytes in %.2fs: %.0f frames/s' % (
+        options.num, options.size, elapsed, options.num / elapsed)
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,38 @@
+import collections
+import functools
+import time
+
 import tornado.escape
+import tornado.httpserver
 import tornado.ioloop
 import tornado.options
 from tornado.options import define, options
+from tornado.stack_context import ExceptionStackContext
 import tornado.web
 import tornado.websocket
 
 from utils import *
+from connections import ConnectionTable
+from fanout import FanOut
+from overload import OverloadController
+import overload
+from profiler import SamplingProfiler
+from ratelimit import RateLimiter
+from sessions import SessionStore
+from threadpool import ThreadPool
+from topics import EventTopic, compile_filter, matches
+import packer
 
 define('port', default=8888, help='run on the given port', type=int)
+define('listen_backlog', default=128, help='pending connections the kernel queues before accept', type=int)
+define('max_accepts', default=128, help='connections accepted per IOLoop iteration', type=int)
+define('max_concurrent_requests', default=16, help='requests executed at once per connection', type=int)
+define('max_queued_requests', default=256, help='requests waiting for a free slot per connection', type=int)
+define('max_batch_size', default=100, help='calls allowed in one batch package', type=int)
+define('call_timeout', default=60.0, help='seconds an asynchronous or blocking call may take before it is answered with an error and its slot is freed, 0 for no limit', type=float)
+define('thread_pool_size', default=4, help='threads in the shared pool for blocking API methods', type=int)
+define('thread_pool_queue', default=1000, help='blocking calls allowed to wait for a thread, per pool', type=int)
+define('json_backend', default='', help='json backend: ujson, simplejson, json or fastest (default: json)')
 
 def emptyMethod():
     pass
@@ -23,13 +48,34 @@ class Application(tornado.web.Application):
         )
         tornado.web.Application.__init__(self, handlers, **settings)
 
+# One per subscription, so kept small. The connection is referenced by id,
+# see ConnectionTable, and `conditions` is the compiled filter, see
+# EventTopic.
+class EventSubscription(object):
+    __slots__ = ('connection_id', 'topic', 'conditions', 'params', 'callback_method')
+
+    def __init__(self, connection_id, topic, conditions, params, callback_method):
+        self.connection_id = connection_id
+        self.topic = topic
+        self.conditions = conditions
+        self.params = params
+        self.callback_method = callback_method
+
 class APIEvents:
     def __init__(self):
         self.events = {}
         self.caller_events = {}
-        pass
+        self.fanout = FanOut()
 
+    # A 'filter' dict in the subscription params, e.g. {'filter': {'room': 5}},
+    # limits it to the events whose params have these values. Returns False
+    # for a filter that is not a dict of scalars.
     def add_event(self, caller, system_group, group, method, callback_method, params):
+        try:
+            conditions = compile_filter(params.get('filter') if isinstance(params, dict) else None)
+        except ValueError:
+            return False
+
         try:
             g = self.events[system_group]
         except Exception, e:
@@ -43,57 +89,95 @@ class APIEvents:
         try:
             g = self.events[system_group][group][method]
         except Exception, e:
-            self.events[system_group][group][method] = []
+            self.events[system_group][group][method] = EventTopic()
 
         try:
             g = self.caller_events[caller.get_unique_id()]
         except Exception, e:
             self.caller_events[caller.get_unique_id()] = []
 
-        event = {
-            'socket': caller,
-            'params': params,
-            'callback_method': callback_method
-        }
+        topic = self.events[system_group][group][method]
+        event = EventSubscription(caller.get_unique_id(), topic, conditions, params, callback_method)
 
         self.caller_events[caller.get_unique_id()].append(event)
 
-        self.events[system_group][group][method].append(event)
+        topic.add(event)
+        return True
 
     def call_event(self, caller, is_broadcast, system_group, group, method, params):
         try:
-            events_list = self.events[system_group][group][method]
-
-            for event in events_list:
-                socket = event['socket']
-                if not is_broadcast:
-                    if socket != caller:
-                        continue
-                # try:
-                #     caller_events = self.caller_events[caller.get_unique_id()]
-                #     print 'Client ', caller.get_unique_id(), ' events:'
-                #     print caller_events
-                # except:
-                #     continue
-                socket.call_event(caller, is_broadcast, group, method, params, event)
-
-            return True
+            topic = self.events[system_group][group][method]
         except Exception, e:
             return False
 
+        if is_broadcast:
+            events_list = topic.match(params)
+        else:
+            # only the caller's own subscriptions
+            events_list = [event for event in self.caller_events.get(caller.get_unique_id(), ())
+                           if event.topic is topic and matches(event.conditions, params)]
+
+        def deliver(event):
+            socket = Connections.get(event.connection_id)
+            if socket is None:
+                # closed, but its session may still be resumed
+                socket = Sessions.get_detached(event.connection_id)
+            if socket is not None:
+                socket.call_event(caller, is_broadcast, group, method, params, event)
+
+        # big broadcasts are delivered in slices, see FanOut
+        self.fanout.schedule((system_group, group, method), events_list, deliver)
+        return True
+
     def remove_caller_events(self, caller):
-        pass
-        #print 'Client ', caller.get_unique_id(), ' removed:'
-        #del self.caller_events[caller.get_unique_id()]
+        try:
+            events = self.caller_events.pop(caller.get_unique_id())
+        except KeyError:
+            return
+
+        for event in events:
+            event.topic.remove(event)
+
+    def move_caller_events(self, old_id, new_id):
+        events = self.caller_events.pop(old_id, None)
+        if not events:
+            return
+
+        for event in events:
+            event.connection_id = new_id
+        self.caller_events.setdefault(new_id, []).extend(events)
 
 class APIMethod:
-    def __init__(self, _socket, _callback_id):
+    # Asynchronous methods don't return their result from run(), they pass
+    # it to self.finish() later (e.g. from a callback or a gen.engine
+    # coroutine) and the connection keeps serving other requests meanwhile.
+    asynchronous = False
+    # Blocking methods (database queries, file reads, heavy computations)
+    # run on a thread pool and their result is sent when ready. They must
+    # not touch the socket or other IOLoop state from run(). Methods with a
+    # pool_size get their own pool, the others share one of
+    # --thread_pool_size threads.
+    blocking = False
+    pool_size = None
+    # (rate, burst): requests per second each connection may make to this
+    # method, on top of the --connection_rate and --user_rate limits
+    rate_limit = None
+    # seconds an asynchronous or blocking call may take, --call_timeout if
+    # None. A call that hasn't finished by then gets a 'Timeout' error and
+    # gives its slot back; whatever it finishes with later is dropped.
+    timeout = None
+
+    def __init__(self, _socket, _callback_id, _name=None):
         self.socket = _socket
         self.callback_id = _callback_id
+        self.name = _name
+        self.callback = None
+        self.deadline = None
 
-    def execute(self, params):
+    def execute(self, params, callback=None):
         func = self.run
-        r = inspect.getargspec(func)
+        # look through decorators such as gen.engine
+        r = inspect.getargspec(getattr(func, '__wrapped__', func))
 
         args = []
         i = 0
@@ -107,16 +191,130 @@ class APIMethod:
                 val = None
             args.append(val)
 
-        return func(*args)
+        if callback is None:
+            return func(*args)
+
+        if self.blocking:
+            self.callback = callback
+            if self.pool_size:
+                pool = get_thread_pool(self.name, self.pool_size)
+            else:
+                pool = get_thread_pool('default')
+            if not pool.submit(func, args, self.finish_blocking):
+                self.finish(self.socket.error_response(0, 'Server is busy'))
+            else:
+                self.start_deadline()
+            return None
+
+        if not self.asynchronous:
+            callback(func(*args))
+            return None
+
+        self.callback = callback
+        self.start_deadline()
+        with ExceptionStackContext(self.handle_exception):
+            func(*args)
+        return None
+
+    def start_deadline(self):
+        timeout = options.call_timeout if self.timeout is None else self.timeout
+        if timeout > 0 and self.callback is not None:
+            self.deadline = tornado.ioloop.IOLoop.instance().add_timeout(time.time() + timeout, self.expire)
+
+    def expire(self):
+        self.deadline = None
+        self.finish(self.socket.error_response(0, 'Timeout'))
+
+    def finish(self, result):
+        if self.deadline is not None:
+            tornado.ioloop.IOLoop.instance().remove_timeout(self.deadline)
+            self.deadline = None
+        callback, self.callback = self.callback, None
+        if callback is not None:
+            callback(result)
+
+    def finish_blocking(self, result, exc_info):
+        if exc_info is not None:
+            print ''.join(traceback.format_exception(*exc_info))
+            result = self.socket.error_response(0, 'Exception')
+        self.finish(result)
+
+    def handle_exception(self, typ, value, tb):
+        print ''.join(traceback.format_exception(typ, value, tb))
+        self.finish(self.socket.error_response(0, 'Exception'))
+        return True
 
     def run(self):
         pass
 
+# A batch is a list of packages sent in one frame, either as is or as
+# {'batch': [...], 'stop_on_error': true}. Its calls run one after the other
+# and their replies are sent back as one list, in the same order. With
+# stop_on_error the calls after a failed one are not run and get an error.
+class Batch:
+    def __init__(self, socket, packages, stop_on_error):
+        self.socket = socket
+        self.packages = packages
+        self.stop_on_error = stop_on_error
+        self.replies = []
+        self.failed = False
+        self.waiting = False
+
+    def run(self):
+        socket = self.socket
+        while len(self.replies) < len(self.packages):
+            if not socket.online and socket.session is None:
+                # the rest would run for nobody
+                return
+            package = self.packages[len(self.replies)]
+            try:
+                idx = package['id']
+            except Exception, e:
+                idx = None
+
+            if self.stop_on_error and self.failed:
+                self.add(idx, socket.error_response(0, 'Skipped'))
+                continue
+
+            if not socket.check_rate_limit(package):
+                self.add(idx, socket.error_response(0, 'Rate limit exceeded'))
+                continue
+
+            count = len(self.replies)
+            result = socket.parse_package(package, functools.partial(self.finish_call, idx))
+            if result is not None:
+                self.add(idx, result)
+            elif len(self.replies) == count:
+                # an asynchronous call, finish_call goes on with the batch
+                self.waiting = True
+                return
+
+        socket.finish_batch(self.replies)
+
+    def finish_call(self, idx, result):
+        self.add(idx, result)
+        if self.waiting:
+            self.waiting = False
+            self.run()
+
+    def add(self, idx, result):
+        if result is None:
+            result = self.socket.error_response(0, 'Exception')
+        response, success = result
+        if not success:
+            self.failed = True
+        self.replies.append(self.socket.build_package(response, success, idx))
+
 class BaseSocketHandler(tornado.websocket.WebSocketHandler):
-    waiters = set()
+    # loaded once and shared by all connections, see loadAPIStruct
+    APIStruct = None
     cache = []
     cache_size = 200
     group = 'none'
+    protocol = 'json'
+    protocols = ('msgpack', 'json')
+    # see SessionStore
+    session = None
 
     def __init__(self, *args, **kwargs):
         super(BaseSocketHandler, self).__init__(*args, **kwargs)
@@ -125,45 +323,86 @@ class BaseSocketHandler(tornado.websocket.WebSocketHandler):
         # for iOS 5.0 Safari
         return True
 
+    def accept_upgrade(self):
+        return Overload.accept_upgrade()
+
+    def select_subprotocol(self, subprotocols):
+        for protocol in self.protocols:
+            if protocol == 'msgpack' and isinstance(self.ws_connection, tornado.websocket.WebSocketProtocol76):
+                # draft76 has no binary frames
+                continue
+            if protocol in subprotocols:
+                self.protocol = protocol
+                return protocol
+        return None
+
     def open(self):
+        # Per connection state is kept small, idle connections are the
+        # common case. The queue and per method buckets are created when
+        # first needed.
         self.online = True
+        self.running = 0
+        self.queued = None
+        self.draining = False
         self.authorized = False
         self.username = ''
         self.password = ''
-        self.ws = None
-        self.events = {}
-        self.APIStruct = {}
-        self.loadAPIStruct()
-        self.request_info = req = self.request
-        self.ip = ip = req.remote_ip
-
-        try:
-            self.agent = agent = req.headers['User-Agent']
-        except Exception, e:
-            self.agent = agent = 'Unknown'
-
-        try:
-            self.websocket_key = wskey = req.headers['Sec-Websocket-Key']
-        except Exception, e:
-            #@TODO: random
-            self.websocket_key = wskey = 'None'
-
-        self.unique_id = md5(ip + agent + wskey)
-
-        BaseSocketHandler.waiters.add(self)
+        self.rate_bucket = RateLimits.connection_bucket()
+        self.method_buckets = None
+        if BaseSocketHandler.APIStruct is None:
+            self.loadAPIStruct()
+        self.ip = self.request.remote_ip
+        self.unique_id = Connections.add(self)
 
         #print repr(self.request)
         #HTTPRequest(protocol='http', host='vidog.vsemayki.local:8888', method='GET', uri='/call_center', version='HTTP/1.1', remote_ip='127.0.0.1', body='', headers={'Origin': 'http://callcenter.dev', 'Upgrade': 'websocket', 'Sec-Websocket-Extensions': 'x-webkit-deflate-frame', 'Sec-Websocket-Version': '13', 'Connection': 'Upgrade', 'Sec-Websocket-Key': 'wWvkhEuyFQlibcfshB9f1A==', 'Host': 'vidog.vsemayki.local:8888', 'Pragma': 'no-cache', 'Cache-Control': 'no-cache'})
         #HTTPRequest(protocol='http', host='vidog.vsemayki.local:8888', method='GET', uri='/call_center', version='HTTP/1.1', remote_ip='10.5.3.215', body='', headers={'Origin': 'http://callcenter.dev', 'Upgrade': 'websocket', 'Sec-Websocket-Extensions': 'x-webkit-deflate-frame', 'Sec-Websocket-Version': '13', 'Connection': 'Upgrade', 'Sec-Websocket-Key': 'OjPjUI6eKitMpoDUGPZDqw==', 'User-Agent': 'Mozilla/5.0 (Windows NT 6.1; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/27.0.1453.116 Safari/537.36', 'Host': 'vidog.vsemayki.local:8888', 'Pragma': 'no-cache', 'Cache-Control': 'no-cache'})
 
+        # nothing looks at the upgrade request any more
+        self.release_request()
+
         self.onConnect()
 
     def on_close(self):
         self.online = False
+        # requests still running finish into the void, see finish_package
+        self.running = 0
+        self.queued = None
+
+        Connections.remove(self.unique_id)
 
+        # a session keeps the user and subscriptions around for a while
+        if not Sessions.detach(self):
+            self.release_connection()
+
+    def release_connection(self):
         self.onDisconnect()
 
-        BaseSocketHandler.waiters.remove(self)
+        Events.remove_caller_events(self)
+
+    def resume_session(self, token):
+        # returns the new token, or None if there is no such session
+        session = Sessions.resume(token)
+        if session is None:
+            return None
+
+        old = session.socket
+        if old.online:
+            # the client is back before its old connection was noticed to be gone
+            old.authorized = False
+            old.disconnect()
+
+        self.authorized = True
+        self.username = old.username
+        self.password = old.password
+        Clients[self.username] = self.unique_id
+        Events.move_caller_events(old.unique_id, self.unique_id)
+
+        token = Sessions.attach(session, self)
+        # the events missed in between go out before the reply
+        for package in Sessions.take_replay(session):
+            self.send_reply(package)
+        return token
 
     @classmethod
     def update_cache(cls, chat):
@@ -198,14 +437,14 @@ class BaseSocketHandler(tornado.websocket.WebSocketHandler):
     #             logging.error('Error sending message', exc_info=True)
 
     def call_event(self, caller, is_broadcast, group, method, params, event):
-        data = event['params']
-        socket = event['socket']
-        callback = event['callback_method']
+        data = event.params
+        callback = event.callback_method
 
         self.send_package({'params': params, 'data': data}, True, callback)
 
-    def run_broadcast_event(self, group, event, params):
-        Events.call_event(self, True, self.group, group, event, params)
+    def run_broadcast_event(self, group, event, params, priority=overload.NORMAL):
+        # less important broadcasts may be deferred or dropped under overload
+        Overload.run(priority, Events.call_event, self, True, self.group, group, event, params)
 
     def run_event(self, group, event, params):
         Events.call_event(self, False, self.group, group, event, params)
@@ -241,7 +480,13 @@ class BaseSocketHandler(tornado.websocket.WebSocketHandler):
                                     'APIMethod': APIMethod,
                                     'Events': Events,
                                     'Clients': Clients,
+                                    'Connections': Connections,
                                     'ENVGlobals': ENVGlobals,
+                                    'Overload': Overload,
+                                    'Profiler': Profiler,
+                                    'RateLimits': RateLimits,
+                                    'Sessions': Sessions,
+                                    'ThreadPools': ThreadPools,
                                     'md5': md5,
                                     'sha1': sha1
                                 }
@@ -266,7 +511,8 @@ class BaseSocketHandler(tornado.websocket.WebSocketHandler):
 
         gc.collect()
 
-        self.APIStruct = struct
+        # shared by all connections, system/update reloads it for everybody
+        BaseSocketHandler.APIStruct = struct
 
     def send_error(self, code, message, idx=None):
         response, success = self.error_response(code, message)
@@ -278,10 +524,14 @@ class BaseSocketHandler(tornado.websocket.WebSocketHandler):
     def on_auth(self, package, sock, params):
         return True
 
-    def call_command(self, system_group, group, method, params, idx=None):
-        return self.APIStruct['system_groups'][system_group]['groups'][group]['methods'][method + '.py']['method'](self, idx).execute(params)
+    def call_command(self, system_group, group, method, params, idx=None, callback=None):
+        name = '%s/%s/%s' % (system_group, group, method)
+        api_method = self.APIStruct['system_groups'][system_group]['groups'][group]['methods'][method + '.py']['method'](self, idx, name)
+        return Profiler.run(self, system_group, group, method, api_method.execute, params, callback)
 
-    def parse_package(self, package):
+    # With a callback the method's result is passed to it and None is
+    # returned, unless the package is rejected before the method runs.
+    def parse_package(self, package, callback=None):
         try:
             group = package['group']
             method = package['method']
@@ -303,7 +553,7 @@ class BaseSocketHandler(tornado.websocket.WebSocketHandler):
                     return self.error_response(0, 'Access denied')
                 return check
 
-            result = self.call_command(self.group, group, method, params, idx)
+            result = self.call_command(self.group, group, method, params, idx, callback)
 
             gc.collect()
 
@@ -313,12 +563,19 @@ class BaseSocketHandler(tornado.websocket.WebSocketHandler):
             return self.error_response(0, 'Exception')
 
     def send_package(self, response, success, idx):
-        self.send_data( self.build_package(response, success, idx) )
+        self.send_reply(self.build_package(response, success, idx))
+
+    def send_reply(self, package):
+        # a package, or the list of a batch's replies
+        if not self.online and self.session is not None:
+            self.session.buffer(package)
+            return
+        self.send_data( self.encode_package(package) )
 
     def send_data(self, data):
         if self.online:
             try:
-                self.write_message( data )
+                self.write_message( data, binary=self.protocol == 'msgpack' )
             except Exception, e:
                 #pass
                 print e
@@ -327,26 +584,136 @@ class BaseSocketHandler(tornado.websocket.WebSocketHandler):
     def build_package(self, response, success, idx):
         return {'success': success, 'response': response, 'id': idx}
 
+    def encode_package(self, package):
+        if self.protocol == 'msgpack':
+            return packer.pack(package)
+        return tornado.escape.json_compact_encode(package)
+
+    def decode_package(self, message):
+        # text frames always carry JSON, binary frames carry msgpack
+        if isinstance(message, unicode):
+            return tornado.escape.json_decode(message)
+        return packer.unpack(message)
+
     def on_message(self, message):
         try:
-            package = tornado.escape.json_decode(message)
-            response, success = self.parse_package(package)
-            idx = package['id']
+            package = self.decode_package(message)
+            if isinstance(package, list):
+                package = {'batch': package}
+            # a single call may have a null id, so it can't mark a batch
+            is_batch = 'batch' in package
+            if is_batch:
+                idx = None
+                batch = package['batch']
+                if not isinstance(batch, list):
+                    raise ValueError('batch is not a list')
+            else:
+                idx = package['id']
         except Exception, e:
             print traceback.format_exc()
-            response, success = self.error_response(0, 'Exception')
-            idx = None
+            self.send_error(0, 'Exception')
+            return
+
+        if is_batch:
+            # the calls of a batch are checked one by one when they run
+            if len(batch) > options.max_batch_size:
+                self.send_error(0, 'Batch too large')
+                return
+        elif not self.check_rate_limit(package):
+            self.send_error(0, 'Rate limit exceeded', idx)
+            return
+
+        if self.queued or self.running >= options.max_concurrent_requests:
+            if self.queued is None:
+                self.queued = collections.deque()
+            if len(self.queued) >= options.max_queued_requests:
+                self.send_error(0, 'Too many requests', idx)
+            else:
+                self.queued.append(package)
+            return
 
+        self.dispatch_package(package)
+
+    def check_rate_limit(self, package):
+        try:
+            group = package['group']
+            method = package['method']
+            api_method = self.APIStruct['system_groups'][self.group]['groups'][group]['methods'][method + '.py']['method']
+        except Exception, e:
+            # parse_package reports bad packages and unknown methods
+            group = method = api_method = None
+        return RateLimits.check(self, group, method, api_method)
+
+    def dispatch_package(self, package):
+        self.running += 1
+
+        if 'batch' in package:
+            Batch(self, package['batch'], bool(package.get('stop_on_error'))).run()
+            return
+
+        idx = package['id']
+
+        result = self.parse_package(package, functools.partial(self.finish_package, idx))
+        if result is not None:
+            self.finish_package(idx, result)
+
+    def finish_package(self, idx, result):
+        if self.online:
+            self.running -= 1
+
+        if result is None:
+            result = self.error_response(0, 'Exception')
+        response, success = result
         self.send_package( response, success, idx )
 
         gc.collect()
 
+        if not self.draining:
+            self.drain_queue()
+
+    def finish_batch(self, replies):
+        if self.online:
+            self.running -= 1
+
+        self.send_reply(replies)
+
+        if not self.draining:
+            self.drain_queue()
+
+    def drain_queue(self):
+        self.draining = True
+        try:
+            while self.queued and self.running < options.max_concurrent_requests:
+                self.dispatch_package(self.queued.popleft())
+        finally:
+            self.draining = False
+
+def get_thread_pool(name, size=None):
+    try:
+        return ThreadPools[name]
+    except KeyError:
+        pool = ThreadPools[name] = ThreadPool(name, size or options.thread_pool_size, options.thread_pool_queue)
+        return pool
+
 def run_application(handlers):
     tornado.options.parse_command_line()
+    if options.json_backend == 'fastest':
+        tornado.escape.set_json_backend()
+    elif options.json_backend:
+        tornado.escape.set_json_backend(options.json_backend)
     app = Application(handlers)
-    app.listen(options.port)
+    server = tornado.httpserver.HTTPServer(app, max_accepts=options.max_accepts)
+    server.listen(options.port, backlog=options.listen_backlog)
+    Overload.start(Connections)
     tornado.ioloop.IOLoop.instance().start()
 
 Events = APIEvents()
+# username -> connection id
 Clients = {}
+Connections = ConnectionTable()
 ENVGlobals = {}
+Overload = OverloadController()
+Profiler = SamplingProfiler()
+RateLimits = RateLimiter()
+Sessions = SessionStore()
+ThreadPools = {}
@@ -0,0 +1,44 @@
+import itertools
+
+# Process-wide table of open connections.
+#
+# Each connection gets the next integer id when it opens. Ids are never
+# reused, so an id kept elsewhere (Clients, event subscriptions) either
+# finds the very same connection or nothing once it has closed. Lookup,
+# insert and removal are single dict operations.
+class ConnectionTable:
+    def __init__(self):
+        self.connections = {}
+        self.opened = 0
+        self._ids = itertools.count(1)
+
+    def add(self, socket):
+        # returns the id of the new connection
+        connection_id = next(self._ids)
+        self.connections[connection_id] = socket
+        self.opened += 1
+        return connection_id
+
+    def remove(self, connection_id):
+        self.connections.pop(connection_id, None)
+
+    def get(self, connection_id):
+        return self.connections.get(connection_id)
+
+    def ids(self):
+        return self.connections.keys()
+
+    def __len__(self):
+        return len(self.connections)
+
+    def __iter__(self):
+        return self.connections.itervalues()
+
+    def __contains__(self, connection_id):
+        return connection_id in self.connections
+
+    def stats(self):
+        return {
+            'connections': len(self.connections),
+            'opened': self.opened
+        }
@@ -11,8 +11,19 @@ function VMChatter(host, port, route, params, master)
 	this.callbacks = [];
 	this.eventCallbacks = {};
 	this.master = master;
+	this.binary = !!(params && params.binary);
 
-	this.ws = new WebSocket('ws://' + this.host + ':' + this.port + '/' + this.route);
+	var url = 'ws://' + this.host + ':' + this.port + '/' + this.route;
+	if(this.binary)
+	{
+		//Server picks msgpack if it supports it, JSON otherwise
+		this.ws = new WebSocket(url, ['msgpack', 'json']);
+		this.ws.binaryType = 'arraybuffer';
+	}
+	else
+	{
+		this.ws = new WebSocket(url);
+	}
 
 	var th = this;
 
@@ -52,8 +63,32 @@ function VMChatter(host, port, route, params, master)
 
 	this.ws.onmessage = function(e)
 	{
-		var x = eval('(' + e.data + ')')
+		var x;
+		if(typeof e.data == 'string')
+		{
+			x = JSON.parse(e.data);
+		}
+		else
+		{
+			x = VMChatter.unpack(e.data);
+		}
+
+		//Replies to a batch come as one array
+		if(x instanceof Array)
+		{
+			for(var i = 0; i < x.length; i++)
+			{
+				th.onPackage(x[i]);
+			}
+		}
+		else
+		{
+			th.onPackage(x);
+		}
+	};
 
+	this.onPackage = function(x)
+	{
 		if(!x.success)
 		{
 			if(typeof th.onError == 'function')
@@ -130,5 +165,287 @@ VMChatter.prototype.applyMethod = function(group, method, args)
 VMChatter.prototype.callMethod = function(group, method, params, callback)
 {
 	var id = this.callbacks.push(callback);
-	this.ws.send( JSON.stringify({group: group, method: method, params: params, id: id}) );
+	this.send({group: group, method: method, params: params, id: id});
+};
+//Sends several calls in one frame, calls is a list of [group, method, params, callback].
+//With stopOnError the calls after a failed one are not run.
+VMChatter.prototype.callMethods = function(calls, stopOnError)
+{
+	var batch = [];
+	for(var i = 0; i < calls.length; i++)
+	{
+		var id = this.callbacks.push(calls[i][3] || function(){});
+		batch.push({group: calls[i][0], method: calls[i][1], params: calls[i][2], id: id});
+	}
+	this.send({batch: batch, stop_on_error: !!stopOnError});
+};
+VMChatter.prototype.send = function(pkg)
+{
+	if(this.ws.protocol == 'msgpack')
+	{
+		this.ws.send( VMChatter.pack(pkg) );
+	}
+	else
+	{
+		this.ws.send( JSON.stringify(pkg) );
+	}
+};
+
+//Minimal MessagePack encoder/decoder for the binary ("msgpack") subprotocol
+VMChatter.pack = function(value)
+{
+	var bytes = [];
+
+	var pushUint = function(n, size)
+	{
+		for(var i = size - 1; i >= 0; i--)
+		{
+			bytes.push(Math.floor(n / Math.pow(2, i * 8)) & 0xff);
+		}
+	};
+
+	var pushHeader = function(length, fix, fixMax, code16)
+	{
+		if(length <= fixMax)
+		{
+			bytes.push(fix | length);
+		}
+		else if(length <= 0xffff)
+		{
+			bytes.push(code16);
+			pushUint(length, 2);
+		}
+		else
+		{
+			bytes.push(code16 + 1);
+			pushUint(length, 4);
+		}
+	};
+
+	var pushString = function(str)
+	{
+		var utf8 = unescape(encodeURIComponent(str));
+		var length = utf8.length;
+		if(length < 0x20)
+		{
+			bytes.push(0xa0 | length);
+		}
+		else if(length <= 0xff)
+		{
+			bytes.push(0xd9);
+			pushUint(length, 1);
+		}
+		else if(length <= 0xffff)
+		{
+			bytes.push(0xda);
+			pushUint(length, 2);
+		}
+		else
+		{
+			bytes.push(0xdb);
+			pushUint(length, 4);
+		}
+		for(var i = 0; i < length; i++)
+		{
+			bytes.push(utf8.charCodeAt(i));
+		}
+	};
+
+	var pushNumber = function(n)
+	{
+		if(n % 1 !== 0 || n < -0x80000000 || n > 0xffffffff)
+		{
+			var view = new DataView(new ArrayBuffer(8));
+			view.setFloat64(0, n);
+			bytes.push(0xcb);
+			for(var i = 0; i < 8; i++)
+			{
+				bytes.push(view.getUint8(i));
+			}
+		}
+		else if(n >= 0)
+		{
+			if(n < 0x80)
+			{
+				bytes.push(n);
+			}
+			else if(n <= 0xff)
+			{
+				bytes.push(0xcc);
+				pushUint(n, 1);
+			}
+			else if(n <= 0xffff)
+			{
+				bytes.push(0xcd);
+				pushUint(n, 2);
+			}
+			else
+			{
+				bytes.push(0xce);
+				pushUint(n, 4);
+			}
+		}
+		else if(n >= -0x20)
+		{
+			bytes.push(n & 0xff);
+		}
+		else if(n >= -0x80)
+		{
+			bytes.push(0xd0);
+			pushUint(n & 0xff, 1);
+		}
+		else if(n >= -0x8000)
+		{
+			bytes.push(0xd1);
+			pushUint(n & 0xffff, 2);
+		}
+		else
+		{
+			bytes.push(0xd2);
+			pushUint(n >>> 0, 4);
+		}
+	};
+
+	var encode = function(v)
+	{
+		if(v === null || v === undefined)
+		{
+			bytes.push(0xc0);
+		}
+		else if(v === true || v === false)
+		{
+			bytes.push(v ? 0xc3 : 0xc2);
+		}
+		else if(typeof v == 'number')
+		{
+			pushNumber(v);
+		}
+		else if(typeof v == 'string')
+		{
+			pushString(v);
+		}
+		else if(v instanceof Array)
+		{
+			pushHeader(v.length, 0x90, 0x0f, 0xdc);
+			for(var i = 0; i < v.length; i++)
+			{
+				encode(v[i]);
+			}
+		}
+		else
+		{
+			//Same as JSON.stringify: functions and undefined are skipped
+			var keys = [];
+			for(var k in v)
+			{
+				if(v.hasOwnProperty(k) && typeof v[k] != 'function' && v[k] !== undefined)
+				{
+					keys.push(k);
+				}
+			}
+			pushHeader(keys.length, 0x80, 0x0f, 0xde);
+			for(var j = 0; j < keys.length; j++)
+			{
+				pushString(keys[j]);
+				encode(v[keys[j]]);
+			}
+		}
+	};
+
+	encode(value);
+
+	return new Uint8Array(bytes).buffer;
+};
+VMChatter.unpack = function(buffer)
+{
+	var view = new DataView(buffer);
+	var pos = 0;
+
+	var read = function(method, size)
+	{
+		var value = view[method](pos);
+		pos += size;
+		return value;
+	};
+
+	var readString = function(length)
+	{
+		var s = '';
+		for(var i = 0; i < length; i++)
+		{
+			s += String.fromCharCode(view.getUint8(pos + i));
+		}
+		pos += length;
+		return decodeURIComponent(escape(s));
+	};
+
+	var readBytes = function(length)
+	{
+		var value = new Uint8Array(buffer, pos, length);
+		pos += length;
+		return value;
+	};
+
+	var readArray = function(length)
+	{
+		var result = [];
+		for(var i = 0; i < length; i++)
+		{
+			result.push(decode());
+		}
+		return result;
+	};
+
+	var readMap = function(length)
+	{
+		var result = {};
+		for(var i = 0; i < length; i++)
+		{
+			var key = decode();
+			result[key] = decode();
+		}
+		return result;
+	};
+
+	var decode = function()
+	{
+		var code = read('getUint8', 1);
+
+		if(code < 0x80) return code;
+		if(code >= 0xe0) return code - 0x100;
+		if(code <= 0x8f) return readMap(code & 0x0f);
+		if(code <= 0x9f) return readArray(code & 0x0f);
+		if(code <= 0xbf) return readString(code & 0x1f);
+
+		switch(code)
+		{
+			case 0xc0: return null;
+			case 0xc2: return false;
+			case 0xc3: return true;
+			case 0xc4: return readBytes(read('getUint8', 1));
+			case 0xc5: return readBytes(read('getUint16', 2));
+			case 0xc6: return readBytes(read('getUint32', 4));
+			case 0xca: return read('getFloat32', 4);
+			case 0xcb: return read('getFloat64', 8);
+			case 0xcc: return read('getUint8', 1);
+			case 0xcd: return read('getUint16', 2);
+			case 0xce: return read('getUint32', 4);
+			case 0xcf: return read('getUint32', 4) * 0x100000000 + read('getUint32', 4);
+			case 0xd0: return read('getInt8', 1);
+			case 0xd1: return read('getInt16', 2);
+			case 0xd2: return read('getInt32', 4);
+			case 0xd3: return read('getInt32', 4) * 0x100000000 + read('getUint32', 4);
+			case 0xd9: return readString(read('getUint8', 1));
+			case 0xda: return readString(read('getUint16', 2));
+			case 0xdb: return readString(read('getUint32', 4));
+			case 0xdc: return readArray(read('getUint16', 2));
+			case 0xdd: return readArray(read('getUint32', 4));
+			case 0xde: return readMap(read('getUint16', 2));
+			case 0xdf: return readMap(read('getUint32', 4));
+		}
+
+		throw new Error('Unsupported msgpack type 0x' + code.toString(16));
+	};
+
+	return decode();
 };
\ No newline at end of file
@@ -0,0 +1,133 @@
+import collections
+import time
+import traceback
+
+import tornado.ioloop
+from tornado.options import define, options
+
+define('fanout_slice_time', default=0.005, help='seconds an event fan-out may run before yielding to the IOLoop', type=float)
+define('fanout_sync_size', default=256, help='fan-outs up to this many sockets are delivered at once when their topic is idle', type=int)
+
+# deliveries between two checks of the slice deadline
+_CHECK_EVERY = 64
+
+# Time-sliced delivery of events to their subscribers.
+#
+# Each scheduled fan-out is a job that calls deliver(target) for every target
+# in order. Big jobs are not run in one go: a slice stops once it has used
+# `fanout_slice_time` seconds and the rest is resumed from an
+# IOLoop.add_callback, so the other connections are served in between. Jobs
+# of one topic run strictly in the order they were scheduled, jobs of
+# different topics take turns. Small jobs on an idle topic are delivered
+# right away, without a trip through the IOLoop.
+class FanOut:
+    def __init__(self, io_loop=None):
+        self.io_loop = io_loop
+        self.topics = {}
+        self.ready = collections.deque()
+        self.scheduled = False
+
+        self.started = 0
+        self.completed = 0
+        self.sliced = 0
+        self.deliveries = 0
+        self.errors = 0
+        self.slices = 0
+        self.max_slice_time = 0.0
+        self.latency = 0.0
+        self.max_latency = 0.0
+
+    def schedule(self, topic, targets, deliver):
+        # targets is copied, so subscriptions may change while it runs
+        self.started += 1
+        if topic not in self.topics and len(targets) <= options.fanout_sync_size:
+            self._deliver(targets[:], 0, len(targets), deliver)
+            self.completed += 1
+            return
+
+        job = [time.time(), list(targets), 0, deliver]
+        try:
+            self.topics[topic].append(job)
+        except KeyError:
+            self.topics[topic] = collections.deque([job])
+            self.ready.append(topic)
+
+        if not self.scheduled:
+            self.scheduled = True
+            self._get_io_loop().add_callback(self._run_slice)
+
+    def pending(self):
+        return sum(len(job[1]) - job[2] for jobs in self.topics.itervalues() for job in jobs)
+
+    def stats(self):
+        sliced = self.sliced
+        return {
+            'topics': len(self.topics),
+            'jobs': sum(len(jobs) for jobs in self.topics.itervalues()),
+            'pending': self.pending(),
+            'started': self.started,
+            'completed': self.completed,
+            'sliced': sliced,
+            'deliveries': self.deliveries,
+            'errors': self.errors,
+            'slices': self.slices,
+            'max_slice_time': self.max_slice_time,
+            'avg_latency': self.latency / sliced if sliced else 0.0,
+            'max_latency': self.max_latency
+        }
+
+    def _get_io_loop(self):
+        if self.io_loop is None:
+            self.io_loop = tornado.ioloop.IOLoop.instance()
+        return self.io_loop
+
+    def _deliver(self, targets, start, end, deliver):
+        for i in xrange(start, end):
+            try:
+                deliver(targets[i])
+            except Exception:
+                self.errors += 1
+                print traceback.format_exc()
+        self.deliveries += end - start
+
+    def _run_slice(self):
+        started = time.time()
+        deadline = started + options.fanout_slice_time
+        ready = self.ready
+
+        while ready:
+            topic = ready[0]
+            jobs = self.topics[topic]
+            job = jobs[0]
+            scheduled, targets, pos, deliver = job
+
+            end = min(pos + _CHECK_EVERY, len(targets))
+            self._deliver(targets, pos, end, deliver)
+            job[2] = end
+
+            if end == len(targets):
+                jobs.popleft()
+                latency = time.time() - scheduled
+                self.completed += 1
+                self.sliced += 1
+                self.latency += latency
+                self.max_latency = max(self.max_latency, latency)
+                if not jobs:
+                    del self.topics[topic]
+                    ready.popleft()
+                else:
+                    ready.rotate(-1)
+            else:
+                # let the next topic have a go
+                ready.rotate(-1)
+
+            if time.time() >= deadline:
+                break
+
+        self.slices += 1
+        self.max_slice_time = max(self.max_slice_time, time.time() - started)
+
+        if ready:
+            self._get_io_loop().add_callback(self._run_slice)
+        else:
+            self.scheduled = False
@@ -0,0 +1,144 @@
+import collections
+import time
+import traceback
+
+import tornado.ioloop
+import tornado.iostream
+from tornado.options import define, options
+
+define('overload_check_interval', default=0.1, help='seconds between overload checks', type=float)
+define('overload_max_lag', default=0.2, help='IOLoop lag in seconds that counts as overload', type=float)
+define('overload_max_write_buffer', default=256 * 1024 * 1024, help='bytes queued for all clients that count as overload', type=int)
+define('overload_max_connections', default=0, help='WebSocket connections accepted at most, 0 for no limit', type=int)
+define('overload_recover_ratio', default=0.5, help='overload ends once lag and write buffers are below this share of their limits', type=float)
+define('overload_max_deferred', default=10000, help='deferred events kept during overload, the oldest are dropped beyond that', type=int)
+
+# seconds of deferred events replayed per IOLoop iteration after recovery
+_REPLAY_SLICE = 0.005
+
+# Event priorities, see OverloadController.run
+NORMAL = 'normal'
+DEFERRABLE = 'deferrable'
+OPTIONAL = 'optional'
+
+# Admission control and load shedding.
+#
+# Every `overload_check_interval` seconds the controller measures how late
+# its own timeout fired (IOLoop lag) and how many bytes are queued on all
+# streams, a counter IOStream keeps up to date. Either going over its limit
+# switches the process to overloaded until both are back below
+# `overload_recover_ratio` of their limits. While overloaded new WebSocket
+# upgrades are refused, DEFERRABLE events (e.g. presence) wait in a bounded
+# queue that is replayed in order after recovery, and OPTIONAL events (e.g.
+# the per-user user/on and user/off) are dropped. NORMAL events are always
+# run. The connection limit is applied at admission on its own.
+class OverloadController:
+    def __init__(self):
+        self.overloaded = False
+        self.reason = None
+        self.connections = ()
+        self.io_loop = None
+        self.deferred = collections.deque()
+        self._deadline = None
+
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.write_buffer = 0
+        self.overloads = 0
+        self.overloaded_since = None
+        self.rejected_upgrades = 0
+        self.deferred_events = 0
+        self.dropped_events = 0
+
+    def start(self, connections, io_loop=None):
+        # connections is a live collection of the open socket handlers
+        self.connections = connections
+        self.io_loop = io_loop or tornado.ioloop.IOLoop.instance()
+        self._schedule(time.time())
+
+    def accept_upgrade(self):
+        if self.overloaded or (options.overload_max_connections and
+                               len(self.connections) >= options.overload_max_connections):
+            self.rejected_upgrades += 1
+            return False
+        return True
+
+    def run(self, priority, func, *args):
+        if priority == NORMAL or not (self.overloaded or (priority == DEFERRABLE and self.deferred)):
+            func(*args)
+        elif priority == DEFERRABLE:
+            # also while the backlog is replayed, to keep the order
+            if len(self.deferred) >= options.overload_max_deferred:
+                self.deferred.popleft()
+                self.dropped_events += 1
+            self.deferred.append((func, args))
+            self.deferred_events += 1
+        else:
+            self.dropped_events += 1
+
+    def check(self):
+        now = time.time()
+        try:
+            self.lag = max(0.0, now - self._deadline)
+            self.max_lag = max(self.max_lag, self.lag)
+            self.write_buffer = tornado.iostream.total_write_buffer_size()
+
+            if not self.overloaded:
+                if self.lag > options.overload_max_lag:
+                    self._enter('lag', now)
+                elif self.write_buffer > options.overload_max_write_buffer:
+                    self._enter('write_buffer', now)
+            elif (self.lag < options.overload_max_lag * options.overload_recover_ratio and
+                  self.write_buffer < options.overload_max_write_buffer * options.overload_recover_ratio):
+                self._recover(now)
+        finally:
+            self._schedule(now)
+
+    def stats(self):
+        return {
+            'overloaded': self.overloaded,
+            'reason': self.reason,
+            'overloaded_for': time.time() - self.overloaded_since if self.overloaded else 0.0,
+            'lag': self.lag,
+            'max_lag': self.max_lag,
+            'write_buffer': self.write_buffer,
+            'connections': len(self.connections),
+            'overloads': self.overloads,
+            'rejected_upgrades': self.rejected_upgrades,
+            'deferred': len(self.deferred),
+            'deferred_events': self.deferred_events,
+            'dropped_events': self.dropped_events
+        }
+
+    def _schedule(self, now):
+        self._deadline = now + options.overload_check_interval
+        self.io_loop.add_timeout(self._deadline, self.check)
+
+    def _enter(self, reason, now):
+        print '[Overloaded: %s, lag %.3fs, %d bytes queued, %d connections]' % (
+            reason, self.lag, self.write_buffer, len(self.connections))
+        self.overloaded = True
+        self.reason = reason
+        self.overloaded_since = now
+        self.overloads += 1
+
+    def _recover(self, now):
+        print '[Recovered after %.1fs, %d deferred events]' % (now - self.overloaded_since, len(self.deferred))
+        self.overloaded = False
+        self.reason = None
+        self.overloaded_since = None
+        self._replay()
+
+    def _replay(self):
+        # a little at a time, so the backlog doesn't cause the next overload
+        deadline = time.time() + _REPLAY_SLICE
+        deferred = self.deferred
+        while deferred and not self.overloaded:
+            func, args = deferred.popleft()
+            try:
+                func(*args)
+            except Exception:
+                print traceback.format_exc()
+            if time.time() >= deadline:
+                self.io_loop.add_callback(self._replay)
+                break
@@ -0,0 +1,191 @@
+import struct
+
+# Compact pure-python MessagePack encoder/decoder used for the binary
+# ("msgpack") subprotocol. Only the types that can appear in a package are
+# supported: None, bool, int/long, float, str/unicode, list/tuple and dict.
+# Byte strings are assumed to be utf-8 and are sent as msgpack str, so every
+# string decodes back to unicode, just like with JSON.
+
+class PackError(ValueError):
+    pass
+
+_pack_B = struct.Struct('>B').pack
+_pack_b = struct.Struct('>b').pack
+_pack_BB = struct.Struct('>BB').pack
+_pack_Bb = struct.Struct('>Bb').pack
+_pack_BH = struct.Struct('>BH').pack
+_pack_Bh = struct.Struct('>Bh').pack
+_pack_BI = struct.Struct('>BI').pack
+_pack_Bi = struct.Struct('>Bi').pack
+_pack_BQ = struct.Struct('>BQ').pack
+_pack_Bq = struct.Struct('>Bq').pack
+_pack_Bd = struct.Struct('>Bd').pack
+
+def _pack_int(value, out):
+    if 0 <= value < 0x80:
+        out.append(_pack_B(value))
+    elif -0x20 <= value < 0:
+        out.append(_pack_b(value))
+    elif 0 <= value:
+        if value <= 0xff:
+            out.append(_pack_BB(0xcc, value))
+        elif value <= 0xffff:
+            out.append(_pack_BH(0xcd, value))
+        elif value <= 0xffffffff:
+            out.append(_pack_BI(0xce, value))
+        elif value <= 0xffffffffffffffff:
+            out.append(_pack_BQ(0xcf, value))
+        else:
+            raise PackError('Integer is too big: %r' % value)
+    else:
+        if value >= -0x80:
+            out.append(_pack_Bb(0xd0, value))
+        elif value >= -0x8000:
+            out.append(_pack_Bh(0xd1, value))
+        elif value >= -0x80000000:
+            out.append(_pack_Bi(0xd2, value))
+        elif value >= -0x8000000000000000:
+            out.append(_pack_Bq(0xd3, value))
+        else:
+            raise PackError('Integer is too small: %r' % value)
+
+def _pack_header(length, fix, fix_max, code16, out):
+    if length <= fix_max:
+        out.append(_pack_B(fix | length))
+    elif length <= 0xffff:
+        out.append(_pack_BH(code16, length))
+    else:
+        out.append(_pack_BI(code16 + 1, length))
+
+def _pack(value, out):
+    if value is None:
+        out.append('\xc0')
+    elif value is True:
+        out.append('\xc3')
+    elif value is False:
+        out.append('\xc2')
+    elif isinstance(value, (int, long)):
+        _pack_int(value, out)
+    elif isinstance(value, float):
+        out.append(_pack_Bd(0xcb, value))
+    elif isinstance(value, basestring):
+        if isinstance(value, unicode):
+            value = value.encode('utf-8')
+        length = len(value)
+        if length < 0x20:
+            out.append(_pack_B(0xa0 | length))
+        elif length <= 0xff:
+            out.append(_pack_BB(0xd9, length))
+        elif length <= 0xffff:
+            out.append(_pack_BH(0xda, length))
+        else:
+            out.append(_pack_BI(0xdb, length))
+        out.append(value)
+    elif isinstance(value, (list, tuple)):
+        _pack_header(len(value), 0x90, 0x0f, 0xdc, out)
+        for item in value:
+            _pack(item, out)
+    elif isinstance(value, dict):
+        _pack_header(len(value), 0x80, 0x0f, 0xde, out)
+        for key, item in value.iteritems():
+            _pack(key, out)
+            _pack(item, out)
+    else:
+        raise PackError('Can not pack %r' % type(value))
+
+def pack(value):
+    out = []
+    _pack(value, out)
+    return ''.join(out)
+
+# code -> (struct, size) for fixed width scalars
+_SCALARS = {
+    0xca: (struct.Struct('>f'), 4),
+    0xcb: (struct.Struct('>d'), 8),
+    0xcc: (struct.Struct('>B'), 1),
+    0xcd: (struct.Struct('>H'), 2),
+    0xce: (struct.Struct('>I'), 4),
+    0xcf: (struct.Struct('>Q'), 8),
+    0xd0: (struct.Struct('>b'), 1),
+    0xd1: (struct.Struct('>h'), 2),
+    0xd2: (struct.Struct('>i'), 4),
+    0xd3: (struct.Struct('>q'), 8),
+}
+
+# code -> (length struct, length size, kind)
+_SIZED = {
+    0xc4: (struct.Struct('>B'), 1, 'bin'),
+    0xc5: (struct.Struct('>H'), 2, 'bin'),
+    0xc6: (struct.Struct('>I'), 4, 'bin'),
+    0xd9: (struct.Struct('>B'), 1, 'str'),
+    0xda: (struct.Struct('>H'), 2, 'str'),
+    0xdb: (struct.Struct('>I'), 4, 'str'),
+    0xdc: (struct.Struct('>H'), 2, 'array'),
+    0xdd: (struct.Struct('>I'), 4, 'array'),
+    0xde: (struct.Struct('>H'), 2, 'map'),
+    0xdf: (struct.Struct('>I'), 4, 'map'),
+}
+
+def _unpack(data, pos):
+    code = ord(data[pos])
+    pos += 1
+
+    if code < 0x80:
+        return code, pos
+    if code >= 0xe0:
+        return code - 0x100, pos
+    if code <= 0x8f:
+        kind, length = 'map', code & 0x0f
+    elif code <= 0x9f:
+        kind, length = 'array', code & 0x0f
+    elif code <= 0xbf:
+        kind, length = 'str', code & 0x1f
+    elif code == 0xc0:
+        return None, pos
+    elif code == 0xc2:
+        return False, pos
+    elif code == 0xc3:
+        return True, pos
+    elif code in _SCALARS:
+        fmt, size = _SCALARS[code]
+        if pos + size > len(data):
+            raise PackError('Truncated data')
+        return fmt.unpack_from(data, pos)[0], pos + size
+    elif code in _SIZED:
+        fmt, size, kind = _SIZED[code]
+        if pos + size > len(data):
+            raise PackError('Truncated data')
+        length = fmt.unpack_from(data, pos)[0]
+        pos += size
+    else:
+        raise PackError('Unsupported type code 0x%02x' % code)
+
+    if kind == 'str' or kind == 'bin':
+        end = pos + length
+        if end > len(data):
+            raise PackError('Truncated data')
+        value = data[pos:end]
+        if kind == 'str':
+            value = value.decode('utf-8')
+        return value, end
+    if kind == 'array':
+        items = []
+        for i in xrange(length):
+            item, pos = _unpack(data, pos)
+            items.append(item)
+        return items, pos
+
+    result = {}
+    for i in xrange(length):
+        key, pos = _unpack(data, pos)
+        result[key], pos = _unpack(data, pos)
+    return result, pos
+
+def unpack(data):
+    try:
+        value, pos = _unpack(data, 0)
+    except IndexError:
+        raise PackError('Truncated data')
+    if pos != len(data):
+        raise PackError('Extra data after packed value')
+    return value
@@ -0,0 +1,66 @@
+import time
+
+import tornado.ioloop
+from tornado.options import define, options
+
+define('presence_window', default=0.5, help='seconds presence changes are collected before they are sent as one update', type=float)
+
+# Coalesces presence changes.
+#
+# Users going online and offline are collected for `presence_window` seconds
+# and then passed to `send(joined, left)` as two sorted lists of usernames.
+# A user who goes offline and back online (or the other way round) within a
+# window cancels out and is in neither list, so a storm of reconnects costs
+# one update per window rather than one per user.
+class PresenceCoalescer:
+    def __init__(self, send, io_loop=None):
+        self.send = send
+        self.io_loop = io_loop
+        # username -> True if joined, False if left since the last update
+        self.changes = {}
+        self.scheduled = False
+
+        self.updates = 0
+        self.coalesced = 0
+
+    def joined(self, username):
+        self._change(username, True)
+
+    def left(self, username):
+        self._change(username, False)
+
+    def flush(self):
+        self.scheduled = False
+        changes, self.changes = self.changes, {}
+        if not changes:
+            return
+        joined = sorted(username for username, online in changes.iteritems() if online)
+        left = sorted(username for username, online in changes.iteritems() if not online)
+        self.updates += 1
+        self.send(joined, left)
+
+    def stats(self):
+        return {
+            'pending': len(self.changes),
+            'updates': self.updates,
+            'coalesced': self.coalesced
+        }
+
+    def _change(self, username, online):
+        if self.changes.get(username, online) != online:
+            # back to what the last update said
+            del self.changes[username]
+            self.coalesced += 1
+        else:
+            self.changes[username] = online
+
+        if options.presence_window <= 0:
+            self.flush()
+        elif not self.scheduled:
+            self.scheduled = True
+            self._get_io_loop().add_timeout(time.time() + options.presence_window, self.flush)
+
+    def _get_io_loop(self):
+        if self.io_loop is None:
+            self.io_loop = tornado.ioloop.IOLoop.instance()
+        return self.io_loop
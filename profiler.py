@@ -0,0 +1,123 @@
+import os
+import signal
+import time
+
+from tornado.options import define, options
+
+define('profile_interval', default=0.005, help='seconds of CPU time between profiler samples', type=float)
+define('profile_max_stacks', default=5000, help='max distinct stacks kept by the profiler', type=int)
+define('profile_max_depth', default=64, help='max frames recorded per profiler sample', type=int)
+define('profile_dir', default='/tmp', help='directory for collapsed stack dumps')
+
+# Opt-in sampling profiler for API methods.
+#
+# SIGPROF fires every `profile_interval` seconds of CPU time while the profiler
+# is enabled, but a sample is only taken when the interrupted code is inside a
+# matching APIMethod.execute. Stacks are kept in the collapsed format
+# ("frame;frame;frame count") understood by flamegraph.pl, and the number of
+# distinct stacks is capped so memory stays bounded however long it runs.
+class SamplingProfiler:
+    def __init__(self):
+        self.enabled = False
+        self.target = (None, None, None, None)
+        self.depth = 0
+        self.stacks = {}
+        self.samples = 0
+        self.dropped = 0
+        self.started = None
+        self._names = {}
+        self._old_handler = None
+
+    def start(self, system_group=None, group=None, method=None, unique_id=None):
+        # None in any position matches everything
+        if self.enabled:
+            self.stop()
+
+        self.target = (system_group, group, method, unique_id)
+        self.stacks = {}
+        self.samples = 0
+        self.dropped = 0
+        self.started = time.time()
+
+        self._old_handler = signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, options.profile_interval, options.profile_interval)
+        self.enabled = True
+
+    def stop(self):
+        if not self.enabled:
+            return None
+
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self._old_handler or signal.SIG_DFL)
+        self._old_handler = None
+        self.enabled = False
+
+        return self.dump()
+
+    def matches(self, socket, system_group, group, method):
+        values = (system_group, group, method, socket.get_unique_id())
+        for want, value in zip(self.target, values):
+            if want is not None and want != value:
+                return False
+        return True
+
+    def run(self, socket, system_group, group, method, func, *args):
+        if not self.enabled or not self.matches(socket, system_group, group, method):
+            return func(*args)
+
+        self.depth += 1
+        try:
+            return func(*args)
+        finally:
+            self.depth -= 1
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'samples': self.samples,
+            'stacks': len(self.stacks),
+            'dropped': self.dropped
+        }
+
+    def dump(self, path=None):
+        if path is None:
+            name = 'chatter-%d-%d.folded' % (os.getpid(), int(self.started or time.time()))
+            path = os.path.join(options.profile_dir, name)
+
+        f = open(path, 'w')
+        try:
+            for stack, count in sorted(self.stacks.iteritems()):
+                f.write('%s %d\n' % (stack, count))
+            if self.dropped:
+                f.write('[dropped] %d\n' % self.dropped)
+        finally:
+            f.close()
+
+        return path
+
+    def _frame_name(self, code):
+        try:
+            return self._names[code]
+        except KeyError:
+            name = self._names[code] = '%s (%s:%d)' % (code.co_name, code.co_filename, code.co_firstlineno)
+            return name
+
+    def _sample(self, signum, frame):
+        if not self.depth:
+            return
+
+        self.samples += 1
+
+        names = []
+        while frame is not None and len(names) < options.profile_max_depth:
+            names.append(self._frame_name(frame.f_code))
+            frame = frame.f_back
+        names.reverse()
+        stack = ';'.join(names)
+
+        if stack in self.stacks:
+            self.stacks[stack] += 1
+        elif len(self.stacks) < options.profile_max_stacks:
+            self.stacks[stack] = 1
+        else:
+            self.dropped += 1
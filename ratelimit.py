@@ -0,0 +1,124 @@
+import time
+
+from tornado.options import define, options
+
+define('connection_rate', default=100.0, help='requests per second allowed per connection, 0 for no limit', type=float)
+define('connection_burst', default=200, help='requests a connection may send at once before connection_rate applies', type=int)
+define('user_rate', default=100.0, help='requests per second allowed per username, 0 for no limit', type=float)
+define('user_burst', default=200, help='requests a username may send at once before user_rate applies', type=int)
+define('rate_limit_max_users', default=10000, help='usernames with a token bucket kept, full and then least recently used ones are dropped beyond that', type=int)
+
+# Token bucket: holds up to `burst` tokens and gains `rate` tokens per
+# second. Each request takes one token and is refused when none is left.
+class TokenBucket(object):
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate, burst, now=None):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = now or time.time()
+
+    def refill(self, now):
+        tokens = self.tokens + (now - self.updated) * self.rate
+        if tokens > self.burst:
+            tokens = self.burst
+        self.tokens = tokens
+        self.updated = now
+        return tokens
+
+    def consume(self, now):
+        if self.refill(now) < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def full(self, now):
+        # like refill, but leaves `updated` alone
+        return self.tokens + (now - self.updated) * self.rate >= self.burst
+
+# Rate limits for incoming requests.
+#
+# A request has to get a token from up to three buckets: one per connection
+# (--connection_rate), one per username (--user_rate, shared by all
+# connections of the user and kept across reconnects) and one per connection
+# and API method for methods with a `rate_limit = (rate, burst)` attribute.
+# A check is a few dict lookups and float operations; buckets are only
+# created the first time they are needed. The user buckets are kept in a
+# plain dict; when --rate_limit_max_users is reached, a quarter of them is
+# dropped in one scan, full buckets first (they are the same as new ones)
+# and then the least recently used, so a check only pays for the scan once
+# per many new users.
+class RateLimiter:
+    def __init__(self):
+        self.users = {}
+        self.evicted = 0
+        self.checked = 0
+        self.rejected_connection = 0
+        self.rejected_user = 0
+        self.rejected_method = 0
+
+    def connection_bucket(self):
+        if options.connection_rate <= 0:
+            return None
+        return TokenBucket(options.connection_rate, options.connection_burst)
+
+    def check(self, socket, group, method, api_method):
+        # returns True if the request may run
+        self.checked += 1
+        now = time.time()
+
+        bucket = socket.rate_bucket
+        if bucket is not None and not bucket.consume(now):
+            self.rejected_connection += 1
+            return False
+
+        username = socket.username
+        if username and options.user_rate > 0:
+            bucket = self.users.get(username)
+            if bucket is None:
+                if len(self.users) >= options.rate_limit_max_users:
+                    self._evict_users(now)
+                bucket = self.users[username] = TokenBucket(options.user_rate, options.user_burst, now)
+            if not bucket.consume(now):
+                self.rejected_user += 1
+                return False
+
+        limit = getattr(api_method, 'rate_limit', None)
+        if limit is not None:
+            buckets = socket.method_buckets
+            if buckets is None:
+                buckets = socket.method_buckets = {}
+            try:
+                bucket = buckets[group][method]
+            except KeyError:
+                rate, burst = limit
+                bucket = buckets.setdefault(group, {})[method] = TokenBucket(rate, burst, now)
+            if not bucket.consume(now):
+                self.rejected_method += 1
+                return False
+
+        return True
+
+    def _evict_users(self, now):
+        users = self.users
+        count = len(users)
+        keep = options.rate_limit_max_users - max(options.rate_limit_max_users // 4, 1)
+        for username in [username for username, bucket in users.iteritems() if bucket.full(now)]:
+            del users[username]
+        if len(users) > keep:
+            oldest = sorted(users.iteritems(), key=lambda item: item[1].updated)
+            for username, bucket in oldest[:len(users) - keep]:
+                del users[username]
+        self.evicted += count - len(users)
+
+    def stats(self):
+        return {
+            'checked': self.checked,
+            'rejected': self.rejected_connection + self.rejected_user + self.rejected_method,
+            'rejected_connection': self.rejected_connection,
+            'rejected_user': self.rejected_user,
+            'rejected_method': self.rejected_method,
+            'users': len(self.users),
+            'evicted': self.evicted
+        }
@@ -0,0 +1,138 @@
+import binascii
+import collections
+import functools
+import os
+import time
+
+import tornado.ioloop
+from tornado.options import define, options
+
+define('session_grace', default=30.0, help='seconds a closed session can be resumed, 0 to disable sessions', type=float)
+define('session_replay_size', default=200, help='events kept for a closed session until it is resumed', type=int)
+
+class Session(object):
+    __slots__ = ('token', 'socket', 'replay', 'dropped', 'timeout')
+
+    def __init__(self, token, socket):
+        self.token = token
+        self.socket = socket
+        self.replay = None
+        self.dropped = 0
+        self.timeout = None
+
+    def buffer(self, package):
+        # the oldest packages are dropped once the buffer is full
+        if len(self.replay) == self.replay.maxlen:
+            self.dropped += 1
+        self.replay.append(package)
+
+# Resumable sessions.
+#
+# An authorized connection gets a random token. When it closes, its session
+# is kept for `session_grace` seconds instead of being torn down: the user
+# stays in Clients, the event subscriptions stay registered and the events
+# sent to it are buffered, up to `session_replay_size` of them. A connection
+# presenting the token within that time takes the session over and gets the
+# buffered events, so the client skips auth and all of its subscribe calls.
+# Tokens are single use, every resume issues a new one.
+class SessionStore:
+    def __init__(self):
+        self.tokens = {}
+        self.users = {}
+        # connection id of the closed connection -> session
+        self.detached = {}
+        self.io_loop = None
+
+        self.opened = 0
+        self.resumed = 0
+        self.expired = 0
+        self.replayed = 0
+        self.dropped = 0
+
+    def open(self, socket):
+        # returns the token, or None if sessions are disabled
+        if options.session_grace <= 0:
+            return None
+        self.opened += 1
+        return self.attach(Session(None, socket), socket)
+
+    def attach(self, session, socket):
+        session.token = binascii.hexlify(os.urandom(16))
+        session.socket = socket
+        socket.session = session
+        self.tokens[session.token] = session
+        self.users[socket.username] = session
+        return session.token
+
+    def detach(self, socket):
+        # returns False if the connection has no session to keep
+        session = socket.session
+        if session is None:
+            return False
+        session.replay = collections.deque(maxlen=options.session_replay_size)
+        self.detached[socket.unique_id] = session
+        session.timeout = self._get_io_loop().add_timeout(time.time() + options.session_grace,
+                                                          functools.partial(self.expire, session))
+        return True
+
+    def get_detached(self, connection_id):
+        session = self.detached.get(connection_id)
+        if session is None:
+            return None
+        return session.socket
+
+    def resume(self, token):
+        # returns the session, no longer owned by any connection, or None
+        session = self.tokens.pop(token, None)
+        if session is None:
+            return None
+        socket = session.socket
+        socket.session = None
+        del self.users[socket.username]
+        if session.timeout is not None:
+            self._get_io_loop().remove_timeout(session.timeout)
+            session.timeout = None
+        self.detached.pop(socket.unique_id, None)
+        self.resumed += 1
+        return session
+
+    def take_replay(self, session):
+        replay, session.replay = session.replay or (), None
+        self.replayed += len(replay)
+        self.dropped += session.dropped
+        session.dropped = 0
+        return replay
+
+    def expire(self, session):
+        socket = session.socket
+        if self.detached.pop(socket.unique_id, None) is None:
+            return
+        del self.tokens[session.token]
+        del self.users[socket.username]
+        socket.session = None
+        self.expired += 1
+        self.dropped += session.dropped
+        socket.release_connection()
+
+    def expire_user(self, username):
+        # a new login ends the session the user left for resuming
+        session = self.users.get(username)
+        if session is not None and session.socket.unique_id in self.detached:
+            self.expire(session)
+
+    def stats(self):
+        return {
+            'sessions': len(self.tokens),
+            'detached': len(self.detached),
+            'buffered': sum(len(session.replay) for session in self.detached.itervalues()),
+            'opened': self.opened,
+            'resumed': self.resumed,
+            'expired': self.expired,
+            'replayed': self.replayed,
+            'dropped': self.dropped
+        }
+
+    def _get_io_loop(self):
+        if self.io_loop is None:
+            self.io_loop = tornado.ioloop.IOLoop.instance()
+        return self.io_loop
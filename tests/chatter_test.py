@@ -0,0 +1,121 @@
+from __future__ import absolute_import, division, with_statement
+import time
+
+from tornado.options import options
+from tornado.web import Application
+
+from app_chat import ChatSocketHandler
+from app_example1 import Example1SocketHandler
+from chatter import Connections
+from tests.util import ChatTestCase
+
+
+class ConnectionTest(ChatTestCase):
+    def get_app(self):
+        return Application([("/chat", ChatSocketHandler),
+                            ("/example1", Example1SocketHandler)])
+
+    def later(self, stream, idx, delay):
+        self.send(stream, {"group": "hello", "method": "later",
+                           "params": {"text": "x", "delay": delay},
+                           "id": idx})
+
+    def test_close_releases_slots(self):
+        stream = self.connect(path="/example1")
+        handler = Connections.get(max(Connections.ids()))
+        for i in range(options.max_concurrent_requests + 3):
+            self.later(stream, i, 0.2)
+        self.wait_for(lambda: handler.queued and len(handler.queued) == 3)
+        self.assertEqual(handler.running, options.max_concurrent_requests)
+
+        stream.close()
+        self.wait_for(lambda: not handler.online)
+        self.assertEqual(handler.running, 0)
+        self.assertEqual(handler.queued, None)
+
+        # the requests that were running finish later without a slot
+        deadline = time.time() + 0.3
+        self.wait_for(lambda: time.time() > deadline)
+        self.assertEqual(handler.running, 0)
+
+
+class BatchTest(ChatTestCase):
+    def users(self, idx):
+        return {"group": "user", "method": "users", "params": {}, "id": idx}
+
+    def test_null_id(self):
+        stream = self.connect()
+        reply = self.call(stream, "user", "users", {}, None)
+        self.assertEqual(reply["id"], None)
+        self.assertEqual(reply["response"]["errors"][0]["message"],
+                         u"Access denied")
+        # still connected
+        reply = self.call(stream, "user", "users", {}, 2)
+        self.assertEqual(reply["id"], 2)
+        stream.close()
+
+    def test_batch(self):
+        stream = self.connect()
+        self.send(stream, [self.users(1), self.users(None), self.users(3)])
+        replies = self.receive(stream)
+        self.assertEqual([reply["id"] for reply in replies], [1, None, 3])
+        stream.close()
+
+    def test_batch_too_large(self):
+        stream = self.connect()
+        self.send(stream, {"batch": [self.users(i) for i in
+                                     range(options.max_batch_size + 1)]})
+        reply = self.receive(stream)
+        self.assertEqual(reply["id"], None)
+        self.assertEqual(reply["response"]["errors"][0]["message"],
+                         u"Batch too large")
+        self.send(stream, [self.users(i) for i in
+                           range(options.max_batch_size)])
+        self.assertEqual(len(self.receive(stream)), options.max_batch_size)
+        stream.close()
+
+
+class CallTimeoutTest(ChatTestCase):
+    def get_app(self):
+        return Application([("/example1", Example1SocketHandler)])
+
+    def setUp(self):
+        super(CallTimeoutTest, self).setUp()
+        self.saved = options.call_timeout, options.max_concurrent_requests
+        options.call_timeout = 0.1
+        options.max_concurrent_requests = 1
+
+    def tearDown(self):
+        options.call_timeout, options.max_concurrent_requests = self.saved
+        super(CallTimeoutTest, self).tearDown()
+
+    def test_unfinished_call_is_released(self):
+        stream = self.connect(path="/example1")
+        handler = Connections.get(max(Connections.ids()))
+        self.send(stream, {"group": "hello", "method": "later",
+                           "params": {"text": "x", "delay": 1}, "id": 1})
+        # waits for the slot
+        self.send(stream, {"group": "hello", "method": "world",
+                           "params": {"text": "y"}, "id": 2})
+        started = time.time()
+        reply = self.receive(stream)
+        self.assertEqual(reply["id"], 1)
+        self.assertEqual(reply["response"]["errors"][0]["message"], u"Timeout")
+        self.assertTrue(time.time() - started < 0.5)
+        reply = self.receive(stream)
+        self.assertEqual(reply, {u"id": 2, u"success": True,
+                                 u"response": {u"text": u"y"}})
+        self.assertEqual(handler.running, 0)
+        stream.close()
+
+    def test_finished_call_cancels_deadline(self):
+        stream = self.connect(path="/example1")
+        self.send(stream, {"group": "hello", "method": "later",
+                           "params": {"text": "x", "delay": 0.01}, "id": 1})
+        self.assertEqual(self.receive(stream)["response"], {u"text": u"x"})
+        # no Timeout error follows
+        deadline = time.time() + 0.2
+        self.wait_for(lambda: time.time() > deadline)
+        self.assertEqual(self.call(stream, "hello", "world",
+                                   {"text": "y"}, 2)["id"], 2)
+        stream.close()
@@ -0,0 +1,77 @@
+from __future__ import absolute_import, division, with_statement
+
+from tornado.options import options
+from tornado.testing import AsyncTestCase, LogTrapTestCase
+
+from fanout import FanOut
+
+
+class FanOutTest(AsyncTestCase, LogTrapTestCase):
+    def setUp(self):
+        super(FanOutTest, self).setUp()
+        self.saved = options.fanout_slice_time, options.fanout_sync_size
+        options.fanout_sync_size = 10
+        self.fanout = FanOut(self.io_loop)
+        self.delivered = []
+
+    def tearDown(self):
+        options.fanout_slice_time, options.fanout_sync_size = self.saved
+        super(FanOutTest, self).tearDown()
+
+    def deliver(self, target):
+        self.delivered.append(target)
+
+    def wait_done(self):
+        def check():
+            if self.fanout.scheduled:
+                self.io_loop.add_callback(check)
+            else:
+                self.stop()
+        self.io_loop.add_callback(check)
+        self.wait()
+
+    def test_small_job_is_delivered_at_once(self):
+        self.fanout.schedule('topic', range(5), self.deliver)
+        self.assertEqual(self.delivered, range(5))
+        self.assertFalse(self.fanout.scheduled)
+
+    def test_slices_keep_order(self):
+        # every check of the deadline ends the slice
+        options.fanout_slice_time = 0.0
+        self.fanout.schedule('topic', range(1000), self.deliver)
+        self.fanout.schedule('topic', range(1000, 1100), self.deliver)
+        # small, but queued behind the others of its topic
+        self.fanout.schedule('topic', ['last'], self.deliver)
+        self.assertEqual(self.delivered, [])
+        self.wait_done()
+        self.assertEqual(self.delivered, range(1100) + ['last'])
+        self.assertTrue(self.fanout.stats()['slices'] > 10)
+
+    def test_topics_take_turns(self):
+        options.fanout_slice_time = 0.0
+        self.fanout.schedule('a', [('a', i) for i in range(200)], self.deliver)
+        self.fanout.schedule('b', [('b', i) for i in range(200)], self.deliver)
+        self.wait_done()
+        topics = [topic for topic, i in self.delivered]
+        # 64 deliveries per turn
+        self.assertEqual(topics[:64], ['a'] * 64)
+        self.assertEqual(topics[64:128], ['b'] * 64)
+        for topic in 'ab':
+            self.assertEqual([i for t, i in self.delivered if t == topic], range(200))
+
+    def test_targets_are_copied(self):
+        options.fanout_slice_time = 0.0
+        targets = range(100)
+        self.fanout.schedule('topic', targets, self.deliver)
+        del targets[:]
+        self.wait_done()
+        self.assertEqual(self.delivered, range(100))
+
+    def test_errors_do_not_stop_delivery(self):
+        def deliver(target):
+            if target == 3:
+                raise ValueError()
+            self.delivered.append(target)
+        self.fanout.schedule('topic', range(5), deliver)
+        self.assertEqual(self.delivered, [0, 1, 2, 4])
+        self.assertEqual(self.fanout.errors, 1)
@@ -0,0 +1,35 @@
+from __future__ import absolute_import, division, with_statement
+
+from tornado.testing import AsyncTestCase, LogTrapTestCase
+
+import overload
+from overload import OverloadController
+
+
+class OverloadControllerTest(AsyncTestCase, LogTrapTestCase):
+    def setUp(self):
+        super(OverloadControllerTest, self).setUp()
+        self.controller = OverloadController()
+        self.controller.io_loop = self.io_loop
+        self.ran = []
+
+    def run_all(self):
+        for priority in (overload.NORMAL, overload.DEFERRABLE, overload.OPTIONAL):
+            self.controller.run(priority, self.ran.append, priority)
+
+    def test_not_overloaded(self):
+        self.run_all()
+        self.assertEqual(self.ran, [overload.NORMAL, overload.DEFERRABLE, overload.OPTIONAL])
+
+    def test_overloaded(self):
+        self.controller.overloaded = True
+        self.controller.overloaded_since = 0
+        self.run_all()
+        # deferred events are replayed on recovery, optional ones are gone
+        self.assertEqual(self.ran, [overload.NORMAL])
+        self.assertEqual(self.controller.dropped_events, 1)
+        self.assertFalse(self.controller.accept_upgrade())
+
+        self.controller._recover(1)
+        self.assertEqual(self.ran, [overload.NORMAL, overload.DEFERRABLE])
+        self.assertTrue(self.controller.accept_upgrade())
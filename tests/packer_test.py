@@ -0,0 +1,88 @@
+from __future__ import absolute_import, division, with_statement
+import unittest
+
+from tornado.util import b
+
+from packer import PackError, pack, unpack
+from tests.util import ChatTestCase
+
+
+class PackerTest(unittest.TestCase):
+    def assertRoundTrip(self, value, expected=None):
+        if expected is None:
+            expected = value
+        self.assertEqual(unpack(pack(value)), expected)
+
+    def test_scalars(self):
+        for value in (None, True, False, 0, 1, 127, 128, 255, 256, 65535,
+                      65536, 2 ** 32, 2 ** 64 - 1, -1, -32, -33, -128,
+                      -129, -32768, -32769, -2 ** 31, -2 ** 63, 0.5, -1e300):
+            self.assertRoundTrip(value)
+        self.assertTrue(unpack(pack(True)) is True)
+        self.assertRaises(PackError, pack, 2 ** 64)
+        self.assertRaises(PackError, pack, -2 ** 63 - 1)
+
+    def test_unicode(self):
+        for value in (u"", u"hello", u"\u043f\u0440\u0438\u0432\u0435\u0442",
+                      u"\U0001f419", u"x" * 31, u"x" * 32, u"x" * 256,
+                      u"x" * 65536):
+            decoded = unpack(pack(value))
+            self.assertEqual(decoded, value)
+            self.assertEqual(type(decoded), unicode)
+
+    def test_byte_strings_decode_to_unicode(self):
+        # just like with JSON
+        self.assertRoundTrip(u"\u00e9".encode("utf-8"), u"\u00e9")
+        self.assertRoundTrip({b("key"): b("value")}, {u"key": u"value"})
+
+    def test_binary(self):
+        # bin values sent by other msgpack implementations stay bytes
+        self.assertEqual(unpack(b("\xc4\x03\x00\xff\x80")), b("\x00\xff\x80"))
+        self.assertEqual(unpack(b("\xc5\x00\x02ab")), b("ab"))
+        data = b("\xc6\x00\x01\x00\x00") + b("\x00") * 65536
+        self.assertEqual(unpack(data), b("\x00") * 65536)
+
+    def test_nested(self):
+        value = {u"group": u"event", u"method": u"subscribe", u"id": 7,
+                 u"params": {u"list": [1, [2, [3, {u"deep": None}]]],
+                             u"many": range(20),
+                             u"map": dict((u"k%d" % i, i) for i in range(20)),
+                             u"empty": {}, u"none": []}}
+        self.assertRoundTrip(value)
+        self.assertRoundTrip((1, 2), [1, 2])
+
+    def test_invalid(self):
+        self.assertRaises(PackError, unpack, b(""))
+        self.assertRaises(PackError, unpack, b("\xc1"))
+        self.assertRaises(PackError, unpack, b("\xa5abc"))
+        self.assertRaises(PackError, unpack, b("\x92\x01"))
+        self.assertRaises(PackError, unpack, b("\xcd\x01"))
+        self.assertRaises(PackError, unpack, b("\x01\x02"))
+        self.assertRaises(PackError, pack, object())
+
+
+class PackerProtocolTest(ChatTestCase):
+    def test_msgpack_subprotocol(self):
+        stream = self.connect("msgpack")
+        self.send(stream, {"group": "user", "method": "users",
+                           "params": {}, "id": 3}, binary=True)
+        reply = self.receive(stream)
+        self.assertEqual(reply["id"], 3)
+        self.assertEqual(reply["success"], False)
+        self.assertEqual(reply["response"]["errors"][0]["message"],
+                         u"Access denied")
+        stream.close()
+
+    def test_invalid_msgpack_frame(self):
+        for protocol in ("msgpack", None):
+            stream = self.connect(protocol)
+            stream.write(b("\x82\x81\x00\x00\x00\x00\xc1"))
+            reply = self.receive(stream)
+            self.assertEqual(reply, {u"success": False, u"id": None,
+                                     u"response": {u"errors": [
+                                         {u"code": 0,
+                                          u"message": u"Exception"}]}})
+            # the connection keeps working
+            reply = self.call(stream, "user", "users", {}, 4)
+            self.assertEqual(reply["id"], 4)
+            stream.close()
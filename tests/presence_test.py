@@ -0,0 +1,62 @@
+from __future__ import absolute_import, division, with_statement
+import time
+
+from tornado.options import options
+from tornado.testing import AsyncTestCase, LogTrapTestCase
+
+from presence import PresenceCoalescer
+
+
+class PresenceCoalescerTest(AsyncTestCase, LogTrapTestCase):
+    def setUp(self):
+        super(PresenceCoalescerTest, self).setUp()
+        self.saved = options.presence_window
+        options.presence_window = 0.05
+        self.updates = []
+        self.presence = PresenceCoalescer(self.send, self.io_loop)
+
+    def tearDown(self):
+        options.presence_window = self.saved
+        super(PresenceCoalescerTest, self).tearDown()
+
+    def send(self, joined, left):
+        self.updates.append((joined, left))
+        self.stop()
+
+    def test_changes_are_sent_once_per_window(self):
+        started = time.time()
+        self.presence.joined(u'bob')
+        self.presence.joined(u'alice')
+        self.presence.left(u'carol')
+        self.assertEqual(self.updates, [])
+        self.assertEqual(self.presence.stats()['pending'], 3)
+        self.wait()
+        self.assertTrue(time.time() - started >= 0.05)
+        self.assertEqual(self.updates, [([u'alice', u'bob'], [u'carol'])])
+
+        self.presence.left(u'bob')
+        self.wait()
+        self.assertEqual(self.updates[1], ([], [u'bob']))
+        self.assertEqual(self.presence.stats(), {'pending': 0, 'updates': 2, 'coalesced': 0})
+
+    def test_reconnect_cancels_out(self):
+        self.presence.left(u'bob')
+        self.presence.joined(u'bob')
+        self.presence.joined(u'alice')
+        self.wait()
+        self.assertEqual(self.updates, [([u'alice'], [])])
+        self.assertEqual(self.presence.stats()['coalesced'], 1)
+
+    def test_nothing_left_is_not_sent(self):
+        self.presence.joined(u'bob')
+        self.presence.left(u'bob')
+        self.io_loop.add_timeout(time.time() + 0.1, self.stop)
+        self.wait()
+        self.assertEqual(self.updates, [])
+        self.assertEqual(self.presence.stats()['updates'], 0)
+
+    def test_no_window(self):
+        options.presence_window = 0.0
+        self.presence.joined(u'bob')
+        self.presence.left(u'bob')
+        self.assertEqual(self.updates, [([u'bob'], []), ([], [u'bob'])])
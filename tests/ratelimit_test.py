@@ -0,0 +1,102 @@
+from __future__ import absolute_import, division, with_statement
+import unittest
+
+from tornado.options import options
+
+from ratelimit import RateLimiter, TokenBucket
+
+
+class FakeSocket(object):
+    def __init__(self, username='', rate_bucket=None):
+        self.username = username
+        self.rate_bucket = rate_bucket
+        self.method_buckets = None
+
+
+class LimitedMethod(object):
+    rate_limit = (1, 2)
+
+
+class TokenBucketTest(unittest.TestCase):
+    def test_burst_then_rate(self):
+        bucket = TokenBucket(10, 3, now=100.0)
+        self.assertEqual([bucket.consume(100.0) for i in range(4)],
+                         [True, True, True, False])
+        # one token every 0.1s
+        self.assertFalse(bucket.consume(100.05))
+        self.assertTrue(bucket.consume(100.15))
+        self.assertFalse(bucket.consume(100.15))
+
+    def test_refill_is_capped(self):
+        bucket = TokenBucket(10, 3, now=100.0)
+        bucket.consume(100.0)
+        self.assertEqual(bucket.refill(1000.0), 3)
+
+
+class RateLimiterTest(unittest.TestCase):
+    def setUp(self):
+        self.saved = dict((name, getattr(options, name)) for name in
+                          ('user_rate', 'user_burst', 'rate_limit_max_users'))
+        options.user_rate = 1.0
+        options.user_burst = 2
+        options.rate_limit_max_users = 3
+        self.limiter = RateLimiter()
+
+    def tearDown(self):
+        for name, value in self.saved.iteritems():
+            setattr(options, name, value)
+
+    def check(self, socket, api_method=None):
+        return self.limiter.check(socket, 'group', 'method', api_method)
+
+    def test_connection_bucket(self):
+        socket = FakeSocket(rate_bucket=TokenBucket(0.001, 2))
+        self.assertEqual([self.check(socket) for i in range(3)],
+                         [True, True, False])
+        self.assertEqual(self.limiter.rejected_connection, 1)
+
+    def test_user_bucket_is_shared(self):
+        first, second = FakeSocket('alice'), FakeSocket('alice')
+        self.assertTrue(self.check(first))
+        self.assertTrue(self.check(second))
+        self.assertFalse(self.check(first))
+        self.assertTrue(self.check(FakeSocket('bob')))
+        self.assertEqual(self.limiter.rejected_user, 1)
+
+    def test_method_bucket(self):
+        options.user_rate = 0.0
+        socket = FakeSocket('alice')
+        self.assertEqual([self.check(socket, LimitedMethod) for i in range(3)],
+                         [True, True, False])
+        # other methods are not affected
+        self.assertTrue(self.check(socket))
+        self.assertEqual(self.limiter.rejected_method, 1)
+
+    def test_max_users_evicts_least_recently_used(self):
+        for username in ('a', 'b', 'c'):
+            self.check(FakeSocket(username))
+        # 'a' is used again, so 'b' is the oldest now
+        self.check(FakeSocket('a'))
+        self.check(FakeSocket('d'))
+        self.assertEqual(sorted(self.limiter.users), ['a', 'c', 'd'])
+        self.assertEqual(self.limiter.evicted, 1)
+
+        for i in range(100):
+            self.check(FakeSocket('flood%d' % i))
+        self.assertEqual(len(self.limiter.users), 3)
+        self.assertEqual(self.limiter.stats()['users'], 3)
+
+    def test_max_users_evicts_full_buckets_first(self):
+        for username in ('a', 'b', 'c'):
+            self.check(FakeSocket(username))
+        # as good as a new bucket, although the most recently used
+        self.limiter.users['c'].tokens = 2.0
+        self.check(FakeSocket('d'))
+        self.assertEqual(sorted(self.limiter.users), ['a', 'b', 'd'])
+        self.assertEqual(self.limiter.evicted, 1)
+
+    def test_check_does_not_reorder(self):
+        self.check(FakeSocket('a'))
+        bucket = self.limiter.users['a']
+        self.check(FakeSocket('a'))
+        self.assertTrue(self.limiter.users['a'] is bucket)
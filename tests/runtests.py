@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+#
+# Tests for the chatter server; the vendored tornado has its own in
+# tornado/test.  Run from the repository root:
+#
+#     python -m tests.runtests
+
+from __future__ import absolute_import, division, with_statement
+import unittest
+
+TEST_MODULES = [
+    'tests.chatter_test',
+    'tests.fanout_test',
+    'tests.overload_test',
+    'tests.packer_test',
+    'tests.presence_test',
+    'tests.ratelimit_test',
+    'tests.sessions_test',
+    'tests.threadpool_test',
+    'tests.topics_test',
+]
+
+
+def all():
+    return unittest.defaultTestLoader.loadTestsFromNames(TEST_MODULES)
+
+if __name__ == '__main__':
+    import tornado.testing
+    tornado.testing.main()
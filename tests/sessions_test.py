@@ -0,0 +1,171 @@
+from __future__ import absolute_import, division, with_statement
+import time
+
+from tornado.options import options
+from tornado.testing import AsyncTestCase, LogTrapTestCase
+from tornado.web import Application
+
+from app_chat import ChatSocketHandler
+from app_example1 import Example1SocketHandler
+from chatter import Connections, Sessions
+from sessions import SessionStore
+from tests.util import ChatTestCase
+
+
+class FakeSocket(object):
+    def __init__(self, unique_id, username):
+        self.unique_id = unique_id
+        self.username = username
+        self.session = None
+        self.released = False
+
+    def release_connection(self):
+        self.released = True
+
+
+class SessionStoreTest(AsyncTestCase, LogTrapTestCase):
+    def setUp(self):
+        super(SessionStoreTest, self).setUp()
+        self.saved = options.session_grace, options.session_replay_size
+        self.store = SessionStore()
+        self.store.io_loop = self.io_loop
+
+    def tearDown(self):
+        options.session_grace, options.session_replay_size = self.saved
+        super(SessionStoreTest, self).tearDown()
+
+    def test_disabled(self):
+        options.session_grace = 0.0
+        socket = FakeSocket(1, 'bob')
+        self.assertEqual(self.store.open(socket), None)
+        self.assertFalse(self.store.detach(socket))
+
+    def test_expiry(self):
+        options.session_grace = 0.05
+        socket = FakeSocket(1, 'bob')
+        token = self.store.open(socket)
+        self.assertTrue(self.store.detach(socket))
+        self.assertTrue(self.store.get_detached(1) is socket)
+
+        self.io_loop.add_timeout(time.time() + 0.1, self.stop)
+        self.wait()
+        self.assertTrue(socket.released)
+        self.assertEqual(self.store.get_detached(1), None)
+        self.assertEqual(self.store.resume(token), None)
+        self.assertEqual(self.store.stats()['sessions'], 0)
+        self.assertEqual(self.store.stats()['expired'], 1)
+
+    def test_resume_token_rejection(self):
+        socket = FakeSocket(1, 'bob')
+        token = self.store.open(socket)
+        self.store.detach(socket)
+        self.assertEqual(self.store.resume('nope'), None)
+
+        session = self.store.resume(token)
+        self.assertTrue(session.socket is socket)
+        self.assertEqual(socket.session, None)
+        self.assertEqual(self.store.get_detached(1), None)
+        # single use
+        self.assertEqual(self.store.resume(token), None)
+
+        new_token = self.store.attach(session, FakeSocket(2, 'bob'))
+        self.assertNotEqual(new_token, token)
+        self.assertEqual(self.store.resume(token), None)
+        self.assertTrue(self.store.resume(new_token) is session)
+        self.assertFalse(socket.released)
+
+    def test_replay_drops_oldest(self):
+        options.session_replay_size = 2
+        socket = FakeSocket(1, 'bob')
+        token = self.store.open(socket)
+        self.store.detach(socket)
+        for i in range(3):
+            socket.session.buffer({"id": i})
+        self.assertEqual(self.store.stats()['buffered'], 2)
+        session = self.store.resume(token)
+        self.assertEqual([package["id"] for package in self.store.take_replay(session)], [1, 2])
+        self.assertEqual(self.store.stats()['dropped'], 1)
+        self.assertEqual(self.store.stats()['replayed'], 2)
+
+    def test_expire_user(self):
+        socket = FakeSocket(1, 'bob')
+        self.store.open(socket)
+        self.store.expire_user('bob')
+        # still connected
+        self.assertFalse(socket.released)
+        self.store.detach(socket)
+        self.store.expire_user('bob')
+        self.assertTrue(socket.released)
+
+
+class SessionProtocolTest(ChatTestCase):
+    def subscribe(self, stream):
+        reply = self.call(stream, "event", "subscribe",
+                          {"group": "chat", "event": "message",
+                           "params": {}, "callback": "cb"}, 2)
+        self.assertTrue(reply["success"])
+
+    def test_bad_token(self):
+        stream = self.connect()
+        reply = self.call(stream, "user", "resume", {"token": "nope"})
+        self.assertFalse(reply["success"])
+        self.assertEqual(reply["response"]["errors"][0]["message"],
+                         u"Session expired")
+        stream.close()
+
+    def test_private_message_is_replayed(self):
+        alice, alice_token = self.login("alice")
+        bob, token = self.login("bob")
+        self.subscribe(bob)
+        bob.close()
+        self.wait_for(lambda: Sessions.detached)
+
+        reply = self.call(alice, "user", "private_message",
+                          {"username": "bob", "message": "hi"}, 3)
+        self.assertTrue(reply["success"])
+
+        bob = self.connect()
+        self.send(bob, {"group": "user", "method": "resume",
+                        "params": {"token": token}, "id": 4})
+        event = self.receive(bob)
+        self.assertEqual(event["id"], u"cb")
+        self.assertEqual(event["response"]["params"],
+                         {u"user": u"alice", u"message": u"hi"})
+        reply = self.receive(bob)
+        self.assertEqual(reply["id"], 4)
+        self.assertTrue(reply["success"])
+
+        # and live once resumed
+        self.call(alice, "user", "private_message",
+                  {"username": "bob", "message": "again"}, 5)
+        event = self.receive(bob)
+        self.assertEqual(event["response"]["params"]["message"], u"again")
+        alice.close()
+        bob.close()
+
+
+class SessionBatchTest(ChatTestCase):
+    def get_app(self):
+        return Application([("/chat", ChatSocketHandler),
+                            ("/example1", Example1SocketHandler)])
+
+    def test_batch_finishing_while_detached(self):
+        stream = self.connect(path="/example1")
+        handler = Connections.get(max(Connections.ids()))
+        handler.username = "bob"
+        token = Sessions.open(handler)
+        self.send(stream, [{"group": "hello", "method": "later",
+                            "params": {"text": "x", "delay": 0.1}, "id": 1},
+                           {"group": "hello", "method": "world",
+                            "params": {"text": "y"}, "id": 2}])
+        stream.close()
+        self.wait_for(lambda: not handler.online)
+        self.assertTrue(handler.session is not None)
+        self.wait_for(lambda: Sessions.stats()["buffered"] == 1)
+
+        session = Sessions.resume(token)
+        replies = list(Sessions.take_replay(session))
+        self.assertEqual(len(replies), 1)
+        self.assertEqual([reply["id"] for reply in replies[0]], [1, 2])
+        self.assertEqual(replies[0][0]["response"], {"text": "x"})
+        self.assertEqual(handler.running, 0)
@@ -0,0 +1,60 @@
+from __future__ import absolute_import, division, with_statement
+import threading
+
+from tornado.testing import AsyncTestCase, LogTrapTestCase
+
+from threadpool import ThreadPool
+
+
+class ThreadPoolTest(AsyncTestCase, LogTrapTestCase):
+    def setUp(self):
+        super(ThreadPoolTest, self).setUp()
+        self.pool = ThreadPool('test', 2, 2, io_loop=self.io_loop)
+
+    def test_result(self):
+        def callback(result, exc_info):
+            self.stop((result, exc_info, threading.current_thread()))
+        self.assertTrue(self.pool.submit(lambda a, b: (a + b, threading.current_thread()),
+                                         (1, 2), callback))
+        (value, worker), exc_info, thread = self.wait()
+        self.assertEqual(value, 3)
+        self.assertEqual(exc_info, None)
+        # run on a worker, called back on the IOLoop thread
+        self.assertNotEqual(worker, threading.current_thread())
+        self.assertEqual(thread, threading.current_thread())
+        self.assertEqual(self.pool.stats()['completed'], 1)
+
+    def test_exception(self):
+        def fail():
+            raise ValueError('boom')
+        self.pool.submit(fail, (), lambda result, exc_info: self.stop((result, exc_info)))
+        result, exc_info = self.wait()
+        self.assertEqual(result, None)
+        self.assertEqual(exc_info[0], ValueError)
+        self.assertEqual(str(exc_info[1]), 'boom')
+
+    def test_queue_is_bounded(self):
+        started = threading.Semaphore(0)
+        release = threading.Event()
+        results = []
+
+        def job(i):
+            started.release()
+            release.wait(5)
+            return i
+
+        def callback(result, exc_info):
+            results.append(result)
+            if len(results) == 4:
+                self.stop()
+        # two keep the threads busy, two wait, the fifth is refused
+        for i in range(2):
+            self.assertTrue(self.pool.submit(job, (i,), callback))
+            started.acquire()
+        self.assertTrue(self.pool.submit(job, (2,), callback))
+        self.assertTrue(self.pool.submit(job, (3,), callback))
+        self.assertFalse(self.pool.submit(job, (4,), callback))
+        self.assertEqual(self.pool.stats()['rejected'], 1)
+        release.set()
+        self.wait()
+        self.assertEqual(sorted(results), [0, 1, 2, 3])
@@ -0,0 +1,162 @@
+from __future__ import absolute_import, division, with_statement
+import unittest
+
+from chatter import Events, Sessions
+from tests.util import ChatTestCase
+from topics import EventTopic, compile_filter, matches
+
+
+class Subscription(object):
+    def __init__(self, spec=None):
+        self.conditions = compile_filter(spec)
+
+
+class FilterTest(unittest.TestCase):
+    def test_compile_filter(self):
+        self.assertEqual(compile_filter(None), ())
+        self.assertEqual(compile_filter({"b": 1, "a": None}),
+                         (("a", None), ("b", 1)))
+        self.assertRaises(ValueError, compile_filter, 5)
+        self.assertRaises(ValueError, compile_filter, {"a": [1]})
+        self.assertRaises(ValueError, compile_filter, {"a": {}})
+
+    def test_matches(self):
+        conditions = compile_filter({"user": u"bob", "kind": 1})
+        self.assertTrue(matches((), {}))
+        self.assertTrue(matches(conditions, {"user": u"bob", "kind": 1,
+                                             "text": u"hi"}))
+        self.assertFalse(matches(conditions, {"user": u"bob", "kind": 2}))
+        self.assertFalse(matches(conditions, {"user": u"bob"}))
+        self.assertFalse(matches(conditions, None))
+
+
+class EventTopicTest(unittest.TestCase):
+    def test_no_filter(self):
+        topic = EventTopic()
+        subscription = Subscription()
+        topic.add(subscription)
+        for params in ({}, {"user": u"bob"}, None, [1]):
+            self.assertEqual(topic.match(params), [subscription])
+        self.assertEqual(topic.index, {})
+
+    def test_match(self):
+        topic = EventTopic()
+        bob = Subscription({"user": u"bob"})
+        bob_hi = Subscription({"user": u"bob", "text": u"hi"})
+        carol = Subscription({"user": u"carol"})
+        everyone = Subscription()
+        for subscription in (bob, bob_hi, carol, everyone):
+            topic.add(subscription)
+
+        def match(params):
+            return set(topic.match(params))
+        self.assertEqual(match({"user": u"bob", "text": u"hi"}),
+                         set([bob, bob_hi, everyone]))
+        self.assertEqual(match({"user": u"bob", "text": u"yo"}),
+                         set([bob, everyone]))
+        self.assertEqual(match({"user": u"carol", "text": u"hi"}),
+                         set([carol, everyone]))
+        self.assertEqual(match({"user": u"dave"}), set([everyone]))
+        self.assertEqual(match({"text": u"hi"}), set([everyone]))
+        # unhashable values can't match a scalar
+        self.assertEqual(match({"user": [u"bob"]}), set([everyone]))
+        self.assertEqual(match(None), set([everyone]))
+
+    def test_indexed_condition(self):
+        topic = EventTopic()
+        for i in range(3):
+            topic.add(Subscription({"kind": u"message", "user": u"user%d" % i}))
+        # the common condition is not the one indexed
+        self.assertEqual(sorted(topic.index), ["kind", "user"])
+        self.assertEqual(len(topic.index["kind"][u"message"]), 1)
+        self.assertEqual(len(topic.index["user"]), 2)
+
+    def test_remove_cleans_index(self):
+        topic = EventTopic()
+        bob = Subscription({"user": u"bob"})
+        bob_hi = Subscription({"user": u"bob", "text": u"hi"})
+        carol = Subscription({"user": u"carol"})
+        for subscription in (bob, bob_hi, carol):
+            topic.add(subscription)
+        topic.remove(carol)
+        self.assertFalse(u"carol" in topic.index["user"])
+        topic.remove(bob)
+        topic.remove(bob_hi)
+        self.assertEqual(topic.index, {})
+        self.assertEqual(topic.match({"user": u"bob", "text": u"hi"}), [])
+
+    def test_remove(self):
+        topic = EventTopic()
+        subscriptions = [Subscription() for i in range(3)]
+        subscriptions += [Subscription({"user": u"bob"}) for i in range(3)]
+        for subscription in subscriptions:
+            topic.add(subscription)
+        self.assertEqual(len(topic), 6)
+
+        for subscription in subscriptions[1::2]:
+            topic.remove(subscription)
+        self.assertEqual(len(topic), 3)
+        self.assertEqual(set(topic.match({"user": u"bob"})),
+                         set(subscriptions[::2]))
+
+        for subscription in subscriptions[::2]:
+            topic.remove(subscription)
+        self.assertEqual(len(topic), 0)
+        self.assertRaises(KeyError, topic.remove, subscriptions[0])
+
+    def test_subscription_order(self):
+        topic = EventTopic()
+        unfiltered = [Subscription() for i in range(50)]
+        filtered = [Subscription({"user": u"bob"}) for i in range(50)]
+        for subscription in unfiltered + filtered:
+            topic.add(subscription)
+        for subscription in unfiltered[10:20] + filtered[10:20]:
+            topic.remove(subscription)
+        topic.add(unfiltered[10])
+        topic.add(filtered[10])
+        self.assertEqual(topic.match({"user": u"bob"}),
+                         unfiltered[:10] + unfiltered[20:] + unfiltered[10:11] +
+                         filtered[:10] + filtered[20:] + filtered[10:11])
+
+
+class FilterProtocolTest(ChatTestCase):
+    def subscribe(self, stream, spec, callback):
+        params = {} if spec is None else {"filter": spec}
+        return self.call(stream, "event", "subscribe",
+                         {"group": "chat", "event": "message",
+                          "params": params, "callback": callback}, 2)
+
+    def events(self, alice, bob, message, count):
+        self.call(alice, "user", "message", {"message": message}, 3)
+        callbacks = set(self.receive(bob)["id"] for i in range(count))
+        # nothing else was sent to bob
+        self.assertEqual(self.call(bob, "user", "users", {}, 4)["id"], 4)
+        return callbacks
+
+    def test_filter(self):
+        alice, alice_token = self.login("alice")
+        bob, bob_token = self.login("bob")
+        self.assertTrue(self.subscribe(bob, {"user": "alice"}, "from_alice")["success"])
+        self.assertTrue(self.subscribe(bob, {"user": "alice", "message": "hi"},
+                                       "alice_hi")["success"])
+        self.assertTrue(self.subscribe(bob, {"user": "carol"}, "from_carol")["success"])
+        self.assertTrue(self.subscribe(bob, None, "all")["success"])
+        for spec in ({"user": ["alice"]}, 5):
+            reply = self.subscribe(bob, spec, "bad")
+            self.assertEqual(reply["response"]["errors"][0]["message"],
+                             u"Bad filter")
+
+        self.assertEqual(self.events(alice, bob, "hi", 3),
+                         set([u"from_alice", u"alice_hi", u"all"]))
+        self.assertEqual(self.events(alice, bob, "yo", 2),
+                         set([u"from_alice", u"all"]))
+
+        # the subscriptions go away with the connection
+        topic = Events.events["chat"]["chat"]["message"]
+        bob.close()
+        self.wait_for(lambda: Sessions.detached)
+        for session in list(Sessions.detached.values()):
+            Sessions.expire(session)
+        self.assertFalse(u"carol" in topic.index.get("user", {}))
+        self.assertFalse(u"hi" in topic.index.get("message", {}))
+        alice.close()
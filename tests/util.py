@@ -0,0 +1,104 @@
+from __future__ import absolute_import, division, with_statement
+from cStringIO import StringIO
+import json
+import socket
+import struct
+import sys
+import time
+
+from tornado.ioloop import IOLoop
+from tornado.iostream import IOStream
+from tornado.testing import AsyncHTTPTestCase, LogTrapTestCase
+from tornado.util import b
+from tornado.web import Application
+from tornado.test.websocket_test import masked_frame
+
+from app_chat import ChatSocketHandler
+from chatter import Sessions
+import packer
+
+
+class ChatTestCase(AsyncHTTPTestCase, LogTrapTestCase):
+    """Runs app_chat's handler and talks to it over raw WebSocket frames.
+
+    The chatter globals (Events, Sessions, FanOut...) schedule on the
+    IOLoop singleton, so the tests run on it too.
+    """
+    def get_app(self):
+        return Application([("/chat", ChatSocketHandler)])
+
+    def get_new_ioloop(self):
+        return IOLoop.instance()
+
+    def setUp(self):
+        super(ChatTestCase, self).setUp()
+        # the API methods report bad packages with print
+        self.stdout, sys.stdout = sys.stdout, StringIO()
+
+    def tearDown(self):
+        for session in list(Sessions.detached.values()):
+            Sessions.expire(session)
+        sys.stdout = self.stdout
+        super(ChatTestCase, self).tearDown()
+
+    def connect(self, protocol=None, path="/chat"):
+        stream = IOStream(socket.socket(), io_loop=self.io_loop)
+        stream.connect(("localhost", self.get_http_port()), self.stop)
+        self.wait()
+        stream.write(b("GET " + path + " HTTP/1.1\r\n"
+                       "Host: localhost\r\n"
+                       "Upgrade: websocket\r\n"
+                       "Connection: Upgrade\r\n"
+                       "Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n"
+                       "Sec-WebSocket-Version: 13\r\n" +
+                       ("Sec-WebSocket-Protocol: %s\r\n" % protocol
+                        if protocol else "") +
+                       "\r\n"))
+        stream.read_until(b("\r\n\r\n"), self.stop)
+        self.assertTrue(self.wait().startswith(b("HTTP/1.1 101")))
+        return stream
+
+    def send(self, stream, package, binary=False):
+        if binary:
+            stream.write(masked_frame(0x2, packer.pack(package)))
+        else:
+            stream.write(masked_frame(0x1, b(json.dumps(package))))
+
+    def receive(self, stream):
+        stream.read_bytes(2, self.stop)
+        header, length = struct.unpack("BB", self.wait())
+        if length == 126:
+            stream.read_bytes(2, self.stop)
+            length = struct.unpack("!H", self.wait())[0]
+        elif length == 127:
+            stream.read_bytes(8, self.stop)
+            length = struct.unpack("!Q", self.wait())[0]
+        stream.read_bytes(length, self.stop)
+        data = self.wait()
+        if header & 0xf == 0x2:
+            return packer.unpack(data)
+        return json.loads(data)
+
+    def wait_for(self, condition, timeout=5):
+        deadline = time.time() + timeout
+
+        def check():
+            if condition() or time.time() > deadline:
+                self.stop()
+            else:
+                self.io_loop.add_timeout(time.time() + 0.01, check)
+        check()
+        self.wait(timeout=timeout + 1)
+        self.assertTrue(condition())
+
+    def call(self, stream, group, method, params, idx=1):
+        self.send(stream, {"group": group, "method": method,
+                           "params": params, "id": idx})
+        return self.receive(stream)
+
+    def login(self, username):
+        stream = self.connect()
+        reply = self.call(stream, "user", "auth",
+                          {"username": username, "password": "secret"})
+        self.assertTrue(reply["success"])
+        return stream, reply["response"]["session"]
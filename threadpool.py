@@ -0,0 +1,90 @@
+import functools
+import Queue
+import sys
+import threading
+import time
+
+import tornado.ioloop
+from tornado import stack_context
+
+# Bounded pool of worker threads for blocking API methods.
+#
+# Jobs run on one of `size` daemon threads; their result (or exc_info) is
+# handed back to the IOLoop thread with add_callback, which is the only
+# IOLoop method that is safe to call from another thread. At most
+# `max_queue` jobs may wait for a thread, submit() returns False beyond that.
+class ThreadPool:
+    def __init__(self, name, size, max_queue=0, io_loop=None):
+        self.name = name
+        self.size = size
+        self.io_loop = io_loop or tornado.ioloop.IOLoop.instance()
+        self.queue = Queue.Queue(max_queue)
+        self.threads = []
+        self.lock = threading.Lock()
+
+        self.active = 0
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.run_time = 0.0
+
+    def submit(self, func, args, callback):
+        # callback(result, exc_info) is called on the IOLoop thread
+        try:
+            self.queue.put_nowait((time.time(), func, args, stack_context.wrap(callback)))
+        except Queue.Full:
+            self.rejected += 1
+            return False
+
+        self.submitted += 1
+        if len(self.threads) < self.size and self.queue.qsize() > 0:
+            self._start_thread()
+        return True
+
+    def stats(self):
+        with self.lock:
+            completed = self.completed
+            return {
+                'size': self.size,
+                'threads': len(self.threads),
+                'active': self.active,
+                'queued': self.queue.qsize(),
+                'submitted': self.submitted,
+                'completed': completed,
+                'rejected': self.rejected,
+                'avg_wait_time': self.wait_time / completed if completed else 0.0,
+                'max_wait_time': self.max_wait_time,
+                'avg_run_time': self.run_time / completed if completed else 0.0
+            }
+
+    def _start_thread(self):
+        thread = threading.Thread(target=self._worker, name='%s-%d' % (self.name, len(self.threads)))
+        thread.daemon = True
+        self.threads.append(thread)
+        thread.start()
+
+    def _worker(self):
+        while True:
+            queued, func, args, callback = self.queue.get()
+            started = time.time()
+            with self.lock:
+                self.active += 1
+
+            try:
+                result = func(*args)
+                exc_info = None
+            except Exception:
+                result = None
+                exc_info = sys.exc_info()
+
+            finished = time.time()
+            with self.lock:
+                self.active -= 1
+                self.completed += 1
+                self.wait_time += started - queued
+                self.max_wait_time = max(self.max_wait_time, started - queued)
+                self.run_time += finished - started
+
+            self.io_loop.add_callback(functools.partial(callback, result, exc_info))
@@ -0,0 +1,98 @@
+import collections
+import types
+
+# values a filter may compare event fields with
+_SCALARS = (basestring, int, long, float, bool, types.NoneType)
+
+def compile_filter(spec):
+    # {'field': value, ...} -> sorted tuple of (field, value) pairs,
+    # raises ValueError for anything else
+    if spec is None:
+        return ()
+    if not isinstance(spec, dict):
+        raise ValueError('filter is not a dict')
+    for field, value in spec.iteritems():
+        if not isinstance(value, _SCALARS):
+            raise ValueError('filter value for %r is not a scalar' % field)
+    return tuple(sorted(spec.iteritems()))
+
+def matches(conditions, params):
+    try:
+        for field, value in conditions:
+            if params[field] != value:
+                return False
+    except (KeyError, TypeError):
+        return False
+    return True
+
+# The subscriptions of one event.
+#
+# Subscriptions without a filter are kept in an OrderedDict. Filtered ones are
+# indexed by one of their conditions, field -> value -> subscriptions, so an
+# event only looks at the subscriptions whose indexed condition it meets and
+# checks the others on those. The indexed condition is the one with the
+# fewest subscriptions under it when the subscription is added, which keeps
+# a common condition (e.g. {'kind': 'message'}) from piling everything into
+# one bucket. The cost of matching grows with the number of distinct filtered
+# fields and of matches, not with the number of subscribers. OrderedDicts
+# keyed by the subscription make removing one O(1), so a disconnect storm
+# stays linear, and keep every bucket in subscription order, so fan-out
+# order is deterministic.
+class EventTopic(object):
+    __slots__ = ('subscribers', 'index')
+
+    def __init__(self):
+        self.subscribers = collections.OrderedDict()
+        self.index = {}
+
+    def add(self, event):
+        # moves the indexed condition to the front of event.conditions
+        conditions = event.conditions
+        if not conditions:
+            self.subscribers[event] = None
+            return
+        if len(conditions) > 1:
+            best = min(xrange(len(conditions)), key=lambda i: self._count(conditions[i]))
+            event.conditions = (conditions[best],) + conditions[:best] + conditions[best + 1:]
+        field, value = event.conditions[0]
+        self.index.setdefault(field, {}).setdefault(value, collections.OrderedDict())[event] = None
+
+    def remove(self, event):
+        if not event.conditions:
+            del self.subscribers[event]
+            return
+        field, value = event.conditions[0]
+        values = self.index[field]
+        events = values[value]
+        del events[event]
+        if not events:
+            del values[value]
+            if not values:
+                del self.index[field]
+
+    def match(self, params):
+        # returns a new list of the subscriptions params pass
+        result = list(self.subscribers)
+        if not self.index or not isinstance(params, dict):
+            return result
+        for field, values in self.index.iteritems():
+            try:
+                events = values.get(params[field])
+            except (KeyError, TypeError):
+                continue
+            if events:
+                for event in events:
+                    if len(event.conditions) == 1 or matches(event.conditions[1:], params):
+                        result.append(event)
+        return result
+
+    def _count(self, condition):
+        field, value = condition
+        try:
+            return len(self.index[field][value])
+        except KeyError:
+            return 0
+
+    def __len__(self):
+        return len(self.subscribers) + sum(len(events) for values in self.index.itervalues()
+                                           for events in values.itervalues())
@@ -38,30 +38,86 @@ try:
 except ImportError:
     from cgi import parse_qs
 
-# json module is in the standard library as of python 2.6; fall back to
-# simplejson if present for older versions.
-try:
-    import json
-    assert hasattr(json, "loads") and hasattr(json, "dumps")
-    _json_decode = json.loads
-    _json_encode = json.dumps
-except Exception:
-    try:
-        import simplejson
-        _json_decode = lambda s: simplejson.loads(_unicode(s))
-        _json_encode = lambda v: simplejson.dumps(v)
-    except ImportError:
+# JSON backends in order of speed.  ujson and simplejson (with its C
+# speedups) are considerably faster than the standard library on python 2,
+# but they escape, format floats and reject bad input differently, so they
+# are only used when asked for with `set_json_backend`.  By default the
+# json module is used, which is in the standard library as of python 2.6,
+# and plain simplejson is kept as a fallback for older versions.
+_JSON_BACKENDS = ("ujson", "simplejson", "json")
+_DEFAULT_JSON_BACKENDS = ("json", "simplejson")
+
+json_backend = None
+
+
+def _load_json_backend(name, require_speedups=False):
+    """Returns ``(decode, encode, compact_encode)`` for the named backend.
+
+    Raises ImportError if the backend is not available, or if
+    ``require_speedups`` is true and it is running without its C extension.
+    """
+    if name == "ujson":
+        import ujson
+        return ujson.loads, ujson.dumps, ujson.dumps
+    elif name == "simplejson":
         try:
+            import simplejson
+        except ImportError:
             # For Google AppEngine
             from django.utils import simplejson
-            _json_decode = lambda s: simplejson.loads(_unicode(s))
-            _json_encode = lambda v: simplejson.dumps(v)
+        if require_speedups and not getattr(simplejson.encoder, "c_make_encoder", None):
+            raise ImportError("simplejson C speedups are not available")
+        compact = simplejson.JSONEncoder(separators=(",", ":"))
+        return (lambda s: simplejson.loads(_unicode(s)),
+                lambda v: simplejson.dumps(v),
+                compact.encode)
+    elif name == "json":
+        import json
+        if not (hasattr(json, "loads") and hasattr(json, "dumps")):
+            raise ImportError("json module is incomplete")
+        compact = json.JSONEncoder(separators=(",", ":"))
+        return json.loads, json.dumps, compact.encode
+    raise ValueError("Unknown JSON backend %r" % name)
+
+
+def _json_not_implemented(s):
+    raise NotImplementedError(
+        "A JSON parser is required, e.g., simplejson at "
+        "http://pypi.python.org/pypi/simplejson/")
+
+
+def set_json_backend(name=None):
+    """Selects the JSON implementation used by the ``json_*`` functions.
+
+    ``name`` may be one of ``"ujson"``, ``"simplejson"`` or ``"json"``;
+    if it is None the fastest available backend is used.  Returns the
+    name of the selected backend.  The standard library's json module is
+    used until this is called.
+    """
+    if name is not None:
+        candidates = [(name, False)]
+    else:
+        candidates = [(n, True) for n in _JSON_BACKENDS]
+        # Pure-python simplejson is still better than nothing
+        candidates.append(("simplejson", False))
+    return _select_json_backend(candidates, name is not None)
+
+
+def _select_json_backend(candidates, required):
+    global _json_decode, _json_encode, _json_compact_encode, json_backend
+    for candidate, require_speedups in candidates:
+        try:
+            functions = _load_json_backend(candidate, require_speedups)
         except ImportError:
-            def _json_decode(s):
-                raise NotImplementedError(
-                    "A JSON parser is required, e.g., simplejson at "
-                    "http://pypi.python.org/pypi/simplejson/")
-            _json_encode = _json_decode
+            if required:
+                raise
+            continue
+        _json_decode, _json_encode, _json_compact_encode = functions
+        json_backend = candidate
+        return candidate
+    _json_decode = _json_encode = _json_compact_encode = _json_not_implemented
+    json_backend = None
+    return None
 
 
 _XHTML_ESCAPE_RE = re.compile('[&<>"]')
@@ -95,6 +151,17 @@ def json_decode(value):
     return _json_decode(to_basestring(value))
 
 
+def json_compact_encode(value):
+    """JSON-encodes the given Python object without whitespace.
+
+    Unlike `json_encode` the value is passed straight to the backend's
+    preconfigured encoder: byte strings are not converted first and
+    ``</`` is not escaped, so this is meant for data that is not
+    embedded in HTML (e.g. WebSocket messages).
+    """
+    return _json_compact_encode(value)
+
+
 def squeeze(value):
     """Replace all sequences of whitespace chars with a single space."""
     return re.sub(r"[\x00-\x20]+", " ", value).strip()
@@ -349,3 +416,5 @@ def _build_unicode_map():
     return unicode_map
 
 _HTML_UNICODE_MAP = _build_unicode_map()
+
+_select_json_backend([(n, False) for n in _DEFAULT_JSON_BACKENDS], False)
@@ -122,6 +122,9 @@ def engine(func):
             assert gen is None, gen
             deactivate()
             # no yield, so we're done
+    # Like functools.wraps on python 3, so the wrapped function's
+    # signature can still be inspected.
+    wrapper.__wrapped__ = func
     return wrapper
 
 
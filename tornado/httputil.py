@@ -72,7 +72,7 @@ class HTTPHeaders(dict):
 
     def add(self, name, value):
         """Adds a new value for the given key."""
-        norm_name = HTTPHeaders._normalize_name(name)
+        norm_name = _normalize_header(name)
         self._last_key = norm_name
         if norm_name in self:
             # bypass our override of __setitem__ since it modifies _as_list
@@ -83,7 +83,7 @@ class HTTPHeaders(dict):
 
     def get_list(self, name):
         """Returns all values for the given header as a list."""
-        norm_name = HTTPHeaders._normalize_name(name)
+        norm_name = _normalize_header(name)
         return self._as_list.get(norm_name, [])
 
     def get_all(self):
@@ -123,32 +123,48 @@ class HTTPHeaders(dict):
         [('Content-Length', '42'), ('Content-Type', 'text/html')]
         """
         h = cls()
+        as_list = h._as_list
         for line in headers.splitlines():
-            if line:
+            if not line:
+                continue
+            if line[0].isspace():
                 h.parse_line(line)
+                continue
+            # Same as parse_line, but without re-normalizing the name
+            # in add() and __setitem__
+            name, sep, value = line.partition(":")
+            if not sep:
+                raise ValueError("Malformed header line: %r" % line)
+            norm_name = _normalize_header(name)
+            value = value.strip()
+            if norm_name in as_list:
+                h.add(norm_name, value)
+            else:
+                dict.__setitem__(h, norm_name, value)
+                as_list[norm_name] = [value]
+            h._last_key = norm_name
         return h
 
     # dict implementation overrides
 
     def __setitem__(self, name, value):
-        norm_name = HTTPHeaders._normalize_name(name)
+        norm_name = _normalize_header(name)
         dict.__setitem__(self, norm_name, value)
         self._as_list[norm_name] = [value]
 
     def __getitem__(self, name):
-        return dict.__getitem__(self, HTTPHeaders._normalize_name(name))
+        return dict.__getitem__(self, _normalize_header(name))
 
     def __delitem__(self, name):
-        norm_name = HTTPHeaders._normalize_name(name)
+        norm_name = _normalize_header(name)
         dict.__delitem__(self, norm_name)
         del self._as_list[norm_name]
 
     def __contains__(self, name):
-        norm_name = HTTPHeaders._normalize_name(name)
-        return dict.__contains__(self, norm_name)
+        return dict.__contains__(self, _normalize_header(name))
 
     def get(self, name, default=None):
-        return dict.get(self, HTTPHeaders._normalize_name(name), default)
+        return dict.get(self, _normalize_header(name), default)
 
     def update(self, *args, **kwargs):
         # dict.update bypasses our __setitem__
@@ -159,9 +175,6 @@ class HTTPHeaders(dict):
         # default implementation returns dict(self), not the subclass
         return HTTPHeaders(self)
 
-    _NORMALIZED_HEADER_RE = re.compile(r'^[A-Z0-9][a-z0-9]*(-[A-Z0-9][a-z0-9]*)*$')
-    _normalized_headers = {}
-
     @staticmethod
     def _normalize_name(name):
         """Converts a name to Http-Header-Case.
@@ -169,15 +182,27 @@ class HTTPHeaders(dict):
         >>> HTTPHeaders._normalize_name("coNtent-TYPE")
         'Content-Type'
         """
-        try:
-            return HTTPHeaders._normalized_headers[name]
-        except KeyError:
-            if HTTPHeaders._NORMALIZED_HEADER_RE.match(name):
-                normalized = name
-            else:
-                normalized = "-".join([w.capitalize() for w in name.split("-")])
-            HTTPHeaders._normalized_headers[name] = normalized
-            return normalized
+        return _normalize_header(name)
+
+
+_NORMALIZED_HEADER_RE = re.compile(r'^[A-Z0-9][a-z0-9]*(-[A-Z0-9][a-z0-9]*)*$')
+_NORMALIZED_HEADERS_MAX = 1000
+_normalized_headers = {}
+
+
+def _normalize_header(name):
+    # Header names come from clients, so only the first
+    # _NORMALIZED_HEADERS_MAX distinct spellings are remembered.
+    try:
+        return _normalized_headers[name]
+    except KeyError:
+        if _NORMALIZED_HEADER_RE.match(name):
+            normalized = name
+        else:
+            normalized = "-".join([w.capitalize() for w in name.split("-")])
+        if len(_normalized_headers) < _NORMALIZED_HEADERS_MAX:
+            _normalized_headers[name] = normalized
+        return normalized
 
 
 def url_concat(url, args):
@@ -20,11 +20,13 @@ from __future__ import absolute_import, division, with_statement
 
 import collections
 import errno
+import itertools
 import logging
 import os
 import socket
 import sys
 import re
+import threading
 
 from tornado import ioloop
 from tornado import stack_context
@@ -35,6 +37,39 @@ try:
 except ImportError:
     ssl = None
 
+# os.sendfile is available on python 3.3+ on most unix platforms
+_sendfile = getattr(os, "sendfile", None)
+
+# socket.sendmsg (python 3.3+ on unix) sends several buffers in one call
+_HAS_SENDMSG = hasattr(socket.socket, "sendmsg")
+
+# Buffers passed to one sendmsg call; well under IOV_MAX everywhere
+_SENDMSG_MAX_BUFFERS = 64
+
+# Scratch buffers for recv_into, one per thread.  Data is copied out
+# right after each recv, so every stream on an IOLoop can share one.
+_recv_buffers = threading.local()
+
+# bytes queued on all open streams, see total_write_buffer_size
+_total_write_buffer_size = 0
+
+
+def total_write_buffer_size():
+    """Returns the number of bytes queued but not yet sent on all open
+    streams of the process.
+
+    It is kept up to date as data is written and sent, so reading it is
+    cheap however many streams there are.
+    """
+    return _total_write_buffer_size
+
+
+def _get_recv_buffer(size):
+    buf = getattr(_recv_buffers, "buffer", None)
+    if buf is None or len(buf) < size:
+        buf = _recv_buffers.buffer = memoryview(bytearray(size))
+    return buf
+
 
 class IOStream(object):
     r"""A utility class to write to and read from a non-blocking socket.
@@ -82,21 +117,37 @@ class IOStream(object):
 
     """
     def __init__(self, socket, io_loop=None, max_buffer_size=104857600,
-                 read_chunk_size=4096):
+                 read_chunk_size=4096, max_read_chunk_size=65536,
+                 use_recv_into=False, read_budget=262144):
         self.socket = socket
         self.socket.setblocking(False)
         self.io_loop = io_loop or ioloop.IOLoop.instance()
         self.max_buffer_size = max_buffer_size
+        # read_chunk_size adapts between its initial value and
+        # max_read_chunk_size, see _adapt_read_chunk_size
         self.read_chunk_size = read_chunk_size
+        self.min_read_chunk_size = read_chunk_size
+        self.max_read_chunk_size = max(read_chunk_size, max_read_chunk_size)
+        self.use_recv_into = use_recv_into
+        # bytes read per IOLoop event before other connections get a
+        # turn; None reads until the socket would block
+        self.read_budget = read_budget
         self.error = None
-        self._read_buffer = collections.deque()
+        # Unconsumed data is self._read_buffer[self._read_buffer_pos:]
+        self._read_buffer = bytearray()
+        self._read_buffer_pos = 0
         self._write_buffer = collections.deque()
+        self._write_buffer_size = 0
         self._read_buffer_size = 0
         self._write_buffer_frozen = False
+        self._vectored_writes = _HAS_SENDMSG
+        self._write_file = None
         self._read_delimiter = None
         self._read_regex = None
         self._read_bytes = None
         self._read_until_close = False
+        self._read_copy = True
+        self._read_paused = False
         self._read_callback = None
         self._streaming_callback = None
         self._write_callback = None
@@ -152,20 +203,28 @@ class IOStream(object):
         self._read_delimiter = delimiter
         self._try_inline_read()
 
-    def read_bytes(self, num_bytes, callback, streaming_callback=None):
+    def read_bytes(self, num_bytes, callback, streaming_callback=None,
+                   copy=True):
         """Call callback when we read the given number of bytes.
 
         If a ``streaming_callback`` is given, it will be called with chunks
         of data as they become available, and the argument to the final
         ``callback`` will be empty.
+
+        If ``copy`` is False the data is passed as a ``bytearray`` that
+        the callback owns and may modify.  It is handed over from the read
+        buffer without copying whenever the read takes everything that is
+        buffered, which is the usual case for large reads.
         """
         self._set_read_callback(callback)
         assert isinstance(num_bytes, (int, long))
         self._read_bytes = num_bytes
+        self._read_copy = copy
         self._streaming_callback = stack_context.wrap(streaming_callback)
         self._try_inline_read()
 
-    def read_until_close(self, callback, streaming_callback=None):
+    def read_until_close(self, callback, streaming_callback=None,
+                         copy=True):
         """Reads all data from the socket until it is closed.
 
         If a ``streaming_callback`` is given, it will be called with chunks
@@ -174,8 +233,11 @@ class IOStream(object):
 
         Subject to ``max_buffer_size`` limit from `IOStream` constructor if
         a ``streaming_callback`` is not used.
+
+        ``copy`` has the same meaning as for `read_bytes`.
         """
         self._set_read_callback(callback)
+        self._read_copy = copy
         self._streaming_callback = stack_context.wrap(streaming_callback)
         if self.closed():
             if self._streaming_callback is not None:
@@ -188,6 +250,9 @@ class IOStream(object):
             return
         self._read_until_close = True
         self._streaming_callback = stack_context.wrap(streaming_callback)
+        if self._streaming_callback is not None and self._read_buffer_size:
+            # Pass on what is already buffered without waiting for more
+            self._read_from_buffer()
         self._add_io_state(self.io_loop.READ)
 
     def write(self, data, callback=None):
@@ -198,16 +263,33 @@ class IOStream(object):
         previously buffered write data and an old write callback, that
         callback is simply overwritten with this new callback.
         """
-        assert isinstance(data, bytes_type)
+        self.writelines((data,), callback)
+
+    def writelines(self, chunks, callback=None):
+        """Writes each of the given strings to this stream, like `write`.
+
+        The strings are queued separately and sent together.  Where
+        ``socket.sendmsg`` is available they are never joined, so e.g. a
+        small header and a large payload shared by many streams are sent
+        without copying the payload.
+        """
+        assert not (self._write_file and any(chunks)), \
+            "Cannot write while a file is being sent"
         self._check_closed()
-        # We use bool(_write_buffer) as a proxy for write_buffer_size>0,
-        # so never put empty strings in the buffer.
-        if data:
+        for data in chunks:
+            assert isinstance(data, bytes_type)
+            # We use bool(_write_buffer) as a proxy for write_buffer_size>0,
+            # so never put empty strings in the buffer.
+            if not data:
+                continue
+            self._change_write_buffer_size(len(data))
             # Break up large contiguous strings before inserting them in the
             # write buffer, so we don't have to recopy the entire thing
-            # as we slice off pieces to send to the socket.
+            # as we slice off pieces to send to the socket.  Vectored
+            # writes send slices of memoryviews instead.
             WRITE_BUFFER_CHUNK_SIZE = 128 * 1024
-            if len(data) > WRITE_BUFFER_CHUNK_SIZE:
+            if (len(data) > WRITE_BUFFER_CHUNK_SIZE and
+                not self._vectored_writes):
                 for i in range(0, len(data), WRITE_BUFFER_CHUNK_SIZE):
                     self._write_buffer.append(data[i:i + WRITE_BUFFER_CHUNK_SIZE])
             else:
@@ -219,6 +301,31 @@ class IOStream(object):
                 self._add_io_state(self.io_loop.WRITE)
             self._maybe_add_error_listener()
 
+    def supports_write_file(self):
+        """Returns true if `write_file` can be used on this stream."""
+        return _sendfile is not None
+
+    def write_file(self, fd, offset, count, callback=None):
+        """Sends part of a file to the stream without copying it.
+
+        ``count`` bytes starting at ``offset`` of the open file descriptor
+        ``fd`` are sent with ``sendfile(2)`` once any previously buffered
+        data has been written, and ``callback`` is run when they have all
+        been sent.  Nothing else may be written to the stream until then.
+        Only available if `supports_write_file` returns true.
+        """
+        assert self.supports_write_file()
+        assert self._write_file is None, "Already sending a file"
+        self._check_closed()
+        if count:
+            self._write_file = [fd, offset, count]
+        self._write_callback = stack_context.wrap(callback)
+        if not self._connecting:
+            self._handle_write()
+            if self.writing():
+                self._add_io_state(self.io_loop.WRITE)
+            self._maybe_add_error_listener()
+
     def set_close_callback(self, callback):
         """Call the given callback when the stream is closed."""
         self._close_callback = stack_context.wrap(callback)
@@ -239,6 +346,8 @@ class IOStream(object):
                 self._state = None
             self.socket.close()
             self.socket = None
+            # whatever is still queued will never be sent
+            self._change_write_buffer_size(-self._write_buffer_size)
         self._maybe_run_close_callback()
 
     def _maybe_run_close_callback(self):
@@ -256,12 +365,44 @@ class IOStream(object):
 
     def writing(self):
         """Returns true if we are currently writing to the stream."""
-        return bool(self._write_buffer)
+        return bool(self._write_buffer) or self._write_file is not None
+
+    def write_buffer_size(self):
+        """Returns the number of bytes queued but not yet sent.
+
+        Data passed to `write_file` is not counted.
+        """
+        return self._write_buffer_size
+
+    def _change_write_buffer_size(self, delta):
+        global _total_write_buffer_size
+        self._write_buffer_size += delta
+        _total_write_buffer_size += delta
 
     def closed(self):
         """Returns true if the stream has been closed."""
         return self.socket is None
 
+    def pause_reading(self):
+        """Stops reading from the socket until `resume_reading` is called.
+
+        Pending reads stay pending and can still be satisfied from data
+        that is already buffered, but nothing more is read from the
+        socket, so the peer is eventually held back by TCP flow control.
+        A closed connection is only noticed once reading resumes.
+        """
+        self._read_paused = True
+        if self._state is not None and self._state & self.io_loop.READ:
+            self._state &= ~self.io_loop.READ
+            self.io_loop.update_handler(self.socket.fileno(), self._state)
+
+    def resume_reading(self):
+        """Resumes reading after `pause_reading`."""
+        if not self._read_paused:
+            return
+        self._read_paused = False
+        self._add_io_state(self.io_loop.READ)
+
     def _handle_events(self, fd, events):
         if not self.socket:
             logging.warning("Got events for closed stream %d", fd)
@@ -287,11 +428,11 @@ class IOStream(object):
                 self.io_loop.add_callback(self.close)
                 return
             state = self.io_loop.ERROR
-            if self.reading():
+            if self.reading() and not self._read_paused:
                 state |= self.io_loop.READ
             if self.writing():
                 state |= self.io_loop.WRITE
-            if state == self.io_loop.ERROR:
+            if state == self.io_loop.ERROR and not self._read_paused:
                 state |= self.io_loop.READ
             if state != self._state:
                 assert self._state is not None, \
@@ -339,6 +480,8 @@ class IOStream(object):
             self.io_loop.add_callback(wrapper)
 
     def _handle_read(self):
+        if self._read_paused:
+            return
         try:
             try:
                 # Pretend to have a pending callback so that an EOF in
@@ -352,14 +495,21 @@ class IOStream(object):
                 # clause below (which calls `close` and does need to
                 # trigger the callback)
                 self._pending_callbacks += 1
+                budget = self.read_budget
                 while True:
                     # Read from the socket until we get EWOULDBLOCK or equivalent.
                     # SSL sockets do some internal buffering, and if the data is
                     # sitting in the SSL object's buffer select() and friends
                     # can't see it; the only way to find out if it's there is to
                     # try to read it.
-                    if self._read_to_buffer() == 0:
+                    num_bytes = self._read_to_buffer()
+                    if num_bytes == 0:
                         break
+                    if budget is not None:
+                        # leave the rest for the next IOLoop iteration
+                        budget -= num_bytes
+                        if budget <= 0:
+                            break
             finally:
                 self._pending_callbacks -= 1
         except Exception:
@@ -374,6 +524,7 @@ class IOStream(object):
     def _set_read_callback(self, callback):
         assert not self._read_callback, "Already reading"
         self._read_callback = stack_context.wrap(callback)
+        self._read_copy = True
 
     def _try_inline_read(self):
         """Attempt to complete the current read operation from buffered data.
@@ -386,13 +537,21 @@ class IOStream(object):
         if self._read_from_buffer():
             return
         self._check_closed()
+        if self._read_paused:
+            return
         try:
             # See comments in _handle_read about incrementing _pending_callbacks
             self._pending_callbacks += 1
+            budget = self.read_budget
             while True:
-                if self._read_to_buffer() == 0:
+                num_bytes = self._read_to_buffer()
+                if num_bytes == 0:
                     break
                 self._check_closed()
+                if budget is not None:
+                    budget -= num_bytes
+                    if budget <= 0:
+                        break
         finally:
             self._pending_callbacks -= 1
         if self._read_from_buffer():
@@ -406,7 +565,15 @@ class IOStream(object):
         May be overridden in subclasses.
         """
         try:
-            chunk = self.socket.recv(self.read_chunk_size)
+            if self.use_recv_into:
+                # Read into a shared scratch buffer and return a view of
+                # it, which _read_to_buffer copies into the read buffer
+                # right away; no string is allocated for the chunk.
+                buf = _get_recv_buffer(self.read_chunk_size)
+                num_bytes = self.socket.recv_into(buf, self.read_chunk_size)
+                chunk = buf[:num_bytes]
+            else:
+                chunk = self.socket.recv(self.read_chunk_size)
         except socket.error, e:
             if e.args[0] in (errno.EWOULDBLOCK, errno.EAGAIN):
                 return None
@@ -434,7 +601,8 @@ class IOStream(object):
             raise
         if chunk is None:
             return 0
-        self._read_buffer.append(chunk)
+        self._adapt_read_chunk_size(len(chunk))
+        self._read_buffer += chunk
         self._read_buffer_size += len(chunk)
         if self._read_buffer_size >= self.max_buffer_size:
             logging.error("Reached maximum read buffer size")
@@ -442,6 +610,22 @@ class IOStream(object):
             raise IOError("Reached maximum read buffer size")
         return len(chunk)
 
+    def _adapt_read_chunk_size(self, num_bytes):
+        """Sizes the next read from the size of the last one.
+
+        A read that fills the whole chunk means more data is probably
+        waiting, so the chunk doubles (up to ``max_read_chunk_size``) and
+        bulk transfers need fewer syscalls.  Reads that use less than a
+        quarter of it shrink it back towards the initial size, so small
+        messages don't pay for large buffers.
+        """
+        if num_bytes >= self.read_chunk_size:
+            self.read_chunk_size = min(self.read_chunk_size * 2,
+                                       self.max_read_chunk_size)
+        elif num_bytes < self.read_chunk_size // 4:
+            self.read_chunk_size = max(self.read_chunk_size // 2,
+                                       self.min_read_chunk_size)
+
     def _read_from_buffer(self):
         """Attempts to complete the currently-pending read from the buffer.
 
@@ -463,43 +647,30 @@ class IOStream(object):
             self._run_callback(callback, self._consume(num_bytes))
             return True
         elif self._read_delimiter is not None:
-            # Multi-byte delimiters (e.g. '\r\n') may straddle two
-            # chunks in the read buffer, so we can't easily find them
-            # without collapsing the buffer.  However, since protocols
-            # using delimited reads (as opposed to reads of a known
-            # length) tend to be "line" oriented, the delimiter is likely
-            # to be in the first few chunks.  Merge the buffer gradually
-            # since large merges are relatively expensive and get undone in
-            # consume().
-            if self._read_buffer:
-                while True:
-                    loc = self._read_buffer[0].find(self._read_delimiter)
-                    if loc != -1:
-                        callback = self._read_callback
-                        delimiter_len = len(self._read_delimiter)
-                        self._read_callback = None
-                        self._streaming_callback = None
-                        self._read_delimiter = None
-                        self._run_callback(callback,
-                                           self._consume(loc + delimiter_len))
-                        return True
-                    if len(self._read_buffer) == 1:
-                        break
-                    _double_prefix(self._read_buffer)
+            if self._read_buffer_size:
+                loc = self._read_buffer.find(self._read_delimiter,
+                                             self._read_buffer_pos)
+                if loc != -1:
+                    callback = self._read_callback
+                    delimiter_len = len(self._read_delimiter)
+                    self._read_callback = None
+                    self._streaming_callback = None
+                    self._read_delimiter = None
+                    self._run_callback(callback, self._consume(
+                        loc - self._read_buffer_pos + delimiter_len))
+                    return True
         elif self._read_regex is not None:
-            if self._read_buffer:
-                while True:
-                    m = self._read_regex.search(self._read_buffer[0])
-                    if m is not None:
-                        callback = self._read_callback
-                        self._read_callback = None
-                        self._streaming_callback = None
-                        self._read_regex = None
-                        self._run_callback(callback, self._consume(m.end()))
-                        return True
-                    if len(self._read_buffer) == 1:
-                        break
-                    _double_prefix(self._read_buffer)
+            if self._read_buffer_size:
+                # "^" only matches at the real start of the buffer
+                self._compact_read_buffer()
+                m = self._read_regex.search(self._read_buffer)
+                if m is not None:
+                    callback = self._read_callback
+                    self._read_callback = None
+                    self._streaming_callback = None
+                    self._read_regex = None
+                    self._run_callback(callback, self._consume(m.end()))
+                    return True
         return False
 
     def _handle_connect(self):
@@ -523,6 +694,10 @@ class IOStream(object):
     def _handle_write(self):
         while self._write_buffer:
             try:
+                if self._vectored_writes:
+                    if not self._write_buffers_vectored():
+                        break
+                    continue
                 if not self._write_buffer_frozen:
                     # On windows, socket.send blows up if given a
                     # write buffer that's too large, instead of just
@@ -543,6 +718,7 @@ class IOStream(object):
                     self._write_buffer_frozen = True
                     break
                 self._write_buffer_frozen = False
+                self._change_write_buffer_size(-num_bytes)
                 _merge_prefix(self._write_buffer, num_bytes)
                 self._write_buffer.popleft()
             except socket.error, e:
@@ -554,17 +730,96 @@ class IOStream(object):
                                     self.socket.fileno(), e)
                     self.close()
                     return
-        if not self._write_buffer and self._write_callback:
+        if not self._write_buffer and self._write_file is not None:
+            if not self._write_from_file():
+                return
+        if not self.writing() and self._write_callback:
             callback = self._write_callback
             self._write_callback = None
             self._run_callback(callback)
 
+    def _write_buffers_vectored(self):
+        """Sends the front of the write buffer with one sendmsg call.
+
+        Returns False if the socket could not take everything.
+        """
+        buffers = list(itertools.islice(self._write_buffer,
+                                        _SENDMSG_MAX_BUFFERS))
+        num_bytes = self.socket.sendmsg(buffers)
+        self._change_write_buffer_size(-num_bytes)
+        for data in buffers:
+            if num_bytes < len(data):
+                if num_bytes:
+                    self._write_buffer[0] = memoryview(data)[num_bytes:]
+                return False
+            num_bytes -= len(data)
+            self._write_buffer.popleft()
+        return True
+
+    def _write_from_file(self):
+        """Sends as much of the pending file as the socket accepts.
+
+        Returns False if the stream was closed.
+        """
+        while self._write_file is not None:
+            fd, offset, count = self._write_file
+            try:
+                num_bytes = _sendfile(self.socket.fileno(), fd, offset, count)
+            except (socket.error, OSError), e:
+                if e.args[0] in (errno.EWOULDBLOCK, errno.EAGAIN):
+                    return True
+                logging.warning("Write error on %d: %s",
+                                self.socket.fileno(), e)
+                self.close()
+                return False
+            if num_bytes == 0:
+                logging.warning("File shrank while being sent on %d",
+                                self.socket.fileno())
+                self.close()
+                return False
+            if num_bytes >= count:
+                self._write_file = None
+            else:
+                self._write_file = [fd, offset + num_bytes, count - num_bytes]
+        return True
+
     def _consume(self, loc):
+        """Removes and returns the first ``loc`` bytes of the read buffer.
+
+        Returns a string, or a bytearray the caller owns if the current
+        read was started with ``copy=False``.
+        """
         if loc == 0:
-            return b("")
-        _merge_prefix(self._read_buffer, loc)
+            return b("") if self._read_copy else bytearray()
+        buf = self._read_buffer
+        start = self._read_buffer_pos
+        end = start + loc
         self._read_buffer_size -= loc
-        return self._read_buffer.popleft()
+        if self._read_copy:
+            data = memoryview(buf)[start:end].tobytes()
+        elif loc >= self._read_buffer_size:
+            # Hand the buffer itself over and keep the (smaller) rest
+            self._read_buffer = buf[end:]
+            self._read_buffer_pos = 0
+            if start:
+                del buf[:start]
+            del buf[loc:]
+            return buf
+        else:
+            data = buf[start:end]
+        self._read_buffer_pos = end
+        if not self._read_buffer_size:
+            del buf[:]
+            self._read_buffer_pos = 0
+        elif end > 65536 and end > self._read_buffer_size:
+            # Drop consumed data once it outweighs what is left
+            self._compact_read_buffer()
+        return data
+
+    def _compact_read_buffer(self):
+        if self._read_buffer_pos:
+            del self._read_buffer[:self._read_buffer_pos]
+            self._read_buffer_pos = 0
 
     def _check_closed(self):
         if not self.socket:
@@ -601,6 +856,8 @@ class IOStream(object):
         if self.socket is None:
             # connection has been closed, so there can be no future events
             return
+        if self._read_paused:
+            state &= ~ioloop.IOLoop.READ
         if self._state is None:
             self._state = ioloop.IOLoop.ERROR | state
             with stack_context.NullContext():
@@ -630,6 +887,12 @@ class SSLIOStream(IOStream):
         """
         self._ssl_options = kwargs.pop('ssl_options', {})
         super(SSLIOStream, self).__init__(*args, **kwargs)
+        # SSL sockets can't sendmsg, and after a partial write OpenSSL
+        # must be given the very same buffer again
+        self._vectored_writes = False
+        # data left in the SSL object's buffer is invisible to the IOLoop,
+        # so each read has to drain the socket
+        self.read_budget = None
         self._ssl_accepting = True
         self._handshake_reading = False
         self._handshake_writing = False
@@ -641,6 +904,10 @@ class SSLIOStream(IOStream):
     def writing(self):
         return self._handshake_writing or super(SSLIOStream, self).writing()
 
+    def supports_write_file(self):
+        # sendfile would bypass the encryption
+        return False
+
     def _do_ssl_handshake(self):
         # Based on code from test_ssl.py in the python stdlib
         try:
@@ -737,15 +1004,6 @@ class SSLIOStream(IOStream):
         return chunk
 
 
-def _double_prefix(deque):
-    """Grow by doubling, but don't split the second chunk just because the
-    first one is small.
-    """
-    new_len = max(len(deque[0]) * 2,
-                  (len(deque[0]) + len(deque[1])))
-    _merge_prefix(deque, new_len)
-
-
 def _merge_prefix(deque, size):
     """Replace the first entries in a deque of strings with a single
     string of up to size bytes.
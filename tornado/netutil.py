@@ -29,6 +29,9 @@ from tornado.ioloop import IOLoop
 from tornado.iostream import IOStream, SSLIOStream
 from tornado.platform.auto import set_close_exec
 
+# Connections accepted per listening socket per IOLoop iteration
+_DEFAULT_MAX_ACCEPTS = 128
+
 try:
     import ssl  # Python 2.6+
 except ImportError:
@@ -84,10 +87,15 @@ class TCPServer(object):
        also be used in single-process servers if you want to create
        your listening sockets in some way other than
        `bind_sockets`.
+
+    ``max_accepts`` limits how many connections are accepted from one
+    listening socket per `IOLoop` iteration (see `add_accept_handler`).
     """
-    def __init__(self, io_loop=None, ssl_options=None):
+    def __init__(self, io_loop=None, ssl_options=None,
+                 max_accepts=_DEFAULT_MAX_ACCEPTS):
         self.io_loop = io_loop
         self.ssl_options = ssl_options
+        self.max_accepts = max_accepts
         self._sockets = {}  # fd -> socket object
         self._pending_sockets = []
         self._started = False
@@ -109,15 +117,18 @@ class TCPServer(object):
                 raise ValueError('keyfile "%s" does not exist' %
                     self.ssl_options['keyfile'])
 
-    def listen(self, port, address=""):
+    def listen(self, port, address="", backlog=128):
         """Starts accepting connections on the given port.
 
         This method may be called more than once to listen on multiple ports.
         `listen` takes effect immediately; it is not necessary to call
         `TCPServer.start` afterwards.  It is, however, necessary to start
         the `IOLoop`.
+
+        The ``backlog`` argument has the same meaning as for
+        `socket.listen`.
         """
-        sockets = bind_sockets(port, address=address)
+        sockets = bind_sockets(port, address=address, backlog=backlog)
         self.add_sockets(sockets)
 
     def add_sockets(self, sockets):
@@ -135,7 +146,8 @@ class TCPServer(object):
         for sock in sockets:
             self._sockets[sock.fileno()] = sock
             add_accept_handler(sock, self._handle_connection,
-                               io_loop=self.io_loop)
+                               io_loop=self.io_loop,
+                               max_accepts=self.max_accepts)
 
     def add_socket(self, socket):
         """Singular version of `add_sockets`.  Takes a single socket object."""
@@ -319,7 +331,8 @@ if hasattr(socket, 'AF_UNIX'):
         return sock
 
 
-def add_accept_handler(sock, callback, io_loop=None):
+def add_accept_handler(sock, callback, io_loop=None,
+                       max_accepts=_DEFAULT_MAX_ACCEPTS):
     """Adds an ``IOLoop`` event handler to accept new connections on ``sock``.
 
     When a connection is accepted, ``callback(connection, address)`` will
@@ -327,17 +340,27 @@ def add_accept_handler(sock, callback, io_loop=None):
     address of the other end of the connection).  Note that this signature
     is different from the ``callback(fd, events)`` signature used for
     ``IOLoop`` handlers.
+
+    At most ``max_accepts`` connections are accepted each time the socket
+    becomes readable, so a burst of new connections can't starve the
+    ones already open; the rest stay in the listen backlog until the
+    next `IOLoop` iteration.  ``None`` accepts until the backlog is empty.
     """
     if io_loop is None:
         io_loop = IOLoop.instance()
 
     def accept_handler(fd, events):
-        while True:
+        accepted = 0
+        while max_accepts is None or accepted < max_accepts:
             try:
                 connection, address = sock.accept()
             except socket.error, e:
                 if e.args[0] in (errno.EWOULDBLOCK, errno.EAGAIN):
                     return
+                if e.args[0] == errno.ECONNABORTED:
+                    # The client went away while in the backlog
+                    continue
                 raise
+            accepted += 1
             callback(connection, address)
     io_loop.add_handler(sock.fileno(), accept_handler, IOLoop.READ)
@@ -2,10 +2,13 @@
 
 
 from __future__ import absolute_import, division, with_statement
+import os
+import subprocess
+import sys
 import tornado.escape
 import unittest
 
-from tornado.escape import utf8, xhtml_escape, xhtml_unescape, url_escape, url_unescape, to_unicode, json_decode, json_encode
+from tornado.escape import utf8, xhtml_escape, xhtml_unescape, url_escape, url_unescape, to_unicode, json_decode, json_encode, json_compact_encode, set_json_backend
 from tornado.util import b
 
 linkify_tests = [
@@ -197,3 +200,61 @@ class EscapeTestCase(unittest.TestCase):
         self.assertEqual(json_decode(json_encode(u"\u00e9")), u"\u00e9")
         self.assertEqual(json_decode(json_encode(utf8(u"\u00e9"))), u"\u00e9")
         self.assertRaises(UnicodeDecodeError, json_encode, b("\xe9"))
+
+    def test_json_compact_encode(self):
+        self.assertEqual(json_compact_encode({"a": [1, 2]}), '{"a":[1,2]}')
+        self.assertEqual(json_decode(json_compact_encode(u"\u00e9</")),
+                         u"\u00e9</")
+
+    def test_set_json_backend(self):
+        original = tornado.escape.json_backend
+        try:
+            self.assertEqual(set_json_backend("json"), "json")
+            self.assertEqual(tornado.escape.json_backend, "json")
+            self.assertEqual(json_decode(json_encode({"a": 1})), {u"a": 1})
+            self.assertRaises(ValueError, set_json_backend, "nosuchjson")
+            self.assertEqual(tornado.escape.json_backend, "json")
+        finally:
+            set_json_backend(original)
+
+    def test_default_json_backend(self):
+        # faster backends behave differently, so importing tornado.escape
+        # never switches to one just because it is installed
+        code = ("import sys, types; "
+                "ujson = sys.modules['ujson'] = types.ModuleType('ujson'); "
+                "ujson.loads = ujson.dumps = repr; "
+                "import tornado.escape; "
+                "sys.stdout.write(tornado.escape.json_backend)")
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        output = subprocess.Popen([sys.executable, "-c", code], cwd=root,
+                                  stdout=subprocess.PIPE).communicate()[0]
+        self.assertEqual(output, b("json"))
+
+
+class JSONBackendTestMixin(object):
+    # runs the EscapeTestCase tests with another json backend, if installed
+    backend = None
+
+    def setUp(self):
+        super(JSONBackendTestMixin, self).setUp()
+        self.original_backend = tornado.escape.json_backend
+        try:
+            set_json_backend(self.backend)
+        except ImportError:
+            self.skipTest("%s is not installed" % self.backend)
+
+    def tearDown(self):
+        set_json_backend(self.original_backend)
+        super(JSONBackendTestMixin, self).tearDown()
+
+
+class StdlibJSONEscapeTest(JSONBackendTestMixin, EscapeTestCase):
+    backend = "json"
+
+
+class SimpleJSONEscapeTest(JSONBackendTestMixin, EscapeTestCase):
+    backend = "simplejson"
+
+
+class UJSONEscapeTest(JSONBackendTestMixin, EscapeTestCase):
+    backend = "ujson"
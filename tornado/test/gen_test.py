@@ -45,6 +45,11 @@ class GenTest(AsyncTestCase):
             self.stop()
         self.run_gen(f)
 
+    def test_wrapped(self):
+        def f(a, b=None):
+            pass
+        self.assertTrue(gen.engine(f).__wrapped__ is f)
+
     def test_exception_phase1(self):
         @gen.engine
         def f():
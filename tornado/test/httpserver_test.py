@@ -393,3 +393,34 @@ class UnixSocketTest(AsyncTestCase, LogTrapTestCase):
 
 if not hasattr(socket, 'AF_UNIX') or sys.platform == 'cygwin':
     del UnixSocketTest
+
+
+class AcceptBatchTest(AsyncTestCase, LogTrapTestCase):
+    def test_max_accepts(self):
+        [sock] = netutil.bind_sockets(0, "127.0.0.1", family=socket.AF_INET)
+        port = sock.getsockname()[1]
+        accepted = []
+        batches = []
+
+        def on_accept(connection, address):
+            accepted.append(connection)
+            if len(accepted) == 1:
+                # runs after the current accept_handler call returns
+                self.io_loop.add_callback(
+                    lambda: batches.append(len(accepted)))
+            if len(accepted) == 3:
+                self.stop()
+        netutil.add_accept_handler(sock, on_accept, io_loop=self.io_loop,
+                                   max_accepts=2)
+
+        clients = []
+        for i in range(3):
+            client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            client.connect(("127.0.0.1", port))
+            clients.append(client)
+        self.wait()
+        self.assertEqual(batches, [2])
+
+        self.io_loop.remove_handler(sock.fileno())
+        for s in clients + accepted + [sock]:
+            s.close()
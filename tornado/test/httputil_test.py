@@ -2,6 +2,7 @@
 
 
 from __future__ import absolute_import, division, with_statement
+from tornado import httputil
 from tornado.httputil import url_concat, parse_multipart_form_data, HTTPHeaders
 from tornado.escape import utf8
 from tornado.testing import LogTrapTestCase
@@ -220,3 +221,23 @@ Foo: even
                          [("Asdf", "qwer zxcv"),
                           ("Foo", "bar baz"),
                           ("Foo", "even more lines")])
+
+    def test_parse(self):
+        data = ("content-type: text/html\r\n"
+                "X-FORWARDED-FOR: 1.2.3.4\r\n"
+                "Set-Cookie: A=B\r\n"
+                "set-cookie:C=D\r\n")
+        headers = HTTPHeaders.parse(data)
+        self.assertEqual(sorted(headers.keys()),
+                         ["Content-Type", "Set-Cookie", "X-Forwarded-For"])
+        self.assertEqual(headers["X-Forwarded-For"], "1.2.3.4")
+        self.assertEqual(headers.get_list("Set-Cookie"), ["A=B", "C=D"])
+        self.assertRaises(ValueError, HTTPHeaders.parse, "Foo\r\n")
+
+    def test_normalize_cache_is_bounded(self):
+        for i in range(httputil._NORMALIZED_HEADERS_MAX + 10):
+            HTTPHeaders.parse("x-test-%d: %d\r\n" % (i, i))
+        self.assertEqual(len(httputil._normalized_headers),
+                         httputil._NORMALIZED_HEADERS_MAX)
+        self.assertEqual(HTTPHeaders._normalize_name("x-test-%d" % i),
+                         "X-Test-%d" % i)
@@ -1,7 +1,7 @@
 from __future__ import absolute_import, division, with_statement
 from tornado import netutil
 from tornado.ioloop import IOLoop
-from tornado.iostream import IOStream, SSLIOStream
+from tornado.iostream import IOStream, SSLIOStream, total_write_buffer_size
 from tornado.testing import AsyncHTTPTestCase, AsyncHTTPSTestCase, AsyncTestCase, LogTrapTestCase, get_unused_port
 from tornado.util import b
 from tornado.web import RequestHandler, Application
@@ -404,6 +404,144 @@ class TestIOStream(TestIOStreamMixin, AsyncTestCase, LogTrapTestCase):
     def _make_client_iostream(self, connection, **kwargs):
         return IOStream(connection, io_loop=self.io_loop, **kwargs)
 
+    def test_adaptive_read_chunk_size(self):
+        server, client = self.make_iostream_pair(max_read_chunk_size=16384)
+        try:
+            sizes = []
+            for num_bytes in (4096, 8192, 16384, 100, 3000, 10, 10):
+                server._adapt_read_chunk_size(num_bytes)
+                sizes.append(server.read_chunk_size)
+            self.assertEqual(sizes, [8192, 16384, 16384, 8192, 8192,
+                                     4096, 4096])
+
+            client.write(b("A") * 1024 * 1024)
+            server.read_bytes(1024 * 1024, self.stop)
+            self.assertEqual(len(self.wait()), 1024 * 1024)
+        finally:
+            server.close()
+            client.close()
+
+    def test_recv_into(self):
+        server, client = self.make_iostream_pair(use_recv_into=True)
+        try:
+            data = b("").join(b(chr(i % 256)) for i in xrange(200000))
+            client.write(data)
+            server.read_bytes(len(data), self.stop)
+            self.assertEqual(self.wait(), data)
+            client.write(b("ping\r\n"))
+            server.read_until(b("\r\n"), self.stop)
+            self.assertEqual(self.wait(), b("ping\r\n"))
+            client.close()
+            server.read_until_close(self.stop)
+            self.assertEqual(self.wait(), b(""))
+        finally:
+            server.close()
+            client.close()
+
+    def test_read_bytes_no_copy(self):
+        server, client = self.make_iostream_pair()
+        try:
+            client.write(b("abcdefghij"))
+            server.read_bytes(4, self.stop)
+            self.assertEqual(self.wait(), b("abcd"))
+            # more than half of what is buffered: the buffer is handed over
+            server.read_bytes(4, self.stop, copy=False)
+            data = self.wait()
+            self.assertEqual(data, bytearray(b("efgh")))
+            data[0] = ord("X")
+            server.read_bytes(2, self.stop, copy=False)
+            self.assertEqual(self.wait(), bytearray(b("ij")))
+
+            client.write(b("klmnopqrst"))
+            server.read_bytes(2, self.stop, copy=False)
+            self.assertEqual(self.wait(), bytearray(b("kl")))
+            server.read_until(b("t"), self.stop)
+            self.assertEqual(self.wait(), b("mnopqrst"))
+        finally:
+            server.close()
+            client.close()
+
+    def test_write_buffer_size(self):
+        server, client = self.make_iostream_pair()
+        try:
+            data = b("x") * 10 * 1024 * 1024
+            client.write(data)
+            # the peer is not reading, so most of it stays queued
+            self.assertTrue(0 < client.write_buffer_size() <= len(data))
+            self.assertTrue(total_write_buffer_size() >=
+                            client.write_buffer_size())
+            server.read_bytes(len(data), self.stop)
+            self.assertEqual(len(self.wait()), len(data))
+            self.assertEqual(client.write_buffer_size(), 0)
+        finally:
+            server.close()
+            client.close()
+
+    def test_total_write_buffer_size(self):
+        server, client = self.make_iostream_pair()
+        try:
+            before = total_write_buffer_size()
+            client.write(b("x") * 10 * 1024 * 1024)
+            queued = client.write_buffer_size()
+            self.assertTrue(queued > 0)
+            self.assertEqual(total_write_buffer_size(), before + queued)
+            # closing drops what could not be sent
+            client.close()
+            self.assertEqual(client.write_buffer_size(), 0)
+            self.assertEqual(total_write_buffer_size(), before)
+        finally:
+            server.close()
+            client.close()
+
+    def test_pause_reading(self):
+        server, client = self.make_iostream_pair()
+        try:
+            server.pause_reading()
+            client.write(b("abc"))
+            server.read_bytes(3, self.stop)
+            self.io_loop.add_timeout(time.time() + 0.05, self.stop)
+            self.assertEqual(self.wait(), None)
+            self.assertTrue(server.reading())
+            server.resume_reading()
+            self.assertEqual(self.wait(), b("abc"))
+        finally:
+            server.close()
+            client.close()
+
+    def test_vectored_writes(self):
+        class SendmsgSocket(object):
+            # sends at most `limit` bytes per call, like a full socket
+            def __init__(self, sock, limit):
+                self.sock = sock
+                self.limit = limit
+                self.calls = []
+
+            def sendmsg(self, buffers):
+                self.calls.append(len(buffers))
+                data = b("").join(
+                    buf.tobytes() if isinstance(buf, memoryview) else buf
+                    for buf in buffers)
+                return self.sock.send(data[:self.limit])
+
+            def __getattr__(self, name):
+                return getattr(self.sock, name)
+
+        server, client = self.make_iostream_pair()
+        try:
+            client._vectored_writes = True
+            client.socket = SendmsgSocket(client.socket, 1000)
+            payload = b("").join(b(chr(i % 256)) for i in xrange(20000))
+            client.writelines([b("head"), payload, b(""), b("tail")],
+                              callback=self.stop)
+            self.wait()
+            self.assertEqual(client.socket.calls[0], 3)
+            self.assertTrue(len(client.socket.calls) >= 20)
+            server.read_bytes(20008, self.stop)
+            self.assertEqual(self.wait(), b("head") + payload + b("tail"))
+        finally:
+            server.close()
+            client.close()
+
 
 class TestIOStreamSSL(TestIOStreamMixin, AsyncTestCase, LogTrapTestCase):
     def _make_server_iostream(self, connection, **kwargs):
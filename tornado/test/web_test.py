@@ -1,5 +1,7 @@
 from __future__ import absolute_import, division, with_statement
 from tornado import gen
+from tornado import iostream
+from tornado import web
 from tornado.escape import json_decode, utf8, to_unicode, recursive_unicode, native_str, to_basestring
 from tornado.iostream import IOStream
 from tornado.template import DictLoader
@@ -11,8 +13,10 @@ import binascii
 import logging
 import os
 import re
+import shutil
 import socket
 import sys
+import tempfile
 
 
 class SimpleHandlerTestCase(AsyncHTTPTestCase):
@@ -760,6 +764,270 @@ class StaticFileTest(AsyncHTTPTestCase, LogTrapTestCase):
         self.assertTrue('Last-Modified' not in response2.headers)
 
 
+class StaticFileCacheTest(AsyncHTTPTestCase, LogTrapTestCase):
+    def setUp(self):
+        self.static_dir = tempfile.mkdtemp()
+        self.write_file("a.js", "var a = 1;" * 100)
+        StaticFileHandler.reset()
+        super(StaticFileCacheTest, self).setUp()
+
+    def tearDown(self):
+        super(StaticFileCacheTest, self).tearDown()
+        StaticFileHandler.reset()
+        shutil.rmtree(self.static_dir)
+
+    def get_app(self):
+        return Application(static_path=self.static_dir, gzip=True)
+
+    def write_file(self, name, content, mtime=None):
+        path = os.path.join(self.static_dir, name)
+        with open(path, "wb") as f:
+            f.write(utf8(content))
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+
+    def test_cache_hit(self):
+        response1 = self.fetch("/static/a.js")
+        response2 = self.fetch("/static/a.js")
+        self.assertEqual(response1.body, response2.body)
+        self.assertEqual(response1.headers["Etag"], response2.headers["Etag"])
+        stats = StaticFileHandler.cache_stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+
+    def test_invalidated_on_mtime_change(self):
+        self.write_file("b.txt", "old", mtime=1000000000)
+        self.assertEqual(self.fetch("/static/b.txt").body, b("old"))
+        self.write_file("b.txt", "new", mtime=1000000100)
+        self.assertEqual(self.fetch("/static/b.txt").body, b("new"))
+
+    def test_pregzipped(self):
+        response = self.fetch("/static/a.js", use_gzip=False,
+                              headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(response.headers["Vary"], "Accept-Encoding")
+        self.assertTrue(len(response.body) < 1000)
+        response = self.fetch("/static/a.js", use_gzip=False)
+        self.assertTrue("Content-Encoding" not in response.headers)
+        self.assertEqual(response.body, b("var a = 1;" * 100))
+
+    def test_precompressed_sibling(self):
+        self.write_file("b.css", "body {}" * 10, mtime=1000000000)
+        self.write_file("b.css.gz", "precompressed", mtime=1000000000)
+        response = self.fetch("/static/b.css", use_gzip=False,
+                              headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(response.body, b("precompressed"))
+        # a stale .gz file is ignored
+        self.write_file("b.css", "body {}" * 10, mtime=1000000100)
+        response = self.fetch("/static/b.css", use_gzip=False,
+                              headers={"Accept-Encoding": "gzip"})
+        self.assertNotEqual(response.body, b("precompressed"))
+
+    def test_gzip_etag(self):
+        gzipped = self.fetch("/static/a.js", use_gzip=False,
+                             headers={"Accept-Encoding": "gzip"})
+        identity = self.fetch("/static/a.js", use_gzip=False)
+        self.assertEqual(gzipped.headers["Etag"],
+                         identity.headers["Etag"][:-1] + '-gz"')
+        self.assertEqual(identity.headers["Vary"], "Accept-Encoding")
+
+    def check_range_with_sibling(self, name, content):
+        response = self.fetch("/static/" + name, use_gzip=False,
+                              headers={"Accept-Encoding": "gzip",
+                                       "Range": "bytes=10-19"})
+        self.assertEqual(response.code, 206)
+        self.assertTrue("Content-Encoding" not in response.headers)
+        self.assertEqual(response.headers["Vary"], "Accept-Encoding")
+        self.assertEqual(response.headers["Content-Range"],
+                         "bytes 10-19/%d" % len(content))
+        self.assertEqual(response.body, b(content[10:20]))
+
+    def test_range_precompressed_sibling(self):
+        content = "body {}" * 10
+        self.write_file("b.css", content, mtime=1000000000)
+        self.write_file("b.css.gz", "precompressed", mtime=1000000000)
+        self.check_range_with_sibling("b.css", content)
+
+    def test_large_file_precompressed_sibling(self):
+        content = self.make_large_file()
+        self.write_file("large.txt.gz", "precompressed")
+        response = self.fetch("/static/large.txt", use_gzip=False,
+                              headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(response.body, b("precompressed"))
+        self.assertEqual(response.headers["Etag"][-4:], '-gz"')
+        response = self.fetch("/static/large.txt", use_gzip=False)
+        self.assertEqual(response.body, b(content))
+        self.assertEqual(response.headers["Vary"], "Accept-Encoding")
+        self.check_range_with_sibling("large.txt", content)
+
+    def test_large_file_not_cached(self):
+        self.write_file("big.txt",
+                        "x" * (StaticFileHandler.FILE_CACHE_MAX_FILE_SIZE + 1))
+        response = self.fetch("/static/big.txt")
+        self.assertEqual(len(response.body),
+                         StaticFileHandler.FILE_CACHE_MAX_FILE_SIZE + 1)
+        self.assertEqual(StaticFileHandler.cache_stats()["entries"], 0)
+
+    def test_range(self):
+        response = self.fetch("/static/a.js", headers={"Range": "bytes=2-4"})
+        self.assertEqual(response.code, 206)
+        self.assertEqual(response.body, b("r a"))
+        self.assertEqual(response.headers["Content-Range"], "bytes 2-4/1000")
+        response = self.fetch("/static/a.js", headers={"Range": "bytes=-3"})
+        self.assertEqual(response.body, b(" 1;"))
+        response = self.fetch("/static/a.js", headers={"Range": "bytes=1000-"})
+        self.assertEqual(response.code, 416)
+        self.assertEqual(response.headers["Content-Range"], "bytes */1000")
+
+    def test_range_not_gzipped(self):
+        content = "".join(chr(ord("a") + i % 26) for i in range(1010))
+        self.write_file("c.js", content)
+        response = self.fetch("/static/c.js", use_gzip=False,
+                              headers={"Accept-Encoding": "gzip",
+                                       "Range": "bytes=1000-1009"})
+        self.assertEqual(response.code, 206)
+        self.assertTrue("Content-Encoding" not in response.headers)
+        self.assertEqual(response.headers["Content-Range"],
+                         "bytes 1000-1009/1010")
+        self.assertEqual(response.body, b(content[1000:1010]))
+
+    def test_invalid_range(self):
+        # last < first makes the header invalid, so it is ignored
+        response = self.fetch("/static/a.js", headers={"Range": "bytes=5-3"})
+        self.assertEqual(response.code, 200)
+        self.assertTrue("Content-Range" not in response.headers)
+        self.assertEqual(response.body, b("var a = 1;" * 100))
+
+    def make_large_file(self):
+        size = StaticFileHandler.FILE_CACHE_MAX_FILE_SIZE + 10
+        content = "".join(chr(ord("a") + i % 26) for i in range(size))
+        self.write_file("large.txt", content)
+        return content
+
+    def check_large_file(self, content):
+        response = self.fetch("/static/large.txt")
+        self.assertEqual(response.body, b(content))
+        response = self.fetch("/static/large.txt",
+                              headers={"Range": "bytes=100000-100009"})
+        self.assertEqual(response.code, 206)
+        self.assertEqual(response.body, b(content[100000:100010]))
+        response = self.fetch("/static/large.txt", method="HEAD")
+        self.assertEqual(int(response.headers["Content-Length"]),
+                         len(content))
+        self.assertEqual(StaticFileHandler.cache_stats()["entries"], 0)
+
+    def test_large_file_mmap(self):
+        content = self.make_large_file()
+        original = iostream._sendfile
+        iostream._sendfile = None
+        try:
+            self.check_large_file(content)
+        finally:
+            iostream._sendfile = original
+
+    def test_large_file_sendfile(self):
+        def fake_sendfile(out_fd, in_fd, offset, count):
+            os.lseek(in_fd, offset, os.SEEK_SET)
+            return os.write(out_fd, os.read(in_fd, min(count, 65536)))
+        content = self.make_large_file()
+        original = iostream._sendfile
+        iostream._sendfile = original or fake_sendfile
+        try:
+            self.check_large_file(content)
+        finally:
+            iostream._sendfile = original
+
+
+class GZipSettingsTest(AsyncHTTPTestCase, LogTrapTestCase):
+    def get_app(self):
+        test = self
+
+        class TextHandler(RequestHandler):
+            def get(self, length):
+                self.set_header("Content-Type", "text/plain")
+                self.write("a" * int(length))
+
+            def on_finish(self):
+                test.compression_time = getattr(self.request,
+                                                "compression_time", None)
+
+        return Application([("/text/([0-9]+)", TextHandler)],
+                           gzip=True, gzip_level=1, gzip_min_length=100)
+
+    def test_min_length(self):
+        response = self.fetch("/text/99", use_gzip=False,
+                              headers={"Accept-Encoding": "gzip"})
+        self.assertTrue("Content-Encoding" not in response.headers)
+        self.assertTrue(self.compression_time is None)
+        response = self.fetch("/text/100", use_gzip=False,
+                              headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertTrue(self.compression_time >= 0)
+
+
+class RouteTableTest(AsyncHTTPTestCase, LogTrapTestCase):
+    def get_app(self):
+        test = self
+
+        class EchoHandler(RequestHandler):
+            def get(self, *args, **kwargs):
+                test.transforms = self._transforms
+                self.write(dict(args=args, kwargs=kwargs))
+
+        class RawHandler(RequestHandler):
+            _uses_transforms = False
+
+            def get(self):
+                test.transforms = self._transforms
+                self.write("raw")
+
+        return Application([
+            ("/shadowed", EchoHandler),
+            ("/literal", EchoHandler),
+            (r"/literal\.txt", EchoHandler),
+            ("/raw", RawHandler),
+            ("/(shadowed)", EchoHandler),
+            ("/pos/([^/]+)/?([^/]+)?", EchoHandler),
+            ("/named/(?P<name>[^/]+)", EchoHandler),
+            ], gzip=True)
+
+    def test_literal(self):
+        table = self._app._get_route_table(self._app.handlers[0][1])
+        self.assertEqual(sorted(table.literals),
+                         ["/literal", "/literal.txt", "/raw", "/shadowed"])
+        self.assertEqual(json_decode(self.fetch("/literal").body),
+                         dict(args=[], kwargs={}))
+        self.assertEqual(self.fetch("/literalXtxt").code, 404)
+        self.assertEqual(len(self.transforms), 2)
+
+    def test_first_match_wins(self):
+        # /shadowed is also matched by /(shadowed), which comes later
+        self.assertEqual(json_decode(self.fetch("/shadowed").body),
+                         dict(args=[], kwargs={}))
+
+    def test_groups(self):
+        for i in range(2):
+            self.assertEqual(json_decode(self.fetch("/pos/a%20b").body),
+                             dict(args=["a b", None], kwargs={}))
+            self.assertEqual(json_decode(self.fetch("/named/c").body),
+                             dict(args=[], kwargs={"name": "c"}))
+            self.assertEqual(self.fetch("/missing").code, 404)
+        table = self._app._get_route_table(self._app.handlers[0][1])
+        self.assertEqual(table.cache.stats()["hits"], 3)
+
+    def test_add_handlers(self):
+        self.assertEqual(self.fetch("/added").code, 404)
+        self._app.add_handlers(".*$", [("/added", web.RedirectHandler,
+                                        {"url": "/literal"})])
+        self.assertEqual(self.fetch("/added", follow_redirects=False).code,
+                         301)
+
+    def test_skip_transforms(self):
+        self.assertEqual(self.fetch("/raw").body, b("raw"))
+        self.assertEqual(self.transforms, [])
+
+
 class CustomStaticFileTest(AsyncHTTPTestCase, LogTrapTestCase):
     def get_app(self):
         class MyStaticFileHandler(StaticFileHandler):
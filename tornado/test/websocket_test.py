@@ -0,0 +1,215 @@
+from __future__ import absolute_import, division, with_statement
+from tornado.iostream import IOStream
+from tornado.testing import AsyncHTTPTestCase, LogTrapTestCase
+from tornado.util import b
+from tornado.web import Application
+from tornado.websocket import WebSocketHandler, _websocket_mask
+import socket
+import struct
+import unittest
+
+MASK = b("\x12\x34\x56\x78")
+
+
+def masked_frame(opcode, payload, fin=True):
+    length = len(payload)
+    first = (0x80 if fin else 0) | opcode
+    if length < 126:
+        header = struct.pack("BB", first, 0x80 | length)
+    elif length <= 0xFFFF:
+        header = struct.pack("!BBH", first, 0x80 | 126, length)
+    else:
+        header = struct.pack("!BBQ", first, 0x80 | 127, length)
+    masked = bytearray(payload)
+    _websocket_mask(MASK, masked, 0, length)
+    return header + MASK + bytes(masked)
+
+
+class EchoHandler(WebSocketHandler):
+    def on_message(self, message):
+        self.write_message(message, binary=isinstance(message, bytes))
+
+
+class CountingEchoHandler(EchoHandler):
+    received = []
+
+    def on_message(self, message):
+        self.received.append(message)
+        EchoHandler.on_message(self, message)
+
+
+class ReleasingHandler(WebSocketHandler):
+    def open(self):
+        self.user_agent = self.request.headers.get("User-Agent")
+        self.release_request()
+
+    def on_message(self, message):
+        self.write_message("%s %s %s" % (self.request.path,
+                                         self.request.headers,
+                                         self.user_agent))
+
+
+class RefusingHandler(EchoHandler):
+    def accept_upgrade(self):
+        return False
+
+
+class WebSocketTestMixin(object):
+    def connect(self, first_frames=b(""), path="/echo"):
+        stream = IOStream(socket.socket(), io_loop=self.io_loop)
+        stream.connect(("localhost", self.get_http_port()), self.stop)
+        self.wait()
+        stream.write(b("GET " + path + " HTTP/1.1\r\n"
+                       "Host: localhost\r\n"
+                       "Upgrade: websocket\r\n"
+                       "Connection: Upgrade\r\n"
+                       "User-Agent: test\r\n"
+                       "Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n"
+                       "Sec-WebSocket-Version: 13\r\n\r\n") + first_frames)
+        stream.read_until(b("\r\n\r\n"), self.stop)
+        response = self.wait()
+        self.assertTrue(response.startswith(b("HTTP/1.1 101")))
+        self.assertTrue(b("s3pPLMBiTxaQ9kYGzzhZRbK+xOo=") in response)
+        return stream
+
+    def read_frame(self, stream):
+        stream.read_bytes(2, self.stop)
+        header, length = struct.unpack("BB", self.wait())
+        if length == 126:
+            stream.read_bytes(2, self.stop)
+            length = struct.unpack("!H", self.wait())[0]
+        elif length == 127:
+            stream.read_bytes(8, self.stop)
+            length = struct.unpack("!Q", self.wait())[0]
+        stream.read_bytes(length, self.stop)
+        return header & 0xf, self.wait()
+
+
+class WebSocketFrameTest(WebSocketTestMixin, AsyncHTTPTestCase,
+                         LogTrapTestCase):
+    def get_app(self):
+        return Application([("/echo", EchoHandler),
+                            ("/release", ReleasingHandler),
+                            ("/refuse", RefusingHandler)])
+
+    def test_many_frames_per_read(self):
+        stream = self.connect()
+        stream.write(b("").join(masked_frame(0x1, b("message %d") % i)
+                                for i in range(50)))
+        for i in range(50):
+            self.assertEqual(self.read_frame(stream),
+                             (0x1, b("message %d") % i))
+        stream.close()
+
+    def test_frames_with_handshake(self):
+        stream = self.connect(masked_frame(0x1, b("early")))
+        self.assertEqual(self.read_frame(stream), (0x1, b("early")))
+        stream.close()
+
+    def test_split_frames(self):
+        stream = self.connect()
+        data = (masked_frame(0x2, b("\x00\xff") * 100) +
+                masked_frame(0x2, b("x") * 70000))
+        for i in range(0, len(data), 1000):
+            stream.write(data[i:i + 1000])
+        self.assertEqual(self.read_frame(stream), (0x2, b("\x00\xff") * 100))
+        self.assertEqual(self.read_frame(stream), (0x2, b("x") * 70000))
+        stream.close()
+
+    def test_large_frame(self):
+        # not a multiple of 4 bytes, so the mask ends mid-word
+        payload = b("").join(struct.pack("!I", i) for i in range(300000))
+        payload += b("end")
+        stream = self.connect()
+        stream.write(masked_frame(0x2, payload))
+        self.assertEqual(self.read_frame(stream), (0x2, payload))
+        stream.close()
+
+    def test_fragmented_message_and_ping(self):
+        stream = self.connect()
+        stream.write(masked_frame(0x1, b("frag"), fin=False) +
+                     masked_frame(0x9, b("ping")) +
+                     masked_frame(0x0, b("men"), fin=False) +
+                     masked_frame(0x0, b("ted")))
+        self.assertEqual(self.read_frame(stream), (0xA, b("ping")))
+        self.assertEqual(self.read_frame(stream), (0x1, b("fragmented")))
+        stream.close()
+
+    def test_close(self):
+        stream = self.connect()
+        stream.write(masked_frame(0x8, b("")))
+        self.assertEqual(self.read_frame(stream), (0x8, b("")))
+        stream.read_until_close(self.stop)
+        self.assertEqual(self.wait(), b(""))
+
+    def test_release_request(self):
+        stream = self.connect(path="/release")
+        stream.write(masked_frame(0x1, b("hi")))
+        self.assertEqual(self.read_frame(stream),
+                         (0x1, b("/release None test")))
+        stream.close()
+
+    def test_refused_upgrade(self):
+        stream = IOStream(socket.socket(), io_loop=self.io_loop)
+        stream.connect(("localhost", self.get_http_port()), self.stop)
+        self.wait()
+        stream.write(b("GET /refuse HTTP/1.1\r\n"
+                       "Host: localhost\r\n"
+                       "Upgrade: websocket\r\n"
+                       "Connection: Upgrade\r\n"
+                       "Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n"
+                       "Sec-WebSocket-Version: 13\r\n\r\n"))
+        stream.read_until_close(self.stop)
+        self.assertTrue(self.wait().startswith(
+            b("HTTP/1.1 503 Service Unavailable")))
+
+    def test_unmasked_frame_aborts(self):
+        stream = self.connect()
+        stream.write(b("\x81\x02hi"))
+        stream.read_until_close(self.stop)
+        self.assertEqual(self.wait(), b(""))
+
+
+class WebSocketMessageBudgetTest(WebSocketTestMixin, AsyncHTTPTestCase,
+                                 LogTrapTestCase):
+    def get_app(self):
+        return Application([("/echo", CountingEchoHandler)],
+                           websocket_message_budget=4)
+
+    def setUp(self):
+        super(WebSocketMessageBudgetTest, self).setUp()
+        CountingEchoHandler.received = []
+
+    def test_all_frames_in_order(self):
+        stream = self.connect()
+        stream.write(b("").join(masked_frame(0x1, b("%d") % i)
+                                for i in range(50)))
+        for i in range(50):
+            self.assertEqual(self.read_frame(stream), (0x1, b("%d") % i))
+        stream.close()
+
+    def test_flood_does_not_hold_up_others(self):
+        flooder = self.connect()
+        other = self.connect()
+        flooder.write(b("").join(masked_frame(0x1, b("flood"))
+                                 for i in range(500)))
+        other.write(masked_frame(0x1, b("hello")))
+        self.assertEqual(self.read_frame(other), (0x1, b("hello")))
+        self.assertTrue(CountingEchoHandler.received.count(u"flood") < 500)
+        for i in range(500):
+            self.assertEqual(self.read_frame(flooder), (0x1, b("flood")))
+        flooder.close()
+        other.close()
+
+
+class WebSocketMaskTest(unittest.TestCase):
+    def test_mask_in_place(self):
+        for mask in (MASK, b("\x00\xff\x00\x01"), b("\x00") * 4):
+            for start in range(3):
+                for length in range(10):
+                    data = bytearray(b("ab") + b("0123456789")[:length] + b("yz"))
+                    expected = bytearray(data)
+                    for i in range(length):
+                        expected[start + i] ^= ord(mask[i % 4:i % 4 + 1])
+                    _websocket_mask(mask, data, start, length)
+                    self.assertEqual(data, expected)
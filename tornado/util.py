@@ -2,6 +2,7 @@
 
 from __future__ import absolute_import, division, with_statement
 
+import collections
 import zlib
 
 
@@ -47,6 +48,78 @@ class GzipDecompressor(object):
         return self.decompressobj.flush()
 
 
+class LRUCache(object):
+    """A bounded mapping that evicts the least recently used entries.
+
+    ``capacity`` bounds the total weight of the cached values, where the
+    weight of a value is ``weigh(value)``.  By default every value weighs
+    1, so ``capacity`` is simply the maximum number of entries.  Values
+    heavier than the whole capacity are not cached at all.
+
+    >>> cache = LRUCache(2)
+    >>> cache["a"] = 1; cache["b"] = 2
+    >>> cache.get("a")
+    1
+    >>> cache["c"] = 3
+    >>> "b" in cache, "a" in cache
+    (False, True)
+    """
+    def __init__(self, capacity, weigh=None):
+        self.capacity = capacity
+        self.weigh = weigh or (lambda value: 1)
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+
+    def get(self, key, default=None):
+        """Returns the value for ``key`` and marks it as recently used."""
+        try:
+            value = self._data.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self._data[key] = value
+        self.hits += 1
+        return value
+
+    def __setitem__(self, key, value):
+        self.pop(key)
+        weight = self.weigh(value)
+        if weight > self.capacity:
+            return
+        self._data[key] = value
+        self.weight += weight
+        while self.weight > self.capacity:
+            old_key, old_value = self._data.popitem(last=False)
+            self.weight -= self.weigh(old_value)
+
+    def pop(self, key, default=None):
+        """Removes ``key`` from the cache, returning its value."""
+        try:
+            value = self._data.pop(key)
+        except KeyError:
+            return default
+        self.weight -= self.weigh(value)
+        return value
+
+    def clear(self):
+        self._data.clear()
+        self.weight = 0
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """Returns a dict of cache statistics."""
+        return dict(entries=len(self._data), weight=self.weight,
+                    capacity=self.capacity, hits=self.hits,
+                    misses=self.misses)
+
+
 def import_object(name):
     """Imports an object by name.
 
@@ -65,6 +65,7 @@ import httplib
 import itertools
 import logging
 import mimetypes
+import mmap
 import os.path
 import re
 import stat
@@ -83,7 +84,7 @@ from tornado import locale
 from tornado import stack_context
 from tornado import template
 from tornado.escape import utf8, _unicode
-from tornado.util import b, bytes_type, import_object, ObjectDict, raise_exc_info
+from tornado.util import b, bytes_type, import_object, ObjectDict, raise_exc_info, LRUCache
 
 try:
     from io import BytesIO  # python 3
@@ -104,6 +105,11 @@ class RequestHandler(object):
     _template_loaders = {}  # {path: template.BaseLoader}
     _template_loader_lock = threading.Lock()
 
+    # Handlers that write to the stream directly (like WebSocketHandler)
+    # set this to False so Application skips building output transforms
+    # they would never use.
+    _uses_transforms = True
+
     def __init__(self, application, request, **kwargs):
         super(RequestHandler, self).__init__()
 
@@ -113,16 +119,7 @@ class RequestHandler(object):
         self._finished = False
         self._auto_finish = True
         self._transforms = None  # will be set in _execute
-        self.ui = ObjectDict((n, self._ui_method(m)) for n, m in
-                     application.ui_methods.iteritems())
-        # UIModules are available as both `modules` and `_modules` in the
-        # template namespace.  Historically only `modules` was available
-        # but could be clobbered by user additions to the namespace.
-        # The template {% module %} directive looks in `_modules` to avoid
-        # possible conflicts.
-        self.ui["_modules"] = ObjectDict((n, self._ui_module(n, m)) for n, m in
-                                 application.ui_modules.iteritems())
-        self.ui["modules"] = self.ui["_modules"]
+        self._ui = None  # built on first use, see ui
         self.clear()
         # Check since connection is not available in WSGI
         if getattr(self.request, "connection", None):
@@ -130,6 +127,27 @@ class RequestHandler(object):
                 self.on_connection_close)
         self.initialize(**kwargs)
 
+    @property
+    def ui(self):
+        """The ui_methods and ui_modules available to templates.
+
+        Built on first access, since many handlers (like WebSocket
+        handlers) never render a template.
+        """
+        if self._ui is None:
+            ui = ObjectDict((n, self._ui_method(m)) for n, m in
+                            self.application.ui_methods.iteritems())
+            # UIModules are available as both `modules` and `_modules` in
+            # the template namespace.  Historically only `modules` was
+            # available but could be clobbered by user additions to the
+            # namespace.  The template {% module %} directive looks in
+            # `_modules` to avoid possible conflicts.
+            ui["_modules"] = ObjectDict((n, self._ui_module(n, m)) for n, m in
+                                        self.application.ui_modules.iteritems())
+            ui["modules"] = ui["_modules"]
+            self._ui = ui
+        return self._ui
+
     def initialize(self):
         """Hook for subclass initialization.
 
@@ -1232,12 +1250,19 @@ class Application(object):
         if transforms is None:
             self.transforms = []
             if settings.get("gzip"):
-                self.transforms.append(GZipContentEncoding)
+                if "gzip_level" in settings or "gzip_min_length" in settings:
+                    self.transforms.append(functools.partial(
+                        GZipContentEncoding,
+                        compress_level=settings.get("gzip_level"),
+                        min_length=settings.get("gzip_min_length")))
+                else:
+                    self.transforms.append(GZipContentEncoding)
             self.transforms.append(ChunkedTransferEncoding)
         else:
             self.transforms = transforms
         self.handlers = []
         self.named_handlers = {}
+        self._route_tables = {}  # {id(host handlers): _RouteTable}
         self.default_host = default_host
         self.settings = settings
         self.ui_modules = {'linkify': _linkify,
@@ -1332,6 +1357,7 @@ class Application(object):
                         "Multiple handlers named %s; replacing previous value",
                         spec.name)
                 self.named_handlers[spec.name] = spec
+        self._route_tables = {}
 
     def add_transform(self, transform_class):
         """Adds the given OutputTransform to our transform list."""
@@ -1349,6 +1375,15 @@ class Application(object):
                     return handlers
         return None
 
+    def _get_route_table(self, handlers):
+        try:
+            return self._route_tables[id(handlers)]
+        except KeyError:
+            table = _RouteTable(handlers,
+                                self.settings.get("route_cache_size", 1000))
+            self._route_tables[id(handlers)] = table
+            return table
+
     def _load_ui_methods(self, methods):
         if type(methods) is types.ModuleType:
             self._load_ui_methods(dict((n, getattr(methods, n))
@@ -1380,41 +1415,19 @@ class Application(object):
 
     def __call__(self, request):
         """Called by HTTPServer to execute the request."""
-        transforms = [t(request) for t in self.transforms]
-        handler = None
-        args = []
+        args = ()
         kwargs = {}
         handlers = self._get_host_handlers(request)
         if not handlers:
             handler = RedirectHandler(
                 self, request, url="http://" + self.default_host + "/")
         else:
-            for spec in handlers:
-                match = spec.regex.match(request.path)
-                if match:
-                    handler = spec.handler_class(self, request, **spec.kwargs)
-                    if spec.regex.groups:
-                        # None-safe wrapper around url_unescape to handle
-                        # unmatched optional groups correctly
-                        def unquote(s):
-                            if s is None:
-                                return s
-                            return escape.url_unescape(s, encoding=None)
-                        # Pass matched groups to the handler.  Since
-                        # match.groups() includes both named and unnamed groups,
-                        # we want to use either groups or groupdict but not both.
-                        # Note that args are passed as bytes so the handler can
-                        # decide what encoding to use.
-
-                        if spec.regex.groupindex:
-                            kwargs = dict(
-                                (str(k), unquote(v))
-                                for (k, v) in match.groupdict().iteritems())
-                        else:
-                            args = [unquote(s) for s in match.groups()]
-                    break
-            if not handler:
+            route = self._get_route_table(handlers).find(request.path)
+            if route is None:
                 handler = ErrorHandler(self, request, status_code=404)
+            else:
+                spec, args, kwargs = route
+                handler = spec.handler_class(self, request, **spec.kwargs)
 
         # In debug mode, re-compile templates and reload static files on every
         # request so you don't need to restart to see changes
@@ -1424,6 +1437,10 @@ class Application(object):
                     loader.reset()
             StaticFileHandler.reset()
 
+        if handler._uses_transforms:
+            transforms = [t(request) for t in self.transforms]
+        else:
+            transforms = []
         handler._execute(transforms, *args, **kwargs)
         return handler
 
@@ -1458,8 +1475,14 @@ class Application(object):
         else:
             log_method = logging.error
         request_time = 1000.0 * handler.request.request_time()
-        log_method("%d %s %.2fms", handler.get_status(),
-                   handler._request_summary(), request_time)
+        compression_time = getattr(handler.request, "compression_time", None)
+        if compression_time is not None:
+            log_method("%d %s %.2fms (gzip %.2fms)", handler.get_status(),
+                       handler._request_summary(), request_time,
+                       1000.0 * compression_time)
+        else:
+            log_method("%d %s %.2fms", handler.get_status(),
+                       handler._request_summary(), request_time)
 
 
 class HTTPError(Exception):
@@ -1522,11 +1545,31 @@ class StaticFileHandler(RequestHandler):
     want browsers to cache a file indefinitely, send them to, e.g.,
     /static/images/myimage.png?v=xxx. Override ``get_cache_time`` method for
     more fine-grained cache control.
+
+    The contents of small files are kept in an in-memory LRU cache together
+    with their ETag, mime type and gzip-compressed body.  The compressed
+    body is read from a precompressed ``.gz`` file next to the original
+    (if it is at least as new), or compressed once when the ``gzip``
+    application setting is on.  Entries are revalidated against the
+    file's modification time and size on every request.  The cache size is
+    controlled by ``FILE_CACHE_SIZE`` (total bytes) and
+    ``FILE_CACHE_MAX_FILE_SIZE``; `cache_stats` reports hits and misses.
+
+    Larger files are streamed from disk without being read into memory,
+    with ``sendfile(2)`` where the platform and stream support it and in
+    ``STREAM_CHUNK_SIZE`` chunks of a memory-mapped file otherwise.
+    Single byte-range requests are supported for all files.
     """
     CACHE_MAX_AGE = 86400 * 365 * 10  # 10 years
+    FILE_CACHE_SIZE = 16 * 1024 * 1024
+    FILE_CACHE_MAX_FILE_SIZE = 1024 * 1024
+    STREAM_CHUNK_SIZE = 64 * 1024
 
+    _file_stream = None
+    _file_map = None
     _static_hashes = {}
-    _lock = threading.Lock()  # protects _static_hashes
+    _file_cache = None
+    _lock = threading.Lock()  # protects _static_hashes and _file_cache
 
     def initialize(self, path, default_filename=None):
         self.root = os.path.abspath(path) + os.path.sep
@@ -1536,6 +1579,16 @@ class StaticFileHandler(RequestHandler):
     def reset(cls):
         with cls._lock:
             cls._static_hashes = {}
+            cls._file_cache = None
+
+    @classmethod
+    def cache_stats(cls):
+        """Returns a dict of statistics about the file contents cache."""
+        with cls._lock:
+            if cls._file_cache is None:
+                return dict(entries=0, weight=0, capacity=cls.FILE_CACHE_SIZE,
+                            hits=0, misses=0)
+            return cls._file_cache.stats()
 
     def head(self, path):
         self.get(path, include_body=False)
@@ -1547,7 +1600,9 @@ class StaticFileHandler(RequestHandler):
         # it needs to be temporarily added back for requests to root/
         if not (abspath + os.path.sep).startswith(self.root):
             raise HTTPError(403, "%s is not in root static directory", path)
-        if os.path.isdir(abspath) and self.default_filename is not None:
+        stat_result = self._stat(abspath)
+        if (stat_result is not None and stat.S_ISDIR(stat_result.st_mode) and
+            self.default_filename is not None):
             # need to look at the request.path here for when path is empty
             # but there is some prefix to the path that was already
             # trimmed by the routing
@@ -1555,17 +1610,22 @@ class StaticFileHandler(RequestHandler):
                 self.redirect(self.request.path + "/")
                 return
             abspath = os.path.join(abspath, self.default_filename)
-        if not os.path.exists(abspath):
+            stat_result = self._stat(abspath)
+        if stat_result is None:
             raise HTTPError(404)
-        if not os.path.isfile(abspath):
+        if not stat.S_ISREG(stat_result.st_mode):
             raise HTTPError(403, "%s is not a file", path)
 
-        stat_result = os.stat(abspath)
         modified = datetime.datetime.fromtimestamp(stat_result[stat.ST_MTIME])
 
         self.set_header("Last-Modified", modified)
 
-        mime_type, encoding = mimetypes.guess_type(abspath)
+        gz_stat = self._get_precompressed_stat(abspath, stat_result)
+        entry = self._get_cached_file(abspath, stat_result, gz_stat)
+        if entry is not None:
+            mime_type = entry.mime_type
+        else:
+            mime_type, encoding = mimetypes.guess_type(abspath)
         if mime_type:
             self.set_header("Content-Type", mime_type)
 
@@ -1590,16 +1650,217 @@ class StaticFileHandler(RequestHandler):
                 self.set_status(304)
                 return
 
-        with open(abspath, "rb") as file:
-            data = file.read()
-            hasher = hashlib.sha1()
-            hasher.update(data)
-            self.set_header("Etag", '"%s"' % hasher.hexdigest())
+        size = stat_result.st_size
+        self.set_header("Accept-Ranges", "bytes")
+        byte_range = self._get_range(size)
+        if byte_range is False:
+            self.set_status(416)
+            self.set_header("Content-Range", "bytes */%d" % size)
+            return
+        if byte_range is not None:
+            start, end = byte_range
+            self.set_status(206)
+            self.set_header("Content-Range",
+                            "bytes %d-%d/%d" % (start, end - 1, size))
+        else:
+            start, end = 0, size
+
+        if entry is None:
+            # Too large to be cached: the ETag is derived from the file's
+            # metadata and the body is streamed from disk, so memory use
+            # per download stays constant.
+            etag = "%x-%x" % (int(stat_result.st_mtime), size)
+            if gz_stat is not None:
+                self.set_header("Vary", "Accept-Encoding")
+                # ranges always refer to the identity body
+                if byte_range is None and self._accepts_gzip():
+                    self.set_header("Content-Encoding", "gzip")
+                    abspath += ".gz"
+                    etag += "-gz"
+                    start, end = 0, gz_stat.st_size
+            self.set_header("Etag", '"%s"' % etag)
+            self.set_header("Content-Length", end - start)
             if include_body:
-                self.write(data)
+                self._stream_file(abspath, start, end - start)
             else:
                 assert self.request.method == "HEAD"
-                self.set_header("Content-Length", len(data))
+            return
+
+        data = entry.data
+        etag = entry.etag
+        if entry.gzipped is not None:
+            self.set_header("Vary", "Accept-Encoding")
+        if byte_range is not None:
+            data = data[start:end]
+        elif entry.gzipped is not None and self._accepts_gzip():
+            # the gzip body is a different representation, with its own ETag
+            self.set_header("Content-Encoding", "gzip")
+            data = entry.gzipped
+            etag = etag[:-1] + '-gz"'
+        self.set_header("Etag", etag)
+        if include_body:
+            self.write(data)
+        else:
+            assert self.request.method == "HEAD"
+            self.set_header("Content-Length", len(data))
+
+    def on_connection_close(self):
+        self._close_file_stream()
+
+    def _get_range(self, size):
+        """Parses the Range header of the request.
+
+        Returns a ``(start, end)`` tuple (``end`` exclusive), None if the
+        whole file should be sent, or False if the range can't be satisfied.
+        Only a single byte range is supported; requests for multiple ranges
+        get the whole file, as do invalid ranges such as ``bytes=5-3``
+        (RFC 7233 section 3.1).
+        """
+        range_header = self.request.headers.get("Range")
+        if not range_header or not range_header.startswith("bytes="):
+            return None
+        spec = range_header[len("bytes="):].strip()
+        if "," in spec or "-" not in spec:
+            return None
+        first, last = [part.strip() for part in spec.split("-", 1)]
+        try:
+            if not first:
+                # suffix range: the last N bytes
+                start, end = max(size - int(last), 0), size
+            else:
+                start = int(first)
+                if last and int(last) < start:
+                    return None
+                end = min(int(last) + 1, size) if last else size
+        except ValueError:
+            return None
+        if start >= size or start >= end:
+            return False
+        return start, end
+
+    def _stream_file(self, abspath, offset, count):
+        if self.application._wsgi:
+            with open(abspath, "rb") as file:
+                file.seek(offset)
+                self.write(file.read(count))
+            return
+        self._auto_finish = False
+        self._file_stream = open(abspath, "rb")
+        self.flush()
+        stream = self.request.connection.stream
+        if stream.supports_write_file():
+            stream.write_file(self._file_stream.fileno(), offset, count,
+                              callback=self._on_file_stream_done)
+            return
+        if count == 0:
+            self._on_file_stream_done()
+            return
+        # Map the file and send it a chunk at a time, waiting for each
+        # chunk to be written before slicing the next one.
+        self._file_map = mmap.mmap(self._file_stream.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+        self._file_position = offset
+        self._file_end = offset + count
+        self._send_file_chunk()
+
+    def _send_file_chunk(self):
+        if self._file_map is None:
+            return
+        chunk_end = min(self._file_position + self.STREAM_CHUNK_SIZE,
+                        self._file_end)
+        self.write(self._file_map[self._file_position:chunk_end])
+        self._file_position = chunk_end
+        if chunk_end >= self._file_end:
+            self._on_file_stream_done()
+        else:
+            self.flush(callback=self._send_file_chunk)
+
+    def _on_file_stream_done(self):
+        self._close_file_stream()
+        self.finish()
+
+    def _close_file_stream(self):
+        if self._file_map is not None:
+            self._file_map.close()
+            self._file_map = None
+        if self._file_stream is not None:
+            self._file_stream.close()
+            self._file_stream = None
+
+    def _stat(self, abspath):
+        try:
+            return os.stat(abspath)
+        except OSError:
+            return None
+
+    def _get_precompressed_stat(self, abspath, stat_result):
+        """Returns the stat of an up to date ``.gz`` sibling of ``abspath``.
+
+        Returns None if there is no such file or it is older than the
+        original.
+        """
+        gz_stat = self._stat(abspath + ".gz")
+        if (gz_stat is None or not stat.S_ISREG(gz_stat.st_mode) or
+            gz_stat.st_mtime < stat_result.st_mtime):
+            return None
+        return gz_stat
+
+    def _accepts_gzip(self):
+        return (self.request.supports_http_1_1() and
+                "gzip" in self.request.headers.get("Accept-Encoding", ""))
+
+    @staticmethod
+    def _compute_file_etag(data):
+        hasher = hashlib.sha1()
+        hasher.update(data)
+        return '"%s"' % hasher.hexdigest()
+
+    def _get_cached_file(self, abspath, stat_result, gz_stat=None):
+        """Returns the cache entry for ``abspath``, loading it if needed.
+
+        The gzipped body is taken from the precompressed sibling file
+        described by ``gz_stat`` if there is one.  Returns None for files
+        too large to be cached.
+        """
+        cls = StaticFileHandler
+        gzip_enabled = bool(self.application.settings.get("gzip"))
+        version = (stat_result.st_mtime, stat_result.st_size, gzip_enabled,
+                   gz_stat and (gz_stat.st_mtime, gz_stat.st_size))
+        with cls._lock:
+            if cls._file_cache is None:
+                cls._file_cache = LRUCache(
+                    self.FILE_CACHE_SIZE,
+                    lambda entry: len(entry.data) + len(entry.gzipped or b("")))
+            entry = cls._file_cache.get(abspath)
+        if entry is not None and entry.version == version:
+            return entry
+        if stat_result.st_size > self.FILE_CACHE_MAX_FILE_SIZE:
+            return None
+
+        with open(abspath, "rb") as file:
+            data = file.read()
+        mime_type, encoding = mimetypes.guess_type(abspath)
+        gzipped = None
+        if gz_stat is not None:
+            with open(abspath + ".gz", "rb") as file:
+                gzipped = file.read()
+        elif (gzip_enabled and
+            mime_type in GZipContentEncoding.CONTENT_TYPES and
+            len(data) >= GZipContentEncoding.MIN_LENGTH):
+            gzip_value = BytesIO()
+            gzip_file = gzip.GzipFile(
+                mode="w", fileobj=gzip_value, mtime=stat_result.st_mtime,
+                compresslevel=self.application.settings.get(
+                    "gzip_level", GZipContentEncoding.COMPRESS_LEVEL))
+            gzip_file.write(data)
+            gzip_file.close()
+            gzipped = gzip_value.getvalue()
+        entry = ObjectDict(version=version, data=data, mime_type=mime_type,
+                           etag=self._compute_file_etag(data),
+                           gzipped=gzipped)
+        with cls._lock:
+            cls._file_cache[abspath] = entry
+        return entry
 
     def set_extra_headers(self, path):
         """For subclass to add extra headers to the response"""
@@ -1717,6 +1978,11 @@ class OutputTransform(object):
 class GZipContentEncoding(OutputTransform):
     """Applies the gzip content encoding to the response.
 
+    The ``gzip_level`` and ``gzip_min_length`` application settings
+    override `COMPRESS_LEVEL` and `MIN_LENGTH`.  The time spent
+    compressing is stored in ``request.compression_time`` (in seconds)
+    and included in the request log.
+
     See http://www.w3.org/Protocols/rfc2616/rfc2616-sec14.html#sec14.11
     """
     CONTENT_TYPES = set([
@@ -1724,8 +1990,16 @@ class GZipContentEncoding(OutputTransform):
         "application/x-javascript", "application/xml", "application/atom+xml",
         "text/javascript", "application/json", "application/xhtml+xml"])
     MIN_LENGTH = 5
-
-    def __init__(self, request):
+    COMPRESS_LEVEL = 9
+
+    def __init__(self, request, compress_level=None, min_length=None):
+        self._request = request
+        if compress_level is None:
+            compress_level = self.COMPRESS_LEVEL
+        if min_length is None:
+            min_length = self.MIN_LENGTH
+        self._compress_level = compress_level
+        self._min_length = min_length
         self._gzipping = request.supports_http_1_1() and \
             "gzip" in request.headers.get("Accept-Encoding", "")
 
@@ -1733,13 +2007,17 @@ class GZipContentEncoding(OutputTransform):
         if self._gzipping:
             ctype = _unicode(headers.get("Content-Type", "")).split(";")[0]
             self._gzipping = (ctype in self.CONTENT_TYPES) and \
-                (not finishing or len(chunk) >= self.MIN_LENGTH) and \
+                (not finishing or len(chunk) >= self._min_length) and \
                 (finishing or "Content-Length" not in headers) and \
-                ("Content-Encoding" not in headers)
+                ("Content-Encoding" not in headers) and \
+                (status_code != 206 and "Content-Range" not in headers)
         if self._gzipping:
             headers["Content-Encoding"] = "gzip"
+            self._request.compression_time = 0.0
             self._gzip_value = BytesIO()
-            self._gzip_file = gzip.GzipFile(mode="w", fileobj=self._gzip_value)
+            self._gzip_file = gzip.GzipFile(
+                mode="w", fileobj=self._gzip_value,
+                compresslevel=self._compress_level)
             chunk = self.transform_chunk(chunk, finishing)
             if "Content-Length" in headers:
                 headers["Content-Length"] = str(len(chunk))
@@ -1747,6 +2025,7 @@ class GZipContentEncoding(OutputTransform):
 
     def transform_chunk(self, chunk, finishing):
         if self._gzipping:
+            start_time = time.time()
             self._gzip_file.write(chunk)
             if finishing:
                 self._gzip_file.close()
@@ -1755,6 +2034,7 @@ class GZipContentEncoding(OutputTransform):
             chunk = self._gzip_value.getvalue()
             self._gzip_value.truncate(0)
             self._gzip_value.seek(0)
+            self._request.compression_time += time.time() - start_time
         return chunk
 
 
@@ -1964,6 +2244,7 @@ class URLSpec(object):
         self.kwargs = kwargs or {}
         self.name = name
         self._path, self._group_count = self._find_groups()
+        self._literal = self._find_literal()
 
     def _find_groups(self):
         """Returns a tuple (reverse string, group count) for a url.
@@ -1993,6 +2274,38 @@ class URLSpec(object):
 
         return (''.join(pieces), self.regex.groups)
 
+    def _find_literal(self):
+        """Returns the literal path matched by this url, or None.
+
+        For example: Given the url pattern /chat, this method would return
+        '/chat', but it would return None for /static/(.*).
+        """
+        pattern = self.regex.pattern
+        if pattern.startswith('^'):
+            pattern = pattern[1:]
+        if not pattern.endswith('$') or pattern.endswith('\\$'):
+            return None
+        pattern = pattern[:-1]
+
+        chars = []
+        i = 0
+        while i < len(pattern):
+            c = pattern[i]
+            if c == '\\':
+                if i + 1 == len(pattern) or pattern[i + 1].isalnum():
+                    return None
+                c = pattern[i + 1]
+                i += 1
+            elif c in '.^$*+?{}[]|()':
+                return None
+            chars.append(c)
+            i += 1
+
+        literal = ''.join(chars)
+        if not self.regex.match(literal):
+            return None
+        return literal
+
     def reverse(self, *args):
         assert self._path is not None, \
             "Cannot reverse url regex " + self.regex.pattern
@@ -2010,6 +2323,66 @@ class URLSpec(object):
 url = URLSpec
 
 
+def _unquote_group(s):
+    # None-safe wrapper around url_unescape to handle unmatched optional
+    # groups correctly.  Args are passed as bytes so the handler can
+    # decide what encoding to use.
+    if s is None:
+        return s
+    return escape.url_unescape(s, encoding=None)
+
+
+class _RouteTable(object):
+    """Maps request paths to handlers for one host's list of URLSpecs.
+
+    Paths that are exactly a literal url pattern (like /chat) are resolved
+    up front, and every other path is matched against the URLSpecs in order
+    once and then remembered in an LRU cache of ``cache_size`` paths.  A
+    route is a tuple (spec, args, kwargs), or None if no URLSpec matches.
+    """
+    _MISSING = object()
+
+    def __init__(self, specs, cache_size):
+        self.specs = specs
+        self.literals = {}
+        self.cache = LRUCache(cache_size)
+        self._lock = threading.Lock()
+        for spec in specs:
+            path = spec._literal
+            if path is not None and path not in self.literals:
+                # An earlier spec matching the same path still wins
+                self.literals[path] = self.match(path)
+
+    def find(self, path):
+        route = self.literals.get(path)
+        if route is not None:
+            return route
+        with self._lock:
+            route = self.cache.get(path, self._MISSING)
+        if route is self._MISSING:
+            route = self.match(path)
+            with self._lock:
+                self.cache[path] = route
+        return route
+
+    def match(self, path):
+        for spec in self.specs:
+            match = spec.regex.match(path)
+            if match:
+                # Since match.groups() includes both named and unnamed
+                # groups, we want to use either groups or groupdict but
+                # not both.
+                if not spec.regex.groups:
+                    return spec, (), {}
+                if spec.regex.groupindex:
+                    return spec, (), dict(
+                        (str(k), _unquote_group(v))
+                        for (k, v) in match.groupdict().iteritems())
+                return spec, tuple(_unquote_group(s)
+                                   for s in match.groups()), {}
+        return None
+
+
 def _time_independent_equals(a, b):
     if len(a) != len(b):
         return False
@@ -20,7 +20,6 @@ communication between the browser and server.
 from __future__ import absolute_import, division, with_statement
 # Author: Jacob Kristhammar, 2010
 
-import array
 import functools
 import hashlib
 import logging
@@ -76,6 +75,8 @@ class WebSocketHandler(tornado.web.RequestHandler):
 
     This script pops up an alert box that says "You said: Hello, world".
     """
+    _uses_transforms = False
+
     def __init__(self, application, request, **kwargs):
         tornado.web.RequestHandler.__init__(self, application, request,
                                             **kwargs)
@@ -115,6 +116,12 @@ class WebSocketHandler(tornado.web.RequestHandler):
             self.stream.close()
             return
 
+        if not self.accept_upgrade():
+            self.stream.write(tornado.escape.utf8(
+                "HTTP/1.1 503 Service Unavailable\r\n\r\n"))
+            self.stream.close()
+            return
+
         # The difference between version 8 and 13 is that in 8 the
         # client sends a "Sec-Websocket-Origin" header and in 13 it's
         # simply "Origin".
@@ -183,6 +190,35 @@ class WebSocketHandler(tornado.web.RequestHandler):
         """
         self.ws_connection.close()
 
+    def release_request(self):
+        """Frees the HTTP state this handler no longer needs.
+
+        Once the connection is open only frames are exchanged, but the
+        request headers, arguments, body and the unused response headers
+        and buffers stay referenced for the lifetime of the connection.
+        Call this (e.g. at the end of `open`) when nothing will look at
+        them again; afterwards ``self.request.headers``,
+        ``arguments``, ``files``, ``body`` and ``connection`` are None.
+        The request's method, uri, path, query, host, protocol and
+        remote_ip remain available.
+        """
+        request = self.request
+        request.headers = None
+        request.arguments = request.files = None
+        request.body = None
+        request.connection = None
+        self._headers = self._list_headers = self._write_buffer = None
+        self.open_args = self.open_kwargs = None
+
+    def accept_upgrade(self):
+        """Override to turn WebSocket connections away.
+
+        Called before the handshake; returning False answers the
+        upgrade request with ``503 Service Unavailable`` and closes the
+        connection, e.g. while the server is overloaded.
+        """
+        return True
+
     def allow_draft76(self):
         """Override to enable support for the older "draft76" protocol.
 
@@ -237,6 +273,10 @@ for method in ["write", "redirect", "set_header", "send_error", "set_cookie",
 class WebSocketProtocol(object):
     """Base class for WebSocket protocol versions.
     """
+    # There is one of these for every open connection
+    __slots__ = ["handler", "request", "stream", "client_terminated",
+                 "server_terminated"]
+
     def __init__(self, handler):
         self.handler = handler
         self.request = handler.request
@@ -280,6 +320,8 @@ class WebSocketProtocol76(WebSocketProtocol):
     specified in
     http://tools.ietf.org/html/draft-hixie-thewebsocketprotocol-76
     """
+    __slots__ = ["challenge", "_waiting"]
+
     def __init__(self, handler):
         WebSocketProtocol.__init__(self, handler)
         self.challenge = None
@@ -441,13 +483,22 @@ class WebSocketProtocol13(WebSocketProtocol):
 
     This class supports versions 7 and 8 of the protocol in addition to the
     final version 13.
+
+    At most ``websocket_message_budget`` frames (application setting,
+    default 32, 0 for no limit) are handled per IOLoop iteration.  The
+    rest wait in the buffer while the stream stops reading, and the
+    connection goes to the back of the IOLoop's callback queue, so a
+    client that floods the server does not hold up the others.
     """
+    __slots__ = ["_frame_budget", "_frames_paused", "_frame_buffer",
+                 "_fragmented_message_buffer", "_fragmented_message_opcode",
+                 "_waiting"]
+
     def __init__(self, handler):
         WebSocketProtocol.__init__(self, handler)
-        self._final_frame = False
-        self._frame_opcode = None
-        self._frame_mask = None
-        self._frame_length = None
+        self._frame_budget = handler.settings.get("websocket_message_budget", 32)
+        self._frames_paused = False
+        self._frame_buffer = None
         self._fragmented_message_buffer = None
         self._fragmented_message_opcode = None
         self._waiting = None
@@ -467,15 +518,15 @@ class WebSocketProtocol13(WebSocketProtocol):
         If a header is missing or have an incorrect value ValueError will be
         raised
         """
-        fields = ("Host", "Sec-Websocket-Key", "Sec-Websocket-Version")
-        if not all(map(lambda f: self.request.headers.get(f), fields)):
-            raise ValueError("Missing/Invalid WebSocket headers")
+        headers = self.request.headers
+        for field in ("Host", "Sec-Websocket-Key", "Sec-Websocket-Version"):
+            if not headers.get(field):
+                raise ValueError("Missing/Invalid WebSocket headers")
 
     def _challenge_response(self):
-        sha1 = hashlib.sha1()
-        sha1.update(tornado.escape.utf8(
-                self.request.headers.get("Sec-Websocket-Key")))
-        sha1.update(b("258EAFA5-E914-47DA-95CA-C5AB0DC85B11"))  # Magic value
+        sha1 = hashlib.sha1(tornado.escape.utf8(
+                self.request.headers.get("Sec-Websocket-Key")) +
+                b("258EAFA5-E914-47DA-95CA-C5AB0DC85B11"))  # Magic value
         return tornado.escape.native_str(base64.b64encode(sha1.digest()))
 
     def _accept_connection(self):
@@ -497,23 +548,23 @@ class WebSocketProtocol13(WebSocketProtocol):
             "\r\n" % (self._challenge_response(), subprotocol_header)))
 
         self.async_callback(self.handler.open)(*self.handler.open_args, **self.handler.open_kwargs)
-        self._receive_frame()
+        self._receive_frames()
 
     def _write_frame(self, fin, opcode, data):
         if fin:
             finbit = 0x80
         else:
             finbit = 0
-        frame = struct.pack("B", finbit | opcode)
         l = len(data)
         if l < 126:
-            frame += struct.pack("B", l)
+            header = struct.pack("BB", finbit | opcode, l)
         elif l <= 0xFFFF:
-            frame += struct.pack("!BH", 126, l)
+            header = struct.pack("!BBH", finbit | opcode, 126, l)
         else:
-            frame += struct.pack("!BQ", 127, l)
-        frame += data
-        self.stream.write(frame)
+            header = struct.pack("!BBQ", finbit | opcode, 127, l)
+        # The payload is queued as is, so a message broadcast to many
+        # connections is not copied into each frame
+        self.stream.writelines((header, data))
 
     def write_message(self, message, binary=False):
         """Sends the given message to the client of this Web Socket."""
@@ -525,88 +576,119 @@ class WebSocketProtocol13(WebSocketProtocol):
         assert isinstance(message, bytes_type)
         self._write_frame(True, opcode, message)
 
-    def _receive_frame(self):
-        self.stream.read_bytes(2, self._on_frame_start)
-
-    def _on_frame_start(self, data):
-        header, payloadlen = struct.unpack("BB", data)
-        self._final_frame = header & 0x80
-        reserved_bits = header & 0x70
-        self._frame_opcode = header & 0xf
-        self._frame_opcode_is_control = self._frame_opcode & 0x8
-        if reserved_bits:
-            # client is using as-yet-undefined extensions; abort
-            self._abort()
-            return
-        if not (payloadlen & 0x80):
-            # Unmasked frame -> abort connection
-            self._abort()
-            return
-        payloadlen = payloadlen & 0x7f
-        if self._frame_opcode_is_control and payloadlen >= 126:
-            # control frames must have payload < 126
-            self._abort()
-            return
-        if payloadlen < 126:
-            self._frame_length = payloadlen
-            self.stream.read_bytes(4, self._on_masking_key)
-        elif payloadlen == 126:
-            self.stream.read_bytes(2, self._on_frame_length_16)
-        elif payloadlen == 127:
-            self.stream.read_bytes(8, self._on_frame_length_64)
-
-    def _on_frame_length_16(self, data):
-        self._frame_length = struct.unpack("!H", data)[0]
-        self.stream.read_bytes(4, self._on_masking_key)
-
-    def _on_frame_length_64(self, data):
-        self._frame_length = struct.unpack("!Q", data)[0]
-        self.stream.read_bytes(4, self._on_masking_key)
-
-    def _on_masking_key(self, data):
-        self._frame_mask = array.array("B", data)
-        self.stream.read_bytes(self._frame_length, self._on_frame_data)
+    def _receive_frames(self):
+        # Everything the client sends is frames from here on.  Each chunk
+        # read from the socket is parsed in one pass in _on_frame_data,
+        # however many frames it holds.
+        self._frame_buffer = bytearray()
+        self.stream.read_until_close(self._on_frame_data,
+                                     streaming_callback=self._on_frame_data,
+                                     copy=False)
 
     def _on_frame_data(self, data):
-        unmasked = array.array("B", data)
-        for i in xrange(len(data)):
-            unmasked[i] = unmasked[i] ^ self._frame_mask[i % 4]
+        if self.client_terminated or not data:
+            return
+        if self._frame_buffer:
+            self._frame_buffer += data
+        else:
+            self._frame_buffer = data
+        if not self._frames_paused:
+            self._process_frames()
 
-        if self._frame_opcode_is_control:
+    def _resume_frames(self):
+        self._frames_paused = False
+        if self.client_terminated or self.stream.closed():
+            return
+        self._process_frames()
+        if not self._frames_paused:
+            self.stream.resume_reading()
+
+    def _process_frames(self):
+        buf = self._frame_buffer
+        budget = self._frame_budget
+        frames = 0
+        pos = 0
+        end = len(buf)
+        while end - pos >= 2 and not self.client_terminated:
+            if budget and frames >= budget:
+                # let the other connections have their turn first
+                self._frames_paused = True
+                self.stream.pause_reading()
+                self.stream.io_loop.add_callback(self._resume_frames)
+                break
+            header = buf[pos]
+            payloadlen = buf[pos + 1]
+            if header & 0x70:
+                # client is using as-yet-undefined extensions; abort
+                self._abort()
+                return
+            if not (payloadlen & 0x80):
+                # Unmasked frame -> abort connection
+                self._abort()
+                return
+            opcode = header & 0xf
+            payloadlen = payloadlen & 0x7f
+            if opcode & 0x8 and payloadlen >= 126:
+                # control frames must have payload < 126
+                self._abort()
+                return
+            mask_start = pos + 2
+            if payloadlen == 126:
+                if end - pos < 4:
+                    break
+                payloadlen = struct.unpack_from("!H", buf, mask_start)[0]
+                mask_start += 2
+            elif payloadlen == 127:
+                if end - pos < 10:
+                    break
+                payloadlen = struct.unpack_from("!Q", buf, mask_start)[0]
+                mask_start += 8
+            data_start = mask_start + 4
+            if data_start + payloadlen > end:
+                if payloadlen > self.stream.max_buffer_size:
+                    logging.error("WebSocket frame too large")
+                    self._abort()
+                    return
+                break
+            _websocket_mask(buf[mask_start:data_start], buf, data_start,
+                            payloadlen)
+            payload = memoryview(buf)[data_start:data_start + payloadlen].tobytes()
+            pos = data_start + payloadlen
+            frames += 1
+            self._on_frame(header & 0x80, opcode, payload)
+        if pos:
+            del buf[:pos]
+
+    def _on_frame(self, final_frame, opcode, data):
+        if opcode & 0x8:
             # control frames may be interleaved with a series of fragmented
             # data frames, so control frames must not interact with
             # self._fragmented_*
-            if not self._final_frame:
+            if not final_frame:
                 # control frames must not be fragmented
                 self._abort()
                 return
-            opcode = self._frame_opcode
-        elif self._frame_opcode == 0:  # continuation frame
+        elif opcode == 0:  # continuation frame
             if self._fragmented_message_buffer is None:
                 # nothing to continue
                 self._abort()
                 return
-            self._fragmented_message_buffer += unmasked
-            if self._final_frame:
+            self._fragmented_message_buffer.append(data)
+            if final_frame:
                 opcode = self._fragmented_message_opcode
-                unmasked = self._fragmented_message_buffer
+                data = b("").join(self._fragmented_message_buffer)
                 self._fragmented_message_buffer = None
         else:  # start of new data message
             if self._fragmented_message_buffer is not None:
                 # can't start new message until the old one is finished
                 self._abort()
                 return
-            if self._final_frame:
-                opcode = self._frame_opcode
-            else:
-                self._fragmented_message_opcode = self._frame_opcode
-                self._fragmented_message_buffer = unmasked
-
-        if self._final_frame:
-            self._handle_message(opcode, unmasked.tostring())
+            if not final_frame:
+                self._fragmented_message_opcode = opcode
+                self._fragmented_message_buffer = [data]
 
-        if not self.client_terminated:
-            self._receive_frame()
+        if final_frame:
+            self._handle_message(opcode, data)
 
     def _handle_message(self, opcode, data):
         if self.client_terminated:
@@ -652,3 +734,35 @@ class WebSocketProtocol13(WebSocketProtocol):
             # otherwise just close the connection.
             self._waiting = self.stream.io_loop.add_timeout(
                 time.time() + 5, self._abort)
+
+
+# translate() tables XORing every byte with one key byte, built on demand
+_xor_tables = {}
+
+
+def _xor_table(key):
+    try:
+        return _xor_tables[key]
+    except KeyError:
+        table = _xor_tables[key] = bytes(bytearray(i ^ key for i in xrange(256)))
+        return table
+
+
+def _websocket_mask(mask, data, start, length):
+    """Unmasks ``length`` bytes of the bytearray ``data`` from ``start``
+    in place with the 4 byte ``mask``.
+
+    Every fourth byte is XORed with the same key byte, so each of the
+    four strides is run through ``translate`` with that byte's table.
+    This works at C speed and only copies a quarter of the payload at a
+    time.
+
+    >>> data = bytearray(b("xxabcde"))
+    >>> _websocket_mask(b("\\x01\\x02\\x03\\x04"), data, 2, 5)
+    >>> bytes(data)
+    'xx````d'
+    """
+    end = start + length
+    for i, key in enumerate(bytearray(mask)):
+        if key:
+            data[start + i:end:4] = data[start + i:end:4].translate(_xor_table(key))
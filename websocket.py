@@ -150,8 +150,11 @@ def create_connection(url, timeout=None, **options):
     timeout: socket timeout time. This value is integer.
              if you set None for this value, it means "use default_timeout value"
 
-    options: current support option is only "header".
+    options: "header" and "protocol" are supported.
              if you set header as dict value, the custom HTTP headers are added.
+             protocol is a subprotocol name or a list of names in order of
+             preference; the one chosen by the server is stored in
+             the subprotocol attribute of the returned object.
     """
     websock = WebSocket()
     websock.settimeout(timeout != None and timeout or default_timeout)
@@ -331,6 +334,7 @@ class WebSocket(object):
         Initalize WebSocket object.
         """
         self.connected = False
+        self.subprotocol = None
         self.io_sock = self.sock = socket.socket()
         self.get_mask_key = get_mask_key
         
@@ -402,7 +406,11 @@ class WebSocket(object):
         key = _create_sec_websocket_key()
         headers.append("Sec-WebSocket-Key: %s" % key)
         #headers.append("Sec-WebSocket-Protocol: chat, superchat")
-        headers.append("Sec-WebSocket-Protocol: " + options['protocol'])
+        protocol = options.get("protocol")
+        if protocol:
+            if not isinstance(protocol, basestring):
+                protocol = ", ".join(protocol)
+            headers.append("Sec-WebSocket-Protocol: " + protocol)
         headers.append("Sec-WebSocket-Version: %s" % VERSION)
         if "header" in options:
             headers.extend(options["header"])
@@ -427,6 +435,7 @@ class WebSocket(object):
             self.close()
             raise WebSocketException("Invalid WebSocket Header")
 
+        self.subprotocol = resp_headers.get("sec-websocket-protocol", None)
         self.connected = True
     
     def _validate_header(self, headers, key):
@@ -494,6 +503,14 @@ class WebSocket(object):
         if traceEnabled:
             logger.debug("send: " + repr(data))
 
+    def send_binary(self, payload):
+        """
+        Send the data as binary frame.
+
+        payload: string(byte array) value.
+        """
+        self.send(payload, ABNF.OPCODE_BINARY)
+
     def ping(self, payload = ""):
         """
         send ping data.
@@ -687,11 +704,12 @@ class WebSocketApp(object):
         self.get_mask_key = get_mask_key
         self.sock = None
 
-    def send(self, data):
+    def send(self, data, opcode = ABNF.OPCODE_TEXT):
         """
-        send message. data must be utf-8 string or unicode.
+        send message. data must be utf-8 string or unicode,
+        or any byte string if opcode is ABNF.OPCODE_BINARY.
         """
-        self.sock.send(data)
+        self.sock.send(data, opcode)
 
     def close(self):
         """